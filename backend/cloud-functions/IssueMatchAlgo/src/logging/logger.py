@@ -1,27 +1,230 @@
+import asyncio
+import atexit
+import functools
 import os
+import threading
+import time
+from collections import Counter, deque
 from dotenv import load_dotenv
-from slack import WebClient
+
+QUEUE_SIZE = 1000
+BATCH_INTERVAL_SECONDS = 1.0
+# Slack truncates long messages, bigger batches are split over several posts
+MAX_POST_CHARS = 3500
+# Messages per minute per level, SEVERE is never rate limited or dropped
+RATE_LIMITS = {"INFO": 60, "WARNING": 60}
+# Under sustained overflow the "Dropped N" summary is posted at most this often
+DROP_SUMMARY_INTERVAL_SECONDS = 60.0
+# How long a request waits at its end for its SEVERE messages to reach Slack, Cloud Functions
+# throttles the CPU of background threads once the response is sent
+SEVERE_FLUSH_TIMEOUT_SECONDS = 2.0
+
+
+class SlackShipper:
+    def __init__(self, post, queue_size=QUEUE_SIZE, batch_interval=BATCH_INTERVAL_SECONDS, rate_limits=RATE_LIMITS):
+        """
+        Ships log messages to Slack from a background thread so logging never waits on Slack.
+
+        Messages that arrive within batch_interval are coalesced into one post. When a level goes
+        over its rate limit or the queue is full the message is dropped and counted, and a post at
+        most every DROP_SUMMARY_INTERVAL_SECONDS says how many were dropped. SEVERE messages skip
+        both limits, flush_severe waits for them at the end of a request.
+
+        Args:
+        post (callable): Sends one text message to Slack.
+        queue_size (int): Max number of pending non SEVERE messages.
+        batch_interval (float): Seconds to wait for more messages before posting.
+        rate_limits (dict): Level -> max messages per minute.
+        """
+        self.post = post
+        self.queue_size = queue_size
+        self.batch_interval = batch_interval
+        self.rate_limits = rate_limits
+        self._pending = deque()
+        self._dropped = Counter()
+        self._last_summary = time.monotonic()
+        self._severe_pending = 0  # SEVERE messages queued or in the batch being sent
+        self._windows = {}  # level -> (minute the window started, messages in it)
+        self._sending = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._wake = threading.Event()  # Cuts the batch wait short on flush and close
+        self._thread = None
+
+    def _allow(self, level):
+        limit = self.rate_limits.get(level)
+        if limit is None:
+            return True
+        minute = int(time.monotonic() // 60)
+        start, count = self._windows.get(level, (minute, 0))
+        if start != minute:
+            start, count = minute, 0
+        if count >= limit:
+            return False
+        self._windows[level] = (start, count + 1)
+        return True
+
+    def enqueue(self, message, level="INFO"):
+        """
+        Queues a formatted message and returns right away.
+        """
+        with self._condition:
+            if self._closed:
+                return False
+            if level != "SEVERE" and (len(self._pending) >= self.queue_size or not self._allow(level)):
+                self._dropped[level] += 1
+                if self._thread is not None:
+                    self._condition.notify()
+                return False
+            self._pending.append(message)
+            if level == "SEVERE":
+                self._severe_pending += 1
+            if self._thread is None:
+                # Started on first use so importing the logger stays cheap
+                self._thread = threading.Thread(target=self._run, name="slack-shipper", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return True
+
+    def _summary_wait(self):
+        """
+        Seconds until the dropped messages are due to be reported, None if there are none.
+        """
+        if not self._dropped:
+            return None
+        if self._closed:
+            return 0
+        return max(self._last_summary + DROP_SUMMARY_INTERVAL_SECONDS - time.monotonic(), 0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    summary_wait = self._summary_wait()
+                    if summary_wait == 0:
+                        break
+                    self._condition.wait(summary_wait)
+                if self._closed and not self._pending and not self._dropped:
+                    return
+            self._wake.wait(self.batch_interval)
+            self._ship()
+
+    def _take_batch(self):
+        self._wake.clear()
+        with self._condition:
+            lines = list(self._pending)
+            self._pending.clear()
+            if self._summary_wait() == 0:
+                for level, count in self._dropped.items():
+                    lines.append(f"[WARNING] Dropped {count} {level} messages, rate limit or full queue")
+                self._dropped.clear()
+                self._last_summary = time.monotonic()
+            self._sending = bool(lines)
+            return lines, self._severe_pending
+
+    def _ship(self):
+        lines, severe = self._take_batch()
+        posts = []
+        for line in lines:
+            if posts and len(posts[-1]) + len(line) + 1 <= MAX_POST_CHARS:
+                posts[-1] += "\n" + line
+            else:
+                posts.append(line)
+        for text in posts:
+            try:
+                self.post(text)
+            except Exception as e:
+                # Keep the messages in the function logs when Slack is down
+                print(f"[INFO] Failed to send slack message: {e}\n{text}")
+        with self._condition:
+            self._sending = False
+            self._severe_pending -= severe
+            self._condition.notify_all()
+
+    def flush(self, timeout=5.0):
+        """
+        Posts everything queued so far, waits at most timeout seconds. Dropped message counts are
+        left for their next summary.
+
+        Returns:
+        bool: True when the queue was drained in time.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if self._thread is None:
+                return True
+            while self._pending or self._sending:
+                self._wake.set()
+                self._condition.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(min(remaining, 0.05))
+            return True
+
+    def flush_severe(self, timeout=SEVERE_FLUSH_TIMEOUT_SECONDS):
+        """
+        flush, only when a SEVERE message has not been posted yet.
+        """
+        with self._condition:
+            if not self._severe_pending:
+                return True
+        return self.flush(timeout)
+
+    def close(self, timeout=5.0):
+        """
+        Flushes and stops the worker, registered with atexit by the Logger.
+        """
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
 
 
 class Logger:
     def __init__(self):
         # Load environment variables from .env file
         load_dotenv()
-        self.slack_client = WebClient(os.getenv('SLACK_BOT_TOKEN'))
+        self._slack_client = None
+        self.shipper = SlackShipper(self._post_to_slack)
+        atexit.register(self.shipper.close)
+
+    @property
+    def slack_client(self):
+        # Built by the shipper thread on the first post, so importing the logger stays cheap
+        if self._slack_client is None:
+            from slack import WebClient
+            self._slack_client = WebClient(os.getenv('SLACK_BOT_TOKEN'))
+        return self._slack_client
+
+    def _post_to_slack(self, text):
+        self.slack_client.chat_postMessage(
+            channel='monitor-cloud',
+            text=text
+        )
 
     def notify_slack(self, message, level="INFO"):
         """
-        Sends a message to Slack with a specific severity level.
+        Queues a message for Slack with a specific severity level, it is posted in the background.
         """
-        try:
-            formatted_message = f"[{level}] {message}"
-            self.debug_print(f"Sending Slack Message: {formatted_message}")
-            self.slack_client.chat_postMessage(
-                channel='monitor-cloud',
-                text=formatted_message
-            )
-        except Exception as e:
-            self.debug_print(f"Failed to send slack message: {e}")
+        formatted_message = f"[{level}] {message}"
+        self.debug_print(f"Queueing Slack Message: {formatted_message}")
+        self.shipper.enqueue(formatted_message, level=level)
+
+    def flush(self, timeout=5.0):
+        """
+        Waits until the queued Slack messages are posted.
+        """
+        return self.shipper.flush(timeout)
+
+    def flush_severe(self, timeout=SEVERE_FLUSH_TIMEOUT_SECONDS):
+        """
+        Waits until the queued SEVERE messages are posted, returns right away if there are none.
+        """
+        return self.shipper.flush_severe(timeout)
 
     def info(self, message):
         """
@@ -49,4 +252,29 @@ class Logger:
         print(formatted_message)
 
 
-central_logger = Logger()
\ No newline at end of file
+central_logger = Logger()
+
+
+def flush_logs(handler):
+    """
+    Decorates a function entrypoint so the SEVERE messages of a request are posted before its
+    response is sent.
+    """
+    if asyncio.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                await asyncio.to_thread(central_logger.flush_severe)
+
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            central_logger.flush_severe()
+
+    return wrapper
@@ -1,18 +1,293 @@
+import asyncio
+import contextvars
+import hmac
+import json
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 import functions_framework
-from .models.userprofile import UserProfile
 from .services.db import DB
-from .logging.logger import central_logger
+from .services.lazy import warm_up_in_background
+from .services.llm import LLMSERVICE
+from .services.pdf_text import PDF_TEXT
+from .services.profile_cache import PROFILE_CACHE
+from .services.prompt_budget import PROMPT_STATS, TOKENIZER
+from .services.tracing import METRICS, span, start_request, server_timing
+from .services.upload import is_multipart, read_profile_form, read_profile_form_async
+from .logging.logger import central_logger, flush_logs
 
+METRICS.register_gauge("issue_match_embedding_cache", lambda: LLMSERVICE.embedding_cache.stats() if LLMSERVICE.initialized else {})
+METRICS.register_gauge("issue_match_profile_cache", lambda: PROFILE_CACHE.stats())
+METRICS.register_gauge("issue_match_pdf_text", lambda: PDF_TEXT.stats() if PDF_TEXT.initialized else {})
+METRICS.register_gauge("issue_match_prompt_tokens", lambda: PROMPT_STATS.stats())
+METRICS.register_gauge("issue_match_query_handles", lambda: DB.query_handles.stats() if DB.initialized else {})
+METRICS.register_gauge("issue_match_result_cache", lambda: DB.result_cache.stats() if DB.initialized else {})
 
-def process_request(data):
+
+def warm_up():
+    """
+    Builds the clients, opens the Mongo pool, starts a PDF worker and loads the tokenizer before a
+    match request needs them.
+    """
+    DB.warm_up()
+    LLMSERVICE.get()
+    PDF_TEXT.warm_up()
+    TOKENIZER.get()
+
+
+async def warm_up_async():
+    """
+    Builds the DB service and the tokenizer off the event loop and opens its async Mongo pool.
+    """
+    db = await asyncio.to_thread(DB.get)
+    await db.warm_up_async()
+    await asyncio.to_thread(TOKENIZER.get)
+
+
+# Profiles per batch request and chat completions / vector searches in flight while serving one
+MAX_BATCH_PROFILES = 50
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+MAX_K = 20
+# Search with the raw interests while the summary is generated, ?speculative=true per request.
+# ?fast=true also returns the speculative matches when the summary takes longer than the budget
+SPECULATIVE_SEARCH = os.environ.get("SPECULATIVE_SEARCH", "").lower() == "true"
+SPECULATIVE_BUDGET_SECONDS = float(os.environ.get("SPECULATIVE_BUDGET_SECONDS", 1.5))
+# Runs the refined search next to the speculative one, it finishes after a fast response to fill the profile cache
+REFINED_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="refined-search")
+_background_searches = set()
+# "llm" summarizes profiles with a chat completion, "local" builds the query from our own
+# languages and topics without one, "tags" composes the query vector of profiles without a
+# resume from the tag embedding table (TAG_EMBEDDINGS_PATH). ?query_builder= per request
+QUERY_BUILDERS = ("llm", "local", "tags")
+QUERY_BUILDER = os.environ.get("QUERY_BUILDER", "llm")
+# Shared secret our jobs send as X-Batch-Token, without it the batch endpoint refuses every request
+BATCH_API_TOKEN = os.environ.get("BATCH_API_TOKEN")
+
+# functions_framework.aio loads starlette, only the deployment of the async entry point pays for it.
+# functions-framework sets FUNCTION_TARGET before it loads this file
+if os.environ.get("FUNCTION_TARGET") == "get_issue_match_async":
+    import functions_framework.aio
+
+    asgi_http = functions_framework.aio.http
+else:
+    def asgi_http(handler):
+        return handler
+
+# Opt in, otherwise the clients are built by the first match request
+if os.environ.get("WARM_UP_ON_START", "").lower() == "true":
+    warm_up_in_background(warm_up)
+
+
+def request_options(request_args):
+    """
+    Reads the query options of a request.
+
+    Returns:
+    tuple: (speculative, budget in seconds or None, query builder)
+    """
+    fast = request_args.get("fast", "").lower() in ("1", "true")
+    speculative = fast or request_args.get("speculative", str(SPECULATIVE_SEARCH)).lower() in ("1", "true")
+    return speculative, SPECULATIVE_BUDGET_SECONDS if fast else None, parse_query_builder(request_args.get("query_builder"))
+
+
+def parse_query_builder(value):
+    value = str(value or QUERY_BUILDER).lower()
+    return value if value in QUERY_BUILDERS else QUERY_BUILDER
+
+
+def remaining(deadline):
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def refined_search(userProfile):
+    embedding = userProfile.create_query_embedding()
+    return embedding, DB.get_candidates(embedding)
+
+
+def find_matches(userProfile, speculative=False, deadline=None, query_builder="llm"):
+    """
+    Matches a profile. Speculatively, the interests as typed are embedded and searched while the
+    summary is generated, then the candidates of both searches are ranked against the summary.
+
+    Args:
+    userProfile (UserProfile): Validated profile.
+    speculative (bool): Search with the raw interests in parallel with the summary.
+    deadline (float): time.monotonic() after which the speculative matches are returned.
+    query_builder (str): One of QUERY_BUILDERS, only the LLM is slow enough to speculate.
+
+    Returns:
+    tuple: (response, True if it only has the speculative matches, the query embedding it was ranked against)
+    """
+    embedding = userProfile.get_cached_query_embedding()
+    if embedding or not speculative or not userProfile.uses_llm(query_builder) or not userProfile.interests:
+        embedding = embedding or userProfile.create_query_embedding(query_builder)
+        return DB.get_k_nearest_issues(embedding, k=4), False, embedding
+
+    # Threads don't inherit the request's timings
+    refined = REFINED_SEARCH_EXECUTOR.submit(contextvars.copy_context().run, refined_search, userProfile)
+    quick, quick_embedding = [], None
+    try:
+        with span("speculative_search"):
+            quick_embedding = userProfile.get_quick_query_embedding()
+            quick = DB.get_candidates(quick_embedding)
+    except Exception as e:
+        central_logger.warning(f"Speculative search failed {str(e)}")
+    try:
+        embedding, candidates = refined.result(timeout=remaining(deadline) if quick else None)
+    except TimeoutError:
+        return DB.rank_candidates(quick, k=4), True, quick_embedding
+    except Exception as e:
+        if not quick:
+            raise
+        central_logger.warning(f"Refined search failed, returning the speculative matches {str(e)}")
+        return DB.rank_candidates(quick, k=4), True, quick_embedding
+    with span("merge"):
+        return DB.rank_merged([candidates, quick], embedding, k=4), False, embedding
+
+
+async def refined_search_async(userProfile, db_ready=None):
+    embedding = await userProfile.create_query_embedding_async()
+    if db_ready is not None:
+        await db_ready
+    return embedding, await DB.get_candidates_async(embedding)
+
+
+def background_search_done(task):
+    _background_searches.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        central_logger.warning(f"Refined search failed after a fast response {str(task.exception())}")
+
+
+async def find_matches_async(userProfile, speculative=False, deadline=None, db_ready=None, query_builder="llm"):
+    """
+    find_matches for the asyncio request path. A refined search that misses the deadline keeps
+    running after the response to fill the profile cache.
+    """
+    embedding = userProfile.get_cached_query_embedding()
+    if embedding or not speculative or not userProfile.uses_llm(query_builder) or not userProfile.interests:
+        embedding = embedding or await userProfile.create_query_embedding_async(query_builder)
+        if db_ready is not None:
+            await db_ready
+        return await DB.get_k_nearest_issues_async(embedding, k=4), False, embedding
+
+    refined = asyncio.create_task(refined_search_async(userProfile, db_ready))
+    quick, quick_embedding = [], None
+    try:
+        with span("speculative_search"):
+            quick_embedding = await userProfile.get_quick_query_embedding_async()
+            if db_ready is not None:
+                await db_ready
+            quick = await DB.get_candidates_async(quick_embedding)
+    except Exception as e:
+        central_logger.warning(f"Speculative search failed {str(e)}")
+    try:
+        embedding, candidates = await asyncio.wait_for(asyncio.shield(refined), remaining(deadline) if quick else None)
+    except TimeoutError:
+        # Keep a reference, the loop only holds tasks weakly
+        _background_searches.add(refined)
+        refined.add_done_callback(background_search_done)
+        return DB.rank_candidates(quick, k=4), True, quick_embedding
+    except Exception as e:
+        if not quick:
+            raise
+        central_logger.warning(f"Refined search failed, returning the speculative matches {str(e)}")
+        return DB.rank_candidates(quick, k=4), True, quick_embedding
+    with span("merge"):
+        return DB.rank_merged([candidates, quick], embedding, k=4), False, embedding
+
+
+def add_query_handle(result, embedding):
+    """
+    Keeps the query embedding for the "more results" pages, the match is returned without a
+    handle if it can't be stored.
+    """
+    if embedding is None or not len(embedding) or "results" not in result:
+        return
+    try:
+        with span("query_handle"):
+            result["queryHandle"] = DB.query_handles.create(embedding, result["results"])
+    except Exception as e:
+        central_logger.warning(f"Could not create a query handle {str(e)}")
+
+
+def page_size(data, shown):
+    """
+    Returns:
+    int: Issues on the next page of a handle that has shown shown issues, 0 when it is used up.
+
+    Raises:
+    ValueError: If k is not an integer.
+    """
+    from .services.query_handles import MAX_SHOWN
+
+    try:
+        k = min(max(int(data.get("k", 4)), 1), MAX_K)
+    except (TypeError, ValueError):
+        raise ValueError("k must be an integer")
+    return max(min(k, MAX_SHOWN - len(shown)), 0)
+
+
+def process_page_request(data):
+    """
+    The next page of a match: {"queryHandle": str, "k": int}. Only the vector search and the
+    re-rank run, the profile was summarized and embedded by the request that returned the handle.
+    """
+    handle = data["queryHandle"]
+    try:
+        with span("query_handle"):
+            found = DB.query_handles.get(handle)
+        if found is None:
+            return {"error": "The query handle has expired, submit the profile again"}, 200
+        embedding, shown, shown_repos = found
+        k = page_size(data, shown)
+        result = DB.get_more_issues(embedding, shown, k=k, shown_repos=shown_repos) if k else {"results": []}
+        with span("query_handle"):
+            DB.query_handles.add_shown(handle, result["results"])
+        result["queryHandle"] = handle
+        return result, 200
+    except Exception as e:
+        central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
+        return {"error": str(e)}, 200
+
+
+async def process_page_request_async(data):
+    handle = data["queryHandle"]
+    try:
+        db = await asyncio.to_thread(DB.get)
+        with span("query_handle"):
+            found = await asyncio.to_thread(db.query_handles.get, handle)
+        if found is None:
+            return {"error": "The query handle has expired, submit the profile again"}, 200
+        embedding, shown, shown_repos = found
+        k = page_size(data, shown)
+        result = await db.get_more_issues_async(embedding, shown, k=k, shown_repos=shown_repos) if k else {"results": []}
+        with span("query_handle"):
+            await asyncio.to_thread(db.query_handles.add_shown, handle, result["results"])
+        result["queryHandle"] = handle
+        return result, 200
+    except Exception as e:
+        central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
+        return {"error": str(e)}, 200
+
+
+def process_request(data, speculative=False, budget=None, query_builder="llm", resume_pdf=None):
+    # pydantic is only loaded by requests that carry a profile
+    from .models.userprofile import UserProfile
+
+    if isinstance(data, dict) and "queryHandle" in data:
+        return process_page_request(data)
+    deadline = None if budget is None else time.monotonic() + budget
     try:
-        userProfile = UserProfile(**data)
-        central_logger.info(f"YAY!!! {userProfile.firstName}, {userProfile.email} has requested to use our service")
-        embedding = userProfile.get_query_embedding()
-        result = {"result": embedding}
-        result = DB.get_k_nearest_issues(embedding, k=4)
-        central_logger.info(f"UFF!!! Done proccessing request for {userProfile.firstName}, {userProfile.email}")
+        with span("validate"):
+            userProfile = UserProfile(**data) if resume_pdf is None else UserProfile.from_upload(data, resume_pdf)
+        with span("log"):
+            central_logger.info(f"YAY!!! {userProfile.firstName}, {userProfile.email} has requested to use our service")
+        result, is_speculative, embedding = find_matches(userProfile, speculative=speculative, deadline=deadline, query_builder=query_builder)
+        if is_speculative:
+            result["speculative"] = True
+        add_query_handle(result, embedding)
+        with span("log"):
+            central_logger.info(f"UFF!!! Done proccessing request for {userProfile.firstName}, {userProfile.email}")
         return result, 200
     except ValueError as e:
         central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
@@ -21,29 +296,255 @@ def process_request(data):
         central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
         return {"error": str(e)}, 200
 
+async def process_request_async(data, speculative=False, budget=None, query_builder="llm", resume_pdf=None):
+    """
+    process_request for get_issue_match_async, every wait on OpenAI or Mongo yields the event loop.
+    """
+    from .models.userprofile import UserProfile
+
+    if isinstance(data, dict) and "queryHandle" in data:
+        return await process_page_request_async(data)
+    deadline = None if budget is None else time.monotonic() + budget
+    try:
+        with span("validate"):
+            if resume_pdf is not None:
+                userProfile = UserProfile.from_upload(data, resume_pdf)
+            elif isinstance(data, dict) and data.get("resume"):
+                # Validation decodes the base64 resume, up to PDF_MAX_BYTES, off the event loop
+                userProfile = await asyncio.to_thread(lambda: UserProfile(**data))
+            else:
+                userProfile = UserProfile(**data)
+        with span("log"):
+            central_logger.info(f"YAY!!! {userProfile.firstName}, {userProfile.email} has requested to use our service")
+        # On a cold instance the Mongo pool opens while the profile is summarized
+        db_ready = None if DB.initialized else asyncio.create_task(warm_up_async())
+        result, is_speculative, embedding = await find_matches_async(userProfile, speculative=speculative, deadline=deadline, db_ready=db_ready, query_builder=query_builder)
+        if is_speculative:
+            result["speculative"] = True
+        await asyncio.to_thread(add_query_handle, result, embedding)
+        with span("log"):
+            central_logger.info(f"UFF!!! Done proccessing request for {userProfile.firstName}, {userProfile.email}")
+        return result, 200
+    except Exception as e:
+        central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
+        return {"error": str(e)}, 200
+
 @functions_framework.http
+@flush_logs
 def get_issue_match(request):
     # Set CORS headers
     headers = {
         "Access-Control-Allow-Origin": "*",
         "Access-Control-Allow-Methods": "POST, OPTIONS",
         "Access-Control-Allow-Headers": "Content-Type",
+        "Access-Control-Expose-Headers": "Server-Timing",
     }
 
-    # Handle preflight OPTIONS request
+    # Handle preflight OPTIONS request, the POST is likely to follow so start building the clients
     if request.method == "OPTIONS":
+        if not DB.initialized:
+            warm_up_in_background(warm_up)
         return "", 204, headers
     
     payload = {}
-    if request.data:
+    resume_pdf = None
+    # A multipart/form-data upload streams the resume instead of sending it as base64 in the JSON
+    is_form = is_multipart(request.content_type)
+    if is_form or request.data:
         try:
-            payload = request.get_json()
             start_time = time.time()
-            result, status_code = process_request(data=payload)
+            timings = start_request()
+            if is_form:
+                with span("upload"):
+                    payload, resume_pdf = read_profile_form(request, PDF_TEXT.max_bytes)
+            else:
+                payload = request.get_json()
+            speculative, budget, query_builder = request_options(request.args)
+            with span("total"):
+                result, status_code = process_request(
+                    data=payload, speculative=speculative, budget=budget, query_builder=query_builder, resume_pdf=resume_pdf
+                )
             end_time = time.time()
+            # A refined search left running in the background keeps adding to the request's dict
+            timings = dict(timings)
             result.update({'request_process_time': end_time - start_time})
+            # Per stage breakdown in seconds, opt in with ?timings=true
+            if request.args.get("timings", "").lower() in ("1", "true"):
+                result["timings"] = timings
             central_logger.info(f"request process time took {end_time - start_time}")
-            return result, status_code, headers
+            central_logger.debug_print(f"Stage timings {timings}")
+            # Page requests never build the LLM service, the stats must not either
+            if LLMSERVICE.initialized:
+                central_logger.debug_print(f"Embedding cache stats {LLMSERVICE.embedding_cache.stats()}")
+            central_logger.debug_print(f"Profile cache stats {PROFILE_CACHE.stats()}")
+            central_logger.debug_print(f"Prompt token stats {PROMPT_STATS.stats()}")
+            return result, status_code, {**headers, "Server-Timing": server_timing(timings)}
         except Exception as e:
             central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
-            return 'Not a valid JSON', 400, headers
\ No newline at end of file
+            if is_form:
+                return f"Not a valid form: {str(e)}", 400, headers
+            return 'Not a valid JSON', 400, headers
+
+
+@asgi_http
+@flush_logs
+async def get_issue_match_async(request):
+    """
+    get_issue_match on an event loop, same request and response. A sync instance holds one
+    request per worker thread for the whole LLM, embedding and Mongo chain, this one holds as
+    many as --concurrency allows.
+    """
+    from starlette.responses import JSONResponse, Response
+
+    headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "POST, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type",
+        "Access-Control-Expose-Headers": "Server-Timing",
+    }
+
+    if request.method == "OPTIONS":
+        if not DB.initialized:
+            warm_up_in_background(warm_up)
+        return Response("", status_code=204, headers=headers)
+
+    start_time = time.time()
+    timings = start_request()
+    resume_pdf = None
+    if is_multipart(request.headers.get("content-type")):
+        try:
+            with span("upload"):
+                payload, resume_pdf = await read_profile_form_async(request, PDF_TEXT.max_bytes)
+        except Exception as e:
+            central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
+            return Response(f"Not a valid form: {str(e)}", status_code=400, headers=headers)
+    else:
+        try:
+            payload = json.loads(await request.body())
+        except Exception as e:
+            central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
+            return Response('Not a valid JSON', status_code=400, headers=headers)
+
+    speculative, budget, query_builder = request_options(request.query_params)
+    with span("total"):
+        result, status_code = await process_request_async(
+            data=payload, speculative=speculative, budget=budget, query_builder=query_builder, resume_pdf=resume_pdf
+        )
+    end_time = time.time()
+    # A refined search left running in the background keeps adding to the request's dict
+    timings = dict(timings)
+    result.update({'request_process_time': end_time - start_time})
+    if request.query_params.get("timings", "").lower() in ("1", "true"):
+        result["timings"] = timings
+    central_logger.info(f"request process time took {end_time - start_time}")
+    central_logger.debug_print(f"Stage timings {timings}")
+    central_logger.debug_print(f"Prompt token stats {PROMPT_STATS.stats()}")
+    return JSONResponse(result, status_code=status_code, headers={**headers, "Server-Timing": server_timing(timings)})
+
+
+def process_batch_request(data):
+    """
+    Matches many profiles in one go, see get_issue_match_batch.
+
+    Args:
+    data (dict): {"profiles": [profile, ...], "k": int, "query_builder": one of QUERY_BUILDERS}
+
+    Returns:
+    tuple: ({"results": [{"index": int, "email": str, "results": [...]} or {"index": int, "error": str}]}, status)
+    """
+    from .models.userprofile import UserProfile, get_query_embeddings
+
+    profiles_data = data.get("profiles") if isinstance(data, dict) else None
+    if not isinstance(profiles_data, list) or not profiles_data:
+        return {"error": "profiles must be a non empty list"}, 200
+    if len(profiles_data) > MAX_BATCH_PROFILES:
+        return {"error": f"At most {MAX_BATCH_PROFILES} profiles per batch"}, 200
+    try:
+        k = min(max(int(data.get("k", 4)), 1), MAX_K)
+    except (TypeError, ValueError):
+        return {"error": "k must be an integer"}, 200
+    query_builder = parse_query_builder(data.get("query_builder"))
+
+    items = [{"index": index} for index in range(len(profiles_data))]
+    profiles = []
+    with span("validate"):
+        for index, profile_data in enumerate(profiles_data):
+            try:
+                profile = UserProfile(**profile_data)
+                items[index]["email"] = profile.email
+                profiles.append((index, profile))
+            except Exception as e:
+                items[index]["error"] = str(e)
+
+    embeddings = get_query_embeddings([profile for _, profile in profiles], max_workers=BATCH_CONCURRENCY, query_builder=query_builder)
+    searchable = []
+    for (index, _), embedding in zip(profiles, embeddings):
+        if embedding:
+            searchable.append((index, embedding))
+        else:
+            items[index]["error"] = "Could not create an embedding for this profile"
+
+    if searchable:
+        matches = DB.get_k_nearest_issues_batch([embedding for _, embedding in searchable], k=k, max_workers=BATCH_CONCURRENCY)
+        for (index, _), match in zip(searchable, matches):
+            items[index].update(match)
+
+    errors = sum(1 for item in items if "error" in item)
+    with span("log"):
+        central_logger.info(f"Done processing a batch of {len(items)} profiles, {errors} failed")
+    return {"results": items}, 200
+
+
+def verify_batch_token(request):
+    """
+    Checks the X-Batch-Token header against BATCH_API_TOKEN.
+
+    Returns:
+    tuple: An error response, None if the request may use the batch endpoint.
+    """
+    token = request.headers.get("X-Batch-Token", "")
+    if not BATCH_API_TOKEN or not hmac.compare_digest(token.encode("utf-8"), BATCH_API_TOKEN.encode("utf-8")):
+        central_logger.warning("Batch request without a valid X-Batch-Token")
+        return {"error": "Missing or invalid X-Batch-Token header"}, 401
+    return None
+
+
+@functions_framework.http
+@flush_logs
+def get_issue_match_batch(request):
+    """
+    Matches up to MAX_BATCH_PROFILES profiles per call for server side jobs (onboarding, digests).
+    Profiles that fail get an "error" instead of "results", the rest of the batch still succeeds.
+    """
+    headers = {"Access-Control-Expose-Headers": "Server-Timing"}
+    auth_error = verify_batch_token(request)
+    if auth_error:
+        return (*auth_error, headers)
+    try:
+        payload = request.get_json()
+    except Exception as e:
+        central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
+        return 'Not a valid JSON', 400, headers
+
+    start_time = time.time()
+    timings = start_request()
+    try:
+        with span("total"):
+            result, status_code = process_batch_request(payload)
+    except Exception as e:
+        central_logger.severe(f"OHHH NOOO!!! An Error Occured {str(e)}")
+        result, status_code = {"error": str(e)}, 200
+    end_time = time.time()
+    result.update({'request_process_time': end_time - start_time})
+    if request.args.get("timings", "").lower() in ("1", "true"):
+        result["timings"] = timings
+    central_logger.debug_print(f"Batch stage timings {timings}")
+    return result, status_code, {**headers, "Server-Timing": server_timing(timings)}
+
+
+@functions_framework.http
+def get_issue_match_metrics(request):
+    """
+    Stage latency histograms and cache counters of this instance in the OpenMetrics text format.
+    """
+    return METRICS.render(), 200, {"Content-Type": "application/openmetrics-text; version=1.0.0; charset=utf-8"}
\ No newline at end of file
@@ -1,6 +1,12 @@
-from pydantic import BaseModel, EmailStr, HttpUrl, Field
-from typing import List, Optional
-from ..services.llm import LLMSERVICE
+import asyncio
+from pydantic import BaseModel, EmailStr, HttpUrl, Field, PrivateAttr, field_validator
+from typing import List, Optional, Union
+from ..services.llm import LLMSERVICE, FALLBACK_SUMMARY
+from ..services.pdf_text import DATA_URL_PREFIX, PDF_TEXT
+from ..services.profile_cache import PROFILE_CACHE, profile_fingerprint
+from ..services.query_builder import LOCAL_QUERY_BUILDER, LOCAL_QUERY_FALLBACK
+from ..services.tag_embeddings import TAG_EMBEDDINGS
+from ..services.tracing import span
 
 
 class UserProfile(BaseModel):
@@ -10,10 +16,11 @@ class UserProfile(BaseModel):
     urls: Optional[List[HttpUrl]] = []
     resume: Optional[str] = Field(
         default="",
-        pattern=r"^data:application/pdf;base64,[A-Za-z0-9+/=]*$",
         description="Base64 encoded PDF string",
     )
     interests: List[str]
+    # The PDF, decoded from resume or uploaded as multipart/form-data
+    _resume_pdf: Optional[Union[bytes, bytearray]] = PrivateAttr(default=None)
 
     class Config:
         json_schema_extra = {
@@ -30,18 +37,278 @@ class UserProfile(BaseModel):
             }
         }
 
-    def get_summary_for_embedding(self):
+    @field_validator("resume")
+    @classmethod
+    def check_resume(cls, resume):
+        """
+        Checks the prefix, the size and the first bytes of the PDF instead of matching a regex
+        over the whole string, the rest of the base64 is checked by decoding it.
+        """
+        if resume:
+            if not resume.startswith(DATA_URL_PREFIX):
+                raise ValueError(f"resume must be a {DATA_URL_PREFIX} url")
+            PDF_TEXT.check(resume)
+        return resume
+
+    def model_post_init(self, __context):
+        # The base64 is decoded once, here, the extraction and the profile cache use the PDF
+        if self.resume:
+            self._resume_pdf = PDF_TEXT.decode(self.resume)
+
+    @classmethod
+    def from_upload(cls, fields, resume_pdf=None):
+        """
+        Profile of a multipart request, the uploaded buffer is used as it is.
+
+        Args:
+        fields (dict): Form fields, see services/upload.py.
+        resume_pdf (bytearray): The PDF, checked by the upload reader.
+        """
+        profile = cls(**fields)
+        profile._resume_pdf = resume_pdf or None
+        return profile
+
+    @property
+    def resume_pdf(self):
+        """
+        The PDF of the resume, uploaded or decoded from the data url, b"" without one.
+        """
+        return self._resume_pdf or b""
+
+    def get_summary_for_embedding(self, resume_text=None):
         try:
-            summary = LLMSERVICE.get_user_summary(self)
+            summary = LLMSERVICE.get_user_summary(self, resume_text)
             return summary
         except Exception as e:
-            return """Languages: Python, GoLang, JavaScript, Dart.
-Frameworks & Tools: LangChain, Flask, React, Kafka, Redis, MongoDB, Firebase, Docker, Kubernetes.
-Topics of Interest: AI-powered applications, microservices, cloud infrastructure, CI/CD pipelines, backend architecture, LLM integrations, tech."""
+            return FALLBACK_SUMMARY
+
+    def get_local_query(self, resume_text=""):
+        """
+        Query from the local query builder, FALLBACK_SUMMARY if its taxonomy can't be loaded.
+        """
+        try:
+            return LOCAL_QUERY_BUILDER.build(self.interests, resume_text)
+        except Exception as e:
+            print(f"Local query builder failed: {e}")
+            return FALLBACK_SUMMARY
+
+    def _pick_query(self, summary, resume_text, local):
+        """
+        Returns (query, True if it is an LLM summary worth caching).
+        """
+        if not local and summary != FALLBACK_SUMMARY:
+            return summary, True
+        if local or LOCAL_QUERY_FALLBACK:
+            return self.get_local_query(resume_text), False
+        return FALLBACK_SUMMARY, False
+
+    def uses_llm(self, query_builder="llm"):
+        """
+        Whether the query comes from the LLM summary, "tags" only answers profiles without a resume.
+        """
+        return query_builder == "llm" or (query_builder == "tags" and bool(self.resume_pdf))
+
+    def create_tag_query_embedding(self):
+        """
+        Query vector from the tag embedding table, the embeddings API is only called for the
+        interests that are not in it.
+
+        Returns:
+        list[float]: The query vector, [] if the table is not available.
+        """
+        try:
+            rows, unknown = TAG_EMBEDDINGS.lookup(self.interests)
+        except Exception as e:
+            print(f"Tag embeddings unavailable: {e}")
+            return []
+        extra = LLMSERVICE.create_embeddings(unknown) if unknown else []
+        with span("tag_embeddings"):
+            return TAG_EMBEDDINGS.compose(rows, extra)
+
+    async def create_tag_query_embedding_async(self):
+        try:
+            # Loading the table reads a file, keep it off the event loop
+            tags = TAG_EMBEDDINGS.get() if TAG_EMBEDDINGS.initialized else await asyncio.to_thread(TAG_EMBEDDINGS.get)
+            rows, unknown = tags.lookup(self.interests)
+        except Exception as e:
+            print(f"Tag embeddings unavailable: {e}")
+            return []
+        extra = await (await _llm_service_async()).create_embeddings_async(unknown) if unknown else []
+        with span("tag_embeddings"):
+            return tags.compose(rows, extra)
+
+    def fingerprint(self):
+        return profile_fingerprint(self.interests, self.urls, self.resume_pdf)
+
+    def get_cached_query_embedding(self):
+        with span("profile_cache"):
+            cached = PROFILE_CACHE.get(self.fingerprint())
+        return cached[1] if cached else None
 
     def get_query_embedding(self):
+        return self.get_cached_query_embedding() or self.create_query_embedding()
+
+    def create_query_embedding(self, query_builder="llm"):
+        """
+        Summarizes and embeds the profile without looking at the profile cache, LLM summaries are cached.
+
+        Args:
+        query_builder (str): "llm", "local" to build the query with the local query builder, or
+        "tags" to compose it from the tag embedding table when the profile has no resume. The local
+        query builder is also used when the LLM fails or times out, unless LOCAL_QUERY_FALLBACK is off.
+        """
+        try:
+            if query_builder == "tags" and not self.resume_pdf:
+                embedding = self.create_tag_query_embedding()
+                if embedding:
+                    return embedding
+            local = query_builder == "local"
+            resume_text = LLMSERVICE.pdf_to_text(self.resume_pdf)
+            summary = None if local else self.get_summary_for_embedding(resume_text)
+            query, cacheable = self._pick_query(summary, resume_text, local)
+            embedding = LLMSERVICE.create_an_embedding(query)
+            # Any other query is not the LLM's, retry the LLM next time
+            if embedding and cacheable:
+                PROFILE_CACHE.set(self.fingerprint(), query, embedding)
+            return embedding
+        except Exception as e:
+            return []
+
+    async def get_query_embedding_async(self):
+        return self.get_cached_query_embedding() or await self.create_query_embedding_async()
+
+    async def create_query_embedding_async(self, query_builder="llm"):
+        """
+        create_query_embedding for the asyncio request path. The resume is extracted in a worker
+        process, the summary and the embedding go through AsyncOpenAI.
+        """
         try:
-            embedding = LLMSERVICE.create_an_embedding(self.get_summary_for_embedding())
+            if query_builder == "tags" and not self.resume_pdf:
+                embedding = await self.create_tag_query_embedding_async()
+                if embedding:
+                    return embedding
+            local = query_builder == "local"
+            llm = await _llm_service_async()
+            resume_text = await llm.pdf_to_text_async(self.resume_pdf)
+            summary = None
+            if not local:
+                try:
+                    summary = await llm.get_user_summary_async(self, resume_text)
+                except Exception as e:
+                    summary = FALLBACK_SUMMARY
+            # The taxonomy may have to be loaded from Mongo
+            query, cacheable = await asyncio.to_thread(self._pick_query, summary, resume_text, local)
+            embedding = (await llm.create_embeddings_async([query]))[0]
+            if embedding and cacheable:
+                PROFILE_CACHE.set(self.fingerprint(), query, embedding)
             return embedding
         except Exception as e:
             return []
+
+    def get_quick_query_text(self):
+        """
+        Query made from the interests as typed, searched while the summary is being generated.
+        """
+        return f"Interests: {', '.join(self.interests)}"
+
+    def get_quick_query_embedding(self):
+        return LLMSERVICE.create_an_embedding(self.get_quick_query_text())
+
+    async def get_quick_query_embedding_async(self):
+        llm = await _llm_service_async()
+        return (await llm.create_embeddings_async([self.get_quick_query_text()]))[0]
+
+
+async def _llm_service_async():
+    # Building the service imports openai, keep that off the event loop on a cold instance
+    return LLMSERVICE.get() if LLMSERVICE.initialized else await asyncio.to_thread(LLMSERVICE.get)
+
+
+def _compose_tag_queries(missing):
+    """
+    Tag table query vectors for the profiles without a resume, the interests that are not in the
+    table are embedded in one call.
+
+    Args:
+    missing (dict): fingerprint -> UserProfile.
+
+    Returns:
+    dict: fingerprint -> query vector, for the profiles it could compose.
+    """
+    try:
+        lookups = {fingerprint: TAG_EMBEDDINGS.lookup(profile.interests) for fingerprint, profile in missing.items() if not profile.resume_pdf}
+    except Exception as e:
+        print(f"Tag embeddings unavailable: {e}")
+        return {}
+    unknown = sorted({text for _, texts in lookups.values() for text in texts})
+    extra = dict(zip(unknown, LLMSERVICE.create_embeddings(unknown))) if unknown else {}
+    composed = {}
+    with span("tag_embeddings"):
+        for fingerprint, (rows, texts) in lookups.items():
+            embedding = TAG_EMBEDDINGS.compose(rows, [extra[text] for text in texts])
+            if embedding:
+                composed[fingerprint] = embedding
+    return composed
+
+
+def get_query_embeddings(profiles, max_workers=8, query_builder="llm"):
+    """
+    Batch version of UserProfile.get_query_embedding. Cached and repeated profiles are summarized
+    once at most, the summaries are made with bounded concurrency and embedded together.
+
+    Args:
+    profiles (list[UserProfile]): Profiles to embed.
+    max_workers (int): Max chat completions in flight.
+    query_builder (str): "llm", "local" or "tags", see UserProfile.create_query_embedding.
+
+    Returns:
+    list: One embedding per profile, [] where it could not be created.
+    """
+    with span("profile_cache"):
+        fingerprints = [profile.fingerprint() for profile in profiles]
+        embeddings = {}
+        missing = {}
+        for profile, fingerprint in zip(profiles, fingerprints):
+            if fingerprint in embeddings or fingerprint in missing:
+                continue
+            cached = PROFILE_CACHE.get(fingerprint)
+            if cached:
+                embeddings[fingerprint] = cached[1]
+            else:
+                missing[fingerprint] = profile
+
+    if missing and query_builder == "tags":
+        try:
+            for fingerprint, embedding in _compose_tag_queries(missing).items():
+                embeddings[fingerprint] = embedding
+                del missing[fingerprint]
+        except Exception as e:
+            print(f"Failed to compose tag queries: {e}")
+
+    if missing:
+        local = query_builder == "local"
+        try:
+            if local:
+                summaries = [None] * len(missing)
+            else:
+                summaries = LLMSERVICE.get_user_summaries(list(missing.values()), max_workers=max_workers)
+            # The resume is only extracted again for the profiles that need a local query
+            picked = {}
+            for (fingerprint, profile), summary in zip(missing.items(), summaries):
+                if not local and summary is None:
+                    continue
+                try:
+                    if not local and summary != FALLBACK_SUMMARY:
+                        picked[fingerprint] = (summary, True)
+                    else:
+                        picked[fingerprint] = profile._pick_query(summary, LLMSERVICE.pdf_to_text(profile.resume_pdf), local)
+                except Exception as e:
+                    print(f"Failed to build the query of a profile: {e}")
+            created = LLMSERVICE.create_embeddings([query for query, _ in picked.values()])
+            for (fingerprint, (query, cacheable)), embedding in zip(picked.items(), created):
+                embeddings[fingerprint] = embedding
+                if embedding and cacheable:
+                    PROFILE_CACHE.set(fingerprint, query, embedding)
+        except Exception as e:
+            print(f"Failed to embed {len(missing)} profiles: {e}")
+    return [embeddings.get(fingerprint) or [] for fingerprint in fingerprints]
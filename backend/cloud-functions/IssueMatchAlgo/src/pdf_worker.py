@@ -0,0 +1,25 @@
+import time
+
+
+def import_fitz():
+    import fitz  # noqa: F401
+
+
+def extract_text(pdf_data, max_pages, timeout):
+    """
+    Runs in a worker process of services/pdf_text.py. Extracts the text of the first max_pages
+    pages, a PDF that takes longer than timeout seconds returns the pages extracted so far.
+
+    Returns:
+    str: The text of the pages.
+    """
+    import fitz
+
+    start = time.monotonic()
+    pages = []
+    with fitz.open(stream=pdf_data, filetype="pdf") as document:
+        for page_num in range(min(document.page_count, max_pages)):
+            if time.monotonic() - start > timeout:
+                break
+            pages.append(document.load_page(page_num).get_text())
+    return "".join(pages)
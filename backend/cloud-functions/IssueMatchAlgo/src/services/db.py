@@ -1,13 +1,57 @@
-from pymongo import MongoClient
 import os
-import random
+import threading
+import time
+from collections import Counter
+from .lazy import LazySingleton
+from .tracing import span
+
+# Candidates fetched with their scores and embeddings for the re-rank, k of them are returned
+RERANK_CANDIDATES = 100
+# What _format_db_respose and the re-rank read, a vector search fetches nothing else
+MATCH_FIELDS = ("issue_title", "repo_name", "repo_full_name", "issue_number", "issue_html_url", "summary", "repo_topics", "repo_languages")
+# The per repo cap counts owner/name, short names like "docs" are shared by unrelated repos
+REPO_KEY = "repo_full_name"
 
 
 class DBService:
     def __init__(self):
+        # Imported here so only requests that reach the DB pay for pymongo and numpy
+        from pymongo import AsyncMongoClient, MongoClient
+        from .query_handles import make_query_handles
+        from .result_cache import make_result_cache
+        from .vectorstore import make_vector_store
+
         self.client = MongoClient(os.environ.get("MONGODB_URI"))
         self.db =  self.client.open_match
         self.collection = self.db.issues
+        self.versions_collection = self.db.collection_versions
+        # Used by the asyncio request path, it doesn't connect until the first async search
+        self.async_client = AsyncMongoClient(os.environ.get("MONGODB_URI"))
+        self.async_versions_collection = self.async_client.open_match.collection_versions
+        # EMBEDDING_ENCODING must match how backend/scripts/migrateEmbeddings.py left the collection
+        # EMBEDDING_SHORT_DIMENSIONS switches to candidates from issuesShortKnnIndex re-ranked in process
+        self.vector_store = make_vector_store(
+            self.collection,
+            index="issuesKnnIndex",
+            encoding=os.environ.get("EMBEDDING_ENCODING", "array"),
+            short_index="issuesShortKnnIndex",
+            short_dimensions=int(os.environ.get("EMBEDDING_SHORT_DIMENSIONS", 0)),
+            async_collection=self.async_client.open_match.issues,
+            fields=MATCH_FIELDS,
+        )
+        # MMR trade-off between relevance and novelty, and the max issues shown per repo
+        self.diversity = float(os.environ.get("MATCH_DIVERSITY", 0.3))
+        self.per_repo_cap = int(os.environ.get("MATCH_PER_REPO_CAP", 2))
+        # Query embeddings of recent matches, for the "more results" pages
+        self.query_handles = make_query_handles(self.db.query_handles)
+        # Results of recent query embeddings, a near duplicate query skips the vector search
+        self.result_cache = make_result_cache()
+        # The issues version the result cache checks, re-read in the background once it's older than the TTL
+        self.version_ttl = float(os.environ.get("RESULT_CACHE_VERSION_TTL_SECONDS", 5))
+        self._version = None
+        self._version_read_at = None
+        self._version_lock = threading.Lock()
+        self._version_refreshing = False
     
     def _format_db_respose(self, issue):
         #TODO: This is bad practice, I need to make a model for this instead of passing along dicts, doing this cause of the time crunch
@@ -15,38 +59,213 @@ class DBService:
            return {
                 "title": issue.get("issue_title"),
                 "repoName": issue.get("repo_name"),
+                "repoFullName": issue.get("repo_full_name") or issue.get("repo_name"),
                 "issueNumber": str(issue.get("issue_number")), #TODO: change frontend to take number
                 "issueLink": issue.get("issue_html_url"),
                 "description": issue.get("summary"),
                 "tags": [] + issue.get("repo_topics") + issue.get("repo_languages"),
-                "match": random.randint(60, 90) #TODO: Need to dynamically determine the match, for now let me mock it
+                "match": issue.get("match", 0),
             }
         except Exception as e:
             return {
                 "title": "N/A",
                 "repoName": "N/A",
+                "repoFullName": "N/A",
                 "issueNumber": "0",
                 "issueLink": "N/A",
                 "description": "N/A",
                 "tags": [],
-                "match": random.randint(60, 90) # Need to dynamically determine the match, for now let me mock it
+                "match": 0,
             }
 
     def get_k_nearest_issues(self, embedding : list[float], k=4):
-        results = self.collection.aggregate([
-        {"$vectorSearch": {
-            "queryVector": embedding,
-            "path": "embedding",
-            "numCandidates": 100,
-            "limit": k,
-            "index": "issuesKnnIndex",
-            }}
-        ])
+        if not self.result_cache.enabled:
+            return self.rank_candidates(self.get_candidates(embedding), k)
+        version = self.cached_issues_version()
+        with span("result_cache"):
+            cached = self.result_cache.get(embedding, k, version)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        result = self.rank_candidates(self.get_candidates(embedding), k)
+        self.result_cache.put(embedding, k, version, result, time.perf_counter() - start)
+        return result
+
+    async def get_k_nearest_issues_async(self, embedding : list[float], k=4):
+        if not self.result_cache.enabled:
+            return self.rank_candidates(await self.get_candidates_async(embedding), k)
+        if self._version_read_at is None:
+            self._set_version(await self.get_issues_version_async())
+        version = self.cached_issues_version()
+        with span("result_cache"):
+            cached = self.result_cache.get(embedding, k, version)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        result = self.rank_candidates(await self.get_candidates_async(embedding), k)
+        self.result_cache.put(embedding, k, version, result, time.perf_counter() - start)
+        return result
+
+    def cached_issues_version(self):
+        """
+        The issues version as of at most version_ttl seconds ago, so a result cache lookup costs no
+        round trip. Only the first call reads it, a stale one returns it and re-reads it on a thread.
+
+        Returns:
+        int | None: The cached version, None if it could not be read.
+        """
+        if self._version_read_at is None:
+            self._set_version(self.get_issues_version())
+        elif time.monotonic() - self._version_read_at >= self.version_ttl:
+            with self._version_lock:
+                if self._version_refreshing:
+                    return self._version
+                self._version_refreshing = True
+            threading.Thread(target=self._refresh_version, name="issues-version", daemon=True).start()
+        return self._version
+
+    def _refresh_version(self):
+        try:
+            self._set_version(self.get_issues_version())
+        finally:
+            with self._version_lock:
+                self._version_refreshing = False
+
+    def _set_version(self, version):
+        self._version = version
+        self._version_read_at = time.monotonic()
+
+    def get_issues_version(self):
+        """
+        Returns the version counter of the issues collection, bumped by every write to it
+        (backend/scripts/bootstrap.py). A single _id lookup, requests use cached_issues_version.
+
+        Returns:
+        int | None: The current version, None if it could not be read.
+        """
+        try:
+            doc = self.versions_collection.find_one({"_id": self.collection.name}, {"version": 1})
+            return doc.get("version", 0) if doc else 0
+        except Exception as e:
+            print(f"Failed to read issues version: {e}")
+            return None
+
+    async def get_issues_version_async(self):
+        try:
+            doc = await self.async_versions_collection.find_one({"_id": self.collection.name}, {"version": 1})
+            return doc.get("version", 0) if doc else 0
+        except Exception as e:
+            print(f"Failed to read issues version: {e}")
+            return None
+
+    def get_more_issues(self, embedding, shown, k=4, shown_repos=()):
+        """
+        The next k issues of a query handle. The candidates are searched as for the first page plus
+        as many as were shown, and the shown ones are left out before the re-rank.
+
+        Args:
+        embedding (list[float]): Query embedding of the handle.
+        shown (list[str]): Links of the issues shown so far.
+        shown_repos (list[str]): Their repos, they count toward the per repo cap.
+        """
+        candidates = self._unseen(self.get_candidates(embedding, RERANK_CANDIDATES + len(shown)), shown)
+        return self.rank_candidates(candidates, k, repo_counts=Counter(map(str, shown_repos)))
+
+    async def get_more_issues_async(self, embedding, shown, k=4, shown_repos=()):
+        candidates = self._unseen(await self.get_candidates_async(embedding, RERANK_CANDIDATES + len(shown)), shown)
+        return self.rank_candidates(candidates, k, repo_counts=Counter(map(str, shown_repos)))
+
+    def _unseen(self, candidates, shown):
+        shown = set(shown)
+        return [doc for doc in candidates if doc.get("issue_html_url") not in shown]
+
+    def get_candidates(self, embedding, k=RERANK_CANDIDATES):
+        """
+        The k nearest issues with their scores and embeddings, for rank_candidates.
+        """
+        with span("vector_search"):
+            return self.vector_store.search(
+                embedding, k=k, num_candidates=k, with_vectors=True
+            )
+
+    async def get_candidates_async(self, embedding, k=RERANK_CANDIDATES):
+        with span("vector_search"):
+            return await self.vector_store.search_async(
+                embedding, k=k, num_candidates=k, with_vectors=True
+            )
+
+    def rank_merged(self, candidate_lists, embedding, k=4):
+        """
+        Ranks the candidates of several searches together against embedding.
+        """
+        from .rerank import merge_candidates
+
+        return self.rank_candidates(merge_candidates(candidate_lists, embedding), k)
+
+    def rank_candidates(self, candidates, k, repo_counts=None):
+        from .rerank import rerank
+
+        with span("rerank"):
+            results = rerank(
+                candidates, k, diversity=self.diversity, per_repo_cap=self.per_repo_cap, repo_key=REPO_KEY, repo_counts=repo_counts
+            )
         docs = []
         for doc in results:
-            del doc['embedding']
-            del doc['_id']
             docs.append(self._format_db_respose(doc))
         return {"results": docs}
 
-DB = DBService()
+    def get_k_nearest_issues_batch(self, embeddings, k=4, max_workers=8):
+        """
+        get_k_nearest_issues for many embeddings, the searches run concurrently (or as one
+        matrix product on the local backend).
+
+        Returns:
+        list[dict]: Per embedding {"results": [...]}, or {"error": str} if its search failed.
+        """
+        from .rerank import rerank
+
+        with span("vector_search"):
+            searches = self.vector_store.search_many(
+                embeddings, k=RERANK_CANDIDATES, num_candidates=RERANK_CANDIDATES, with_vectors=True, max_workers=max_workers
+            )
+        results = []
+        with span("rerank"):
+            for candidates in searches:
+                if isinstance(candidates, Exception):
+                    results.append({"error": str(candidates)})
+                    continue
+                ranked = rerank(candidates, k, diversity=self.diversity, per_repo_cap=self.per_repo_cap, repo_key=REPO_KEY)
+                results.append({"results": [self._format_db_respose(doc) for doc in ranked]})
+        return results
+
+    def get_vocabulary(self, min_count=2):
+        """
+        Counts the repo languages and topics over the issues, the vocabulary of the local query builder.
+
+        Returns:
+        dict: {"languages": {name: issues}, "topics": {name: issues}} with values on at least min_count issues.
+        """
+        vocabulary = {}
+        for kind, field in (("languages", "repo_languages"), ("topics", "repo_topics")):
+            pipeline = [
+                {"$project": {"value": {"$ifNull": [f"${field}", []]}}},
+                {"$unwind": "$value"},
+                {"$group": {"_id": "$value", "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gte": min_count}}},
+            ]
+            vocabulary[kind] = {doc["_id"]: doc["count"] for doc in self.collection.aggregate(pipeline) if isinstance(doc["_id"], str)}
+        return vocabulary
+
+    def warm_up(self):
+        """
+        Opens a pooled connection ahead of the first request.
+        """
+        self.client.admin.command("ping")
+
+    async def warm_up_async(self):
+        """
+        Opens the async pool, on a cold instance this overlaps with the LLM summary.
+        """
+        await self.async_client.admin.command("ping")
+
+DB = LazySingleton(DBService)
@@ -1,7 +1,11 @@
-from openai import OpenAI
-import base64
-import fitz
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from .lazy import LazySingleton
+from .pdf_text import PDF_TEXT
+from .prompt_budget import PromptBuilder
+from .tracing import span
 
 SYSTEM_PROMPT = """
 You are an AI assistant tasked with providing a comprehensive summary of a user. You are given a users interests, resume and/or their github, LinkedIn, Project Links.
@@ -12,59 +16,137 @@ Only provide the keywords in your summary that can be used for a semantic search
 Only reply with the summary that is going to be used to create an embedding and nothing else.
 """
 MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Input tokens of a summary prompt, the resume is cut to what is left after the instructions and interests
+USER_SUMMARY_PROMPT_TOKENS = 3000
+# Interests and urls are typed in by the user, a long list shouldn't crowd out the resume
+PROFILE_MAX_TOKENS = 500
+# Inputs per embeddings request, summaries are short so this stays well under the token limit
+EMBEDDING_BATCH_SIZE = 500
+FALLBACK_SUMMARY = """Languages: Python, GoLang, JavaScript, Dart.
+Frameworks & Tools: LangChain, Flask, React, Kafka, Redis, MongoDB, Firebase, Docker, Kubernetes.
+Topics of Interest: AI-powered applications, microservices, cloud infrastructure, CI/CD pipelines, backend architecture, LLM integrations, tech."""
 
 
 class LLMService:
     def __init__(self):
+        # Imported here so a preflight doesn't load openai and pymongo
+        from openai import AsyncOpenAI, OpenAI
+        from .db import DB
+        from .embedding_cache import make_embedding_cache
+
         load_dotenv()
         self.client = OpenAI()
+        # Used by the asyncio request path, its connection pool belongs to the serving event loop
+        self.async_client = AsyncOpenAI()
+        # A summary that takes longer fails over to the local query builder
+        self.summary_timeout = float(os.environ.get("LLM_SUMMARY_TIMEOUT_SECONDS", 10))
+        self.summary_prompt_tokens = int(os.environ.get("USER_SUMMARY_PROMPT_TOKENS", USER_SUMMARY_PROMPT_TOKENS))
+        # Through the Mongo pool of DB, a client of its own would open a second one
+        self.embedding_cache = make_embedding_cache(collection=DB.db.embedding_cache)
 
-    def pdf_to_text(self, base64_pdf: str) -> str:
-        if base64_pdf == "":
+    def pdf_to_text(self, resume) -> str:
+        """
+        Args:
+        resume (bytes-like | str): The PDF or its base64 data url, may be empty.
+        """
+        if not resume:
             return ""
-        # Decode the base64 string into binary data
-        pdf_data = base64.b64decode(base64_pdf)
-
-        # Open the binary PDF data using PyMuPDF
-        pdf_document = fitz.open(stream=pdf_data, filetype="pdf")
-
-        # Extract text from each page
-        text = ""
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document.load_page(page_num)
-            text += page.get_text()
-
-        pdf_document.close()
-        return text
-
-    def get_user_summary(self, user):
-        content = [
-            {
-                "type": "text",
-                "text": SYSTEM_PROMPT,
-            },
-            {
-                "type": "text",
-                "text": f"Interests: {user.interests}, URLS: {user.urls}",
-            },
-            {
-                "type": "text",
-                "text": f"Resume Text Extracted from PDF:{self.pdf_to_text(user.resume)}",
-            },
-        ]
+        with span("pdf_to_text"):
+            return PDF_TEXT.extract(resume)
+
+    async def pdf_to_text_async(self, resume) -> str:
+        if not resume:
+            return ""
+        with span("pdf_to_text"):
+            return await PDF_TEXT.extract_async(resume)
+
+    def get_user_summary(self, user, resume_text=None):
+        if resume_text is None:
+            resume_text = self.pdf_to_text(user.resume_pdf)
+        content = self._summary_content(user, resume_text)
         try:
-            response = self.client.chat.completions.create(
-                model=MODEL, messages=[{"role": "user", "content": content}]
-            )
+            with span("llm_summary"):
+                response = self.client.with_options(max_retries=0, timeout=self.summary_timeout).chat.completions.create(
+                    model=MODEL, messages=[{"role": "user", "content": content}]
+                )
             return response.choices[0].message.content
         except Exception as e:
             # TODO: Log this, better solution needed
-            return """Languages: Python, GoLang, JavaScript, Dart.
-Frameworks & Tools: LangChain, Flask, React, Kafka, Redis, MongoDB, Firebase, Docker, Kubernetes.
-Topics of Interest: AI-powered applications, microservices, cloud infrastructure, CI/CD pipelines, backend architecture, LLM integrations, tech."""  # fallback string
+            return FALLBACK_SUMMARY
+
+    async def get_user_summary_async(self, user, resume_text: str) -> str:
+        """
+        get_user_summary through AsyncOpenAI, the resume is extracted by the caller.
+        """
+        content = self._summary_content(user, resume_text)
+        try:
+            with span("llm_summary"):
+                response = await self.async_client.with_options(max_retries=0, timeout=self.summary_timeout).chat.completions.create(
+                    model=MODEL, messages=[{"role": "user", "content": content}]
+                )
+            return response.choices[0].message.content
+        except Exception as e:
+            return FALLBACK_SUMMARY
+
+    def _summary_content(self, user, resume_text):
+        prompt = (
+            PromptBuilder("user_summary", self.summary_prompt_tokens)
+            .add("system", SYSTEM_PROMPT, priority=0)
+            .add("profile", f"Interests: {user.interests}, URLS: {user.urls}", priority=1, max_tokens=PROFILE_MAX_TOKENS)
+            .add("resume", f"Resume Text Extracted from PDF:{resume_text}" if resume_text else "", priority=2)
+            .build()
+        )
+        return [{"type": "text", "text": text} for text in prompt.values() if text]
+
+    def get_user_summaries(self, users, max_workers=8):
+        """
+        Summarizes many users with at most max_workers chat completions in flight.
+
+        Returns:
+        list[str | None]: One summary per user, in order, None where it failed (e.g. a bad resume).
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.get_user_summary, user) for user in users]
+        summaries = []
+        for future in futures:
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                print(f"Failed to summarize a user: {e}")
+                summaries.append(None)
+        return summaries
 
     def create_an_embedding(self, summary: str) -> list[float]:
-        return self.client.embeddings.create(input = [summary], model="text-embedding-3-small").data[0].embedding
+        return self.create_embeddings([summary])[0]
+
+    def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds many texts, the ones not cached go out in as few requests as possible.
+        """
+        with span("embedding"):
+            return self.embedding_cache.get_or_create(texts, model=EMBEDDING_MODEL, create=self._create_embeddings)
+
+    async def create_embeddings_async(self, texts: list[str]) -> list[list[float]]:
+        with span("embedding"):
+            return await self.embedding_cache.get_or_create_async(texts, model=EMBEDDING_MODEL, create=self._create_embeddings_async)
+
+    def _create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        embeddings = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            with span("embedding_api"):
+                response = self.client.embeddings.create(input=texts[start:start + EMBEDDING_BATCH_SIZE], model=EMBEDDING_MODEL)
+            embeddings.extend(item.embedding for item in response.data)
+        return embeddings
+
+    async def _create_embeddings_async(self, texts: list[str]) -> list[list[float]]:
+        with span("embedding_api"):
+            # Chunks of one call go out together
+            responses = await asyncio.gather(*[
+                self.async_client.embeddings.create(input=texts[start:start + EMBEDDING_BATCH_SIZE], model=EMBEDDING_MODEL)
+                for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+            ])
+        return [item.embedding for response in responses for item in response.data]
 
 
-LLMSERVICE = LLMService() 
\ No newline at end of file
+LLMSERVICE = LazySingleton(LLMService) 
\ No newline at end of file
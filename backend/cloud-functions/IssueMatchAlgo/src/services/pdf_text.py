@@ -0,0 +1,260 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import importlib
+import multiprocessing
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .lazy import LazySingleton
+
+PDF_MAGIC = b"%PDF-"
+DATA_URL_PREFIX = "data:application/pdf;base64,"
+DEFAULT_MAX_BYTES = 5 * 2**20
+DEFAULT_MAX_PAGES = 10
+DEFAULT_TIMEOUT_SECONDS = 5.0
+DEFAULT_CACHE_ENTRIES = 256
+# A worker is replaced after this many PDFs, PyMuPDF doesn't give back all the memory it takes
+MAX_TASKS_PER_WORKER = 100
+# How much longer than the timeout we wait for a worker, it stops by itself at the timeout
+GRACE_SECONDS = 1.0
+# The directory of main.py. functions-framework loads main.py as a package of its own that a
+# spawned worker can't import, so the code the workers run is the top-level pdf_worker module
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker_module():
+    # A spawned worker starts with the sys.path of the instance
+    if SOURCE_DIR not in sys.path:
+        sys.path.append(SOURCE_DIR)
+    return importlib.import_module("pdf_worker")
+
+
+class PdfTextExtractor:
+    def __init__(
+        self,
+        max_workers=None,
+        timeout=DEFAULT_TIMEOUT_SECONDS,
+        max_pages=DEFAULT_MAX_PAGES,
+        max_bytes=DEFAULT_MAX_BYTES,
+        cache_entries=DEFAULT_CACHE_ENTRIES,
+    ):
+        """
+        Extracts resume text in worker processes, so a heavy PDF neither holds the GIL of the
+        instance nor runs past the request. Texts are kept by the hash of the PDF.
+
+        Args:
+        max_workers (int): Worker processes, 0 extracts in threads of this process instead.
+        timeout (float): Seconds one PDF may take, the pages extracted by then are used.
+        max_pages (int): Pages extracted per PDF.
+        max_bytes (int): Larger PDFs are refused before they are decoded.
+        cache_entries (int): Texts kept in memory.
+        """
+        self.max_workers = min(2, os.cpu_count() or 1) if max_workers is None else max_workers
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.cache_entries = cache_entries
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.failures = 0
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                if self.max_workers == 0:
+                    self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-text")
+                else:
+                    # Not forked, the instance has Mongo and OpenAI threads running
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=worker_module().import_fitz,
+                        max_tasks_per_child=MAX_TASKS_PER_WORKER,
+                    )
+            return self._pool
+
+    def warm_up(self):
+        """
+        Starts a worker and imports PyMuPDF in it.
+        """
+        self.pool().submit(worker_module().import_fitz).result()
+
+    def check(self, resume):
+        """
+        Checks the size and the first bytes of a resume without decoding all of it.
+
+        Args:
+        resume (str | bytes-like): Base64 string or data url, or the PDF itself.
+
+        Raises:
+        ValueError: If it is larger than max_bytes or doesn't start like a PDF.
+        """
+        if isinstance(resume, str):
+            resume = resume.removeprefix(DATA_URL_PREFIX)
+            # 4 base64 characters are 3 bytes
+            size = len(resume) // 4 * 3
+            try:
+                head = base64.b64decode(resume[:8], validate=True)
+            except binascii.Error:
+                head = b""
+        else:
+            size = len(resume)
+            head = bytes(memoryview(resume)[:len(PDF_MAGIC)])
+        if size > self.max_bytes:
+            raise ValueError(f"Resume is larger than {self.max_bytes / 2**20:g}MB")
+        if not head.startswith(PDF_MAGIC):
+            raise ValueError("Resume is not a PDF")
+
+    def decode(self, base64_pdf):
+        """
+        Returns:
+        bytes: The PDF of a base64 string or data url.
+
+        Raises:
+        ValueError: If it is larger than max_bytes, not a PDF or not base64.
+        """
+        self.check(base64_pdf)
+        try:
+            return base64.b64decode(base64_pdf.removeprefix(DATA_URL_PREFIX), validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"Resume is not a base64 encoded PDF: {e}")
+
+    def extract(self, resume):
+        """
+        Args:
+        resume (str | bytes-like): Base64 string or data url, or the PDF of an upload.
+
+        Returns:
+        str: The text of the PDF, "" if the worker doesn't answer in time or can't read it.
+        """
+        key, pdf_data = self._prepare(resume)
+        text = self._cached(key)
+        if text is not None:
+            return text
+        # Once more on a new pool when a worker died, it may have been another PDF's
+        for attempt in range(2):
+            pool = self.pool()
+            try:
+                future = self._submit(pool, pdf_data)
+                return self._remember(key, future.result(timeout=self.timeout + GRACE_SECONDS))
+            except TimeoutError:
+                return self._timed_out(pool, future)
+            except BrokenProcessPool:
+                self._replace(pool)
+            except Exception as e:
+                return self._failed(e)
+        return self._failed("the worker died twice")
+
+    async def extract_async(self, resume):
+        """
+        extract without blocking the event loop, decoding and hashing run in a thread.
+        """
+        key, pdf_data = await asyncio.to_thread(self._prepare, resume)
+        text = self._cached(key)
+        if text is not None:
+            return text
+        for attempt in range(2):
+            pool = self.pool()
+            try:
+                future = self._submit(pool, pdf_data)
+                text = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout + GRACE_SECONDS)
+                return self._remember(key, text)
+            except TimeoutError:
+                return self._timed_out(pool, future)
+            except BrokenProcessPool:
+                self._replace(pool)
+            except Exception as e:
+                return self._failed(e)
+        return self._failed("the worker died twice")
+
+    def stats(self):
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+        }
+
+    def _prepare(self, resume):
+        if isinstance(resume, str):
+            pdf_data = self.decode(resume)
+        else:
+            # An upload is used as it is, hashed and handed to the worker without a copy here
+            self.check(resume)
+            pdf_data = resume
+        return hashlib.sha256(pdf_data).hexdigest(), pdf_data
+
+    def _submit(self, pool, pdf_data):
+        return pool.submit(worker_module().extract_text, pdf_data, self.max_pages, self.timeout)
+
+    def _failed(self, error):
+        # A corrupt PDF, the profile is matched without its resume
+        self.failures += 1
+        print(f"Resume extraction failed, matching without it: {error}")
+        return ""
+
+    def _timed_out(self, pool, future):
+        self.timeouts += 1
+        print(f"Resume extraction took longer than {self.timeout + GRACE_SECONDS}s, matching without it")
+        if not future.cancel():
+            # The worker is stuck in a page, it would hold its slot until it is done
+            self._replace(pool)
+        return ""
+
+    def _replace(self, pool):
+        """
+        Stops a pool whose worker died or hangs, the next PDF gets a new one. PDFs still in it fail
+        with BrokenProcessPool and are submitted again.
+        """
+        with self._pool_lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        # No public way to stop a busy worker before Python 3.14, shutdown forgets the processes
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.kill()
+        # Not cancelled, the PDFs queued in it fail with BrokenProcessPool now that its workers are gone
+        pool.shutdown(wait=False)
+
+    def _cached(self, key):
+        with self._cache_lock:
+            text = self._cache.get(key)
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(key)
+            return text
+
+    def _remember(self, key, text):
+        with self._cache_lock:
+            self._cache[key] = text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return text
+
+
+def make_pdf_text_extractor():
+    workers = os.environ.get("PDF_WORKERS")
+    return PdfTextExtractor(
+        max_workers=int(workers) if workers else None,
+        timeout=float(os.environ.get("PDF_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS)),
+        max_pages=int(os.environ.get("PDF_MAX_PAGES", DEFAULT_MAX_PAGES)),
+        max_bytes=int(os.environ.get("PDF_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        cache_entries=int(os.environ.get("PDF_CACHE_ENTRIES", DEFAULT_CACHE_ENTRIES)),
+    )
+
+
+PDF_TEXT = LazySingleton(make_pdf_text_extractor)
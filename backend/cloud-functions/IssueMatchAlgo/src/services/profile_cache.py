@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def profile_fingerprint(interests, urls, resume):
+    """
+    Hashes everything the summary is built from. Interests are compared case and order
+    insensitive, urls order insensitive, and the resume by the hash of its bytes.
+
+    Args:
+    interests (list[str]): User interests.
+    urls (list): Profile urls.
+    resume (bytes-like | str): The resume pdf or its base64 data url, may be empty.
+
+    Returns:
+    str: Hex digest identifying the profile.
+    """
+    payload = {
+        "interests": sorted({interest.strip().lower() for interest in interests if interest.strip()}),
+        "urls": sorted({str(url) for url in urls or []}),
+        "resume": hashlib.sha256(resume if isinstance(resume, (bytes, bytearray)) else (resume or "").encode("utf-8")).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(payload, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ProfileCache:
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Per instance cache of (summary, embedding) by profile fingerprint, so a repeat
+        submission skips both the chat completion and the embedding call.
+
+        Args:
+        ttl (int): Max age of an entry in seconds.
+        max_entries (int): Number of profiles kept, least recently used go first.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # fingerprint -> (created_at, summary, embedding)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry:
+                del self._entries[fingerprint]
+            self.misses += 1
+            return None
+
+    def set(self, fingerprint, summary, embedding):
+        with self._lock:
+            self._entries[fingerprint] = (time.monotonic(), summary, embedding)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+PROFILE_CACHE = ProfileCache(
+    ttl=int(os.environ.get("PROFILE_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+    max_entries=int(os.environ.get("PROFILE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+)
@@ -0,0 +1,151 @@
+import math
+import os
+import threading
+from .lazy import LazySingleton
+
+# Tokenizer of gpt-4o and gpt-4o-mini
+DEFAULT_ENCODING = "o200k_base"
+# Without tiktoken, English text and code average about 4 characters per o200k_base token
+CHARS_PER_TOKEN = 4
+# Longer texts than this many characters per token allowed are cut without tokenizing all of them
+MAX_CHARS_PER_TOKEN = 10
+# A section cut to fewer tokens than this is dropped instead, a few words say nothing
+MIN_SECTION_TOKENS = 16
+TRUNCATION_MARKER = " [...]"
+
+
+class Tokenizer:
+    def __init__(self, encoding=None):
+        """
+        Counts and truncates text in tokens, with tiktoken's encoding if there is one and an
+        estimate from the number of characters otherwise.
+
+        Args:
+        encoding (tiktoken.Encoding): None to estimate.
+        """
+        self.encoding = encoding
+
+    def count(self, text):
+        if self.encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def fit(self, text, max_tokens):
+        """
+        Returns:
+        tuple: (text cut to at most max_tokens tokens and ending with TRUNCATION_MARKER if it was
+        cut, its tokens, whether it was cut)
+        """
+        # A long text is not tokenized in full to find out it doesn't fit
+        head = text[:max_tokens * MAX_CHARS_PER_TOKEN]
+        keep = max_tokens - self.count(TRUNCATION_MARKER)
+        if self.encoding is None:
+            tokens = self.count(head)
+            if len(head) == len(text) and tokens <= max_tokens:
+                return text, tokens, False
+            cut = text[:keep * CHARS_PER_TOKEN]
+        else:
+            encoded = self.encoding.encode(head, disallowed_special=())
+            if len(head) == len(text) and len(encoded) <= max_tokens:
+                return text, len(encoded), False
+            cut = self.encoding.decode(encoded[:keep]) if keep > 0 else ""
+        if keep <= 0:
+            return "", 0, True
+        cut += TRUNCATION_MARKER
+        return cut, self.count(cut), True
+
+
+def load_tokenizer():
+    """
+    tiktoken downloads its encoding on first use (TIKTOKEN_CACHE_DIR keeps it), the estimate is
+    used when that or the import fails.
+    """
+    try:
+        import tiktoken
+
+        return Tokenizer(tiktoken.get_encoding(os.environ.get("PROMPT_ENCODING", DEFAULT_ENCODING)))
+    except Exception as e:
+        print(f"tiktoken unavailable, estimating prompt tokens: {e}")
+        return Tokenizer()
+
+
+TOKENIZER = LazySingleton(load_tokenizer)
+
+
+class PromptStats:
+    def __init__(self):
+        """
+        Input tokens of the prompts built per instance, by prompt name, for a metrics gauge.
+        """
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, prompt, tokens, truncated):
+        with self._lock:
+            stats = self._stats.setdefault(prompt, {"count": 0, "tokens_sum": 0, "tokens_max": 0, "truncated": 0})
+            stats["count"] += 1
+            stats["tokens_sum"] += tokens
+            stats["tokens_max"] = max(stats["tokens_max"], tokens)
+            stats["truncated"] += bool(truncated)
+
+    def stats(self):
+        with self._lock:
+            return {f"{prompt}_{stat}": value for prompt, stats in self._stats.items() for stat, value in stats.items()}
+
+
+PROMPT_STATS = PromptStats()
+
+
+class PromptBuilder:
+    def __init__(self, prompt, budget, tokenizer=TOKENIZER):
+        """
+        Fits the sections of a prompt into a token budget, so the input of an LLM call and with
+        it its latency and cost have a ceiling. Sections are filled by priority, lowest first and
+        in the order they were added within a priority. The first one that doesn't fit is cut to
+        what is left and the rest are dropped.
+
+        Args:
+        prompt (str): Name of the prompt in PROMPT_STATS.
+        budget (int): Max input tokens of all the sections.
+        tokenizer (Tokenizer): Counts the tokens.
+        """
+        self.prompt = prompt
+        self.budget = budget
+        self.tokenizer = tokenizer
+        self.tokens = 0
+        self.truncated = []
+        self._sections = []
+
+    def add(self, name, text, priority=0, max_tokens=None):
+        """
+        Args:
+        name (str): Key of the section in the result of build.
+        text (str): Content of the section.
+        priority (int): Lower is filled first.
+        max_tokens (int): Cap of this section on its own.
+        """
+        self._sections.append((name, text or "", priority, max_tokens))
+        return self
+
+    def build(self):
+        """
+        Returns:
+        dict: name -> text of the section as it fits, "" if it was dropped.
+        """
+        used = 0
+        fitted = {}
+        self.truncated = []
+        for name, text, _, max_tokens in sorted(self._sections, key=lambda section: section[2]):
+            limit = max(self.budget - used, 0)
+            if max_tokens is not None:
+                limit = min(limit, max_tokens)
+            text, tokens, cut = self.tokenizer.fit(text, limit)
+            if cut:
+                self.truncated.append(name)
+                if limit < MIN_SECTION_TOKENS:
+                    text, tokens = "", 0
+            fitted[name] = text
+            used += tokens
+        self.tokens = used
+        PROMPT_STATS.record(self.prompt, self.tokens, self.truncated)
+        return fitted
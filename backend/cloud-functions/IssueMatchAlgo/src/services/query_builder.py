@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from .lazy import LazySingleton
+from .tracing import span
+
+DEFAULT_TAXONOMY_TTL_SECONDS = 6 * 60 * 60
+# Values on fewer issues than this are mostly noise and make the matcher slower
+DEFAULT_MIN_COUNT = 2
+MAX_NGRAM = 3
+MAX_LANGUAGES = 10
+MAX_TOPICS = 30
+# A match in the interests counts this many resume mentions, resume mentions count up to MAX_RESUME_MENTIONS
+INTEREST_WEIGHT = 3
+MAX_RESUME_MENTIONS = 3
+# Build the query locally when the LLM summary fails or times out, instead of a generic summary
+LOCAL_QUERY_FALLBACK = os.environ.get("LOCAL_QUERY_FALLBACK", "true").lower() == "true"
+
+# Spellings people use for a term that GitHub spells differently, only used when the target is in the vocabulary
+ALIASES = {
+    "js": "javascript",
+    "ts": "typescript",
+    "golang": "go",
+    "k8s": "kubernetes",
+    "py": "python",
+    "ml": "machine learning",
+    "ai": "artificial intelligence",
+    "reactjs": "react",
+    "react js": "react",
+    "nodejs": "node js",
+    "vuejs": "vue",
+    "vue js": "vue",
+    "cpp": "c++",
+    "csharp": "c#",
+    "postgres": "postgresql",
+}
+# Short language names that are ordinary words in prose, in a resume they only count capitalized
+AMBIGUOUS = {"go", "c", "r", "d", "v", "q"}
+# Topics that say nothing about what someone wants to work on
+STOP_TOPICS = {"hacktoberfest", "awesome", "awesome-list", "good-first-issue", "help-wanted", "first-timers-only"}
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9+#]*")
+
+
+def term_key(term):
+    """
+    Normalizes a vocabulary term or a phrase of the text, "Machine-Learning" and "machine learning"
+    get the same key.
+    """
+    return " ".join(token.lower() for token in TOKEN_PATTERN.findall(term))
+
+
+class Taxonomy:
+    def __init__(self, vocabulary):
+        """
+        Keyword matcher over the languages and topics of our issues.
+
+        Args:
+        vocabulary (dict): {"languages": {name: issue count}, "topics": {name: issue count}}
+        """
+        self.terms = {}  # key -> (kind, name, count)
+        for kind in ("topics", "languages"):
+            for name, count in vocabulary.get(kind, {}).items():
+                key = term_key(name)
+                if not key or (kind == "topics" and name.lower() in STOP_TOPICS):
+                    continue
+                # Languages win over a topic of the same name
+                self.terms[key] = (kind, name, count)
+        for alias, target in ALIASES.items():
+            if target in self.terms and alias not in self.terms:
+                self.terms[alias] = self.terms[target]
+
+    def __len__(self):
+        return len(self.terms)
+
+    def match(self, text, strict=False):
+        """
+        Finds the vocabulary terms in text, longest phrase first.
+
+        Args:
+        text (str): Free text.
+        strict (bool): Only count AMBIGUOUS terms when capitalized, for prose like a resume.
+
+        Returns:
+        Counter: key of the matched term -> mentions.
+        """
+        tokens = TOKEN_PATTERN.findall(text)
+        keys = [token.lower() for token in tokens]
+        found = Counter()
+        i = 0
+        while i < len(tokens):
+            for size in range(min(MAX_NGRAM, len(tokens) - i), 0, -1):
+                key = " ".join(keys[i:i + size])
+                if key not in self.terms:
+                    continue
+                if strict and size == 1 and key in AMBIGUOUS and not tokens[i][0].isupper():
+                    continue
+                found[term_key(self.terms[key][1])] += 1
+                i += size
+                break
+            else:
+                i += 1
+        return found
+
+    def build_query(self, interests, resume_text=""):
+        """
+        Builds a search query in the shape of the LLM summary from the terms found in the interests
+        and the resume. The interests are kept as typed, they are keywords already.
+
+        Returns:
+        str: The query.
+        """
+        weights = Counter()
+        for interest in interests:
+            for key in self.match(interest):
+                weights[key] += INTEREST_WEIGHT
+        for key, mentions in self.match(resume_text or "", strict=True).items():
+            weights[key] += min(mentions, MAX_RESUME_MENTIONS)
+
+        # Most mentioned first, ties go to what more issues have
+        ranked = sorted(weights, key=lambda key: (-weights[key], -self.terms[key][2], key))
+        languages = [self.terms[key][1] for key in ranked if self.terms[key][0] == "languages"][:MAX_LANGUAGES]
+        topics = [self.terms[key][1] for key in ranked if self.terms[key][0] == "topics"][:MAX_TOPICS]
+        lines = []
+        if languages:
+            lines.append(f"Languages: {', '.join(languages)}.")
+        if topics:
+            lines.append(f"Topics of Interest: {', '.join(topics)}.")
+        if interests:
+            lines.append(f"Interests: {', '.join(interests)}.")
+        return "\n".join(lines)
+
+
+def load_vocabulary():
+    """
+    Reads the vocabulary from QUERY_TAXONOMY_PATH (written by backend/scripts/exportQueryTaxonomy.py)
+    or counts it in the issues collection.
+    """
+    path = os.environ.get("QUERY_TAXONOMY_PATH")
+    if path:
+        with open(path) as file:
+            return json.load(file)
+    from .db import DB
+
+    return DB.get_vocabulary(min_count=int(os.environ.get("QUERY_TAXONOMY_MIN_COUNT", DEFAULT_MIN_COUNT)))
+
+
+class LocalQueryBuilder:
+    def __init__(self, load=load_vocabulary, ttl=DEFAULT_TAXONOMY_TTL_SECONDS):
+        """
+        Deterministic alternative to LLMService.get_user_summary, no chat completion needed.
+
+        The taxonomy is loaded on first use and reloaded after ttl seconds, if a reload fails
+        the previous taxonomy is kept.
+
+        Args:
+        load (callable): Returns the vocabulary for Taxonomy.
+        ttl (int): Seconds before the taxonomy is reloaded.
+        """
+        self.load = load
+        self.ttl = ttl
+        self._taxonomy = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def taxonomy(self):
+        if self._taxonomy is None or time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                if self._taxonomy is None or time.monotonic() - self._loaded_at > self.ttl:
+                    try:
+                        with span("taxonomy_load"):
+                            self._taxonomy = Taxonomy(self.load())
+                    except Exception as e:
+                        if self._taxonomy is None:
+                            raise
+                        print(f"Failed to reload the query taxonomy, keeping the old one: {e}")
+                    self._loaded_at = time.monotonic()
+        return self._taxonomy
+
+    def build(self, interests, resume_text=""):
+        with span("local_query"):
+            return self.taxonomy().build_query(interests, resume_text)
+
+
+LOCAL_QUERY_BUILDER = LazySingleton(
+    lambda: LocalQueryBuilder(ttl=int(os.environ.get("QUERY_TAXONOMY_TTL", DEFAULT_TAXONOMY_TTL_SECONDS)))
+)
@@ -0,0 +1,157 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from bson.binary import Binary
+from .embedding_cache import pack, unpack
+
+DEFAULT_TTL_SECONDS = 30 * 60
+DEFAULT_MEMORY_ENTRIES = 1024
+# Issues one handle pages through, a profile that wants more should be submitted again
+MAX_SHOWN = 100
+
+
+def links(results):
+    return [issue["issueLink"] for issue in results if issue.get("issueLink")]
+
+
+def repos(results):
+    return [issue.get("repoFullName") or issue.get("repoName") for issue in results if issue.get("issueLink")]
+
+
+def new_handle():
+    return secrets.token_urlsafe(16)
+
+
+class MemoryHandles:
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MEMORY_ENTRIES):
+        """
+        Query handles of this instance, for local runs. A follow-up served by another instance
+        doesn't find them.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # handle -> (created_at, embedding, shown, repos of the shown)
+        self._lock = threading.Lock()
+
+    def create(self, embedding, shown, shown_repos):
+        handle = new_handle()
+        with self._lock:
+            self._entries[handle] = (time.monotonic(), list(embedding), list(shown), list(shown_repos))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return handle
+
+    def get(self, handle):
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[handle]
+                entry = None
+            return (entry[1], list(entry[2]), list(entry[3])) if entry else None
+
+    def add_shown(self, handle, shown, shown_repos):
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry:
+                entry[2].extend(shown)
+                entry[3].extend(shown_repos)
+
+
+class MongoHandles:
+    def __init__(self, collection, ttl=DEFAULT_TTL_SECONDS):
+        """
+        Query handles in a Mongo collection shared by every instance. The TTL index on created_at
+        (backend/scripts/createIndex.py) removes them, expired ones are also ignored until it runs.
+        """
+        self.collection = collection
+        self.ttl = ttl
+
+    def create(self, embedding, shown, shown_repos):
+        handle = new_handle()
+        self.collection.insert_one({
+            "_id": handle,
+            "embedding": Binary(pack(embedding)),
+            "shown": list(shown),
+            # A list, repo names may contain dots and can't be keys of a counts document
+            "shown_repos": list(shown_repos),
+            "created_at": datetime.now(timezone.utc),
+        })
+        return handle
+
+    def get(self, handle):
+        doc = self.collection.find_one(
+            {"_id": handle, "created_at": {"$gt": datetime.now(timezone.utc) - timedelta(seconds=self.ttl)}}
+        )
+        return (unpack(doc["embedding"]), doc["shown"], doc.get("shown_repos", [])) if doc else None
+
+    def add_shown(self, handle, shown, shown_repos):
+        self.collection.update_one(
+            {"_id": handle}, {"$push": {"shown": {"$each": list(shown)}, "shown_repos": {"$each": list(shown_repos)}}}
+        )
+
+
+class QueryHandles:
+    def __init__(self, store):
+        """
+        Keeps the query embedding of a match for a while under a short random handle, so "more
+        results" pages through further neighbours with a vector search only, without the summary
+        and embedding calls of the profile. Each handle remembers the issues it has shown and their
+        repos, so the per repo cap holds across its pages.
+
+        Args:
+        store (MemoryHandles | MongoHandles): Where the handles live.
+        """
+        self.store = store
+        self._stats_lock = threading.Lock()
+        self.created = 0
+        self.hits = 0
+        self.misses = 0
+
+    def create(self, embedding, results):
+        """
+        Args:
+        embedding (list[float]): Query embedding the results were ranked against.
+        results (list[dict]): The issues of the first page, as returned to the user.
+
+        Returns:
+        str: The handle.
+        """
+        handle = self.store.create(embedding, links(results), repos(results))
+        with self._stats_lock:
+            self.created += 1
+        return handle
+
+    def get(self, handle):
+        """
+        Returns:
+        tuple: (embedding, links of the issues shown so far, their repos), None if the handle is unknown or expired.
+        """
+        found = self.store.get(handle) if isinstance(handle, str) else None
+        with self._stats_lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def add_shown(self, handle, results):
+        if results:
+            self.store.add_shown(handle, links(results), repos(results))
+
+    def stats(self):
+        with self._stats_lock:
+            return {"created": self.created, "hits": self.hits, "misses": self.misses}
+
+
+def make_query_handles(collection):
+    """
+    QUERY_HANDLE_STORE picks "mongo" (default, the given collection) or "memory",
+    QUERY_HANDLE_TTL_SECONDS how long a handle lives.
+    """
+    ttl = int(os.environ.get("QUERY_HANDLE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    if os.environ.get("QUERY_HANDLE_STORE", "mongo") == "memory":
+        return QueryHandles(MemoryHandles(ttl=ttl))
+    return QueryHandles(MongoHandles(collection, ttl=ttl))
@@ -0,0 +1,93 @@
+import numpy as np
+
+# Cosine similarities of text-embedding-3-small between a profile summary and an issue rarely
+# leave this range, it is mapped linearly onto a 0-100 match and clipped
+MATCH_COSINE_FLOOR = 0.15
+MATCH_COSINE_CEILING = 0.65
+DEFAULT_DIVERSITY = 0.3
+DEFAULT_PER_REPO_CAP = 2
+
+
+def match_percentage(similarities):
+    """
+    Maps cosine similarities onto 0-100 match percentages.
+    """
+    scaled = (np.asarray(similarities) - MATCH_COSINE_FLOOR) / (MATCH_COSINE_CEILING - MATCH_COSINE_FLOOR)
+    return np.rint(np.clip(scaled, 0, 1) * 100).astype(int)
+
+
+def rerank(candidates, k, diversity=DEFAULT_DIVERSITY, per_repo_cap=DEFAULT_PER_REPO_CAP, repo_key="repo_name", repo_counts=None):
+    """
+    Picks k of the candidates with maximal marginal relevance and at most per_repo_cap per repo.
+
+    Relevance is the candidate's vector search score, the redundancy of a candidate is its highest
+    cosine similarity to the ones already picked. The pairwise similarities are computed once as a
+    single matrix product, each pick is then a couple of vector operations.
+
+    Args:
+    candidates (list[dict]): Vector search results with "score" and "vector", best first.
+    k (int): Number of documents to return.
+    diversity (float): 0 ranks by relevance only, 1 by novelty only.
+    per_repo_cap (int): Max documents from one repo, 0 for no cap.
+    repo_key (str): Document field holding the repo, repo_name when a document doesn't have it.
+    repo_counts (dict): Issues per repo already shown on earlier pages, they count toward per_repo_cap.
+
+    Returns:
+    list[dict]: The picked documents without "vector", with "match" set, in pick order.
+    """
+    if not candidates:
+        return []
+    vectors = np.stack([doc.pop("vector") for doc in candidates]).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    # Scores are (1 + cosine) / 2
+    relevance = 2 * np.array([doc.get("score", 0.5) for doc in candidates], dtype=np.float32) - 1
+    pairwise = vectors @ vectors.T
+
+    repo_names, repo_ids = np.unique([str(doc.get(repo_key) or doc.get("repo_name")) for doc in candidates], return_inverse=True)
+    shown_counts = repo_counts or {}
+    repo_counts = np.array([shown_counts.get(name, 0) for name in repo_names], dtype=int)
+    available = repo_counts[repo_ids] < per_repo_cap if per_repo_cap else np.ones(len(candidates), dtype=bool)
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    picked = []
+    for _ in range(min(k, len(candidates))):
+        mmr = (1 - diversity) * relevance - diversity * redundancy
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        if not np.isfinite(mmr[best]):
+            break
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        repo_counts[repo_ids[best]] += 1
+        if per_repo_cap and repo_counts[repo_ids[best]] >= per_repo_cap:
+            available[repo_ids == repo_ids[best]] = False
+
+    matches = match_percentage(relevance[picked])
+    return [{**candidates[i], "match": int(match)} for i, match in zip(picked, matches)]
+
+
+def merge_candidates(candidate_lists, query_vector):
+    """
+    Unions the candidates of searches made with different queries and scores all of them against
+    query_vector, so a candidate only the speculative search found competes on the refined query.
+
+    Args:
+    candidate_lists (list[list[dict]]): Vector search results with "vector".
+    query_vector (list[float]): Query the merged candidates are scored against.
+
+    Returns:
+    list[dict]: Unique candidates with the new "score", best first.
+    """
+    merged = {}
+    for candidates in candidate_lists:
+        for doc in candidates:
+            key = doc.get("issue_html_url") or (doc.get("repo_name"), doc.get("issue_number"))
+            merged.setdefault(key, doc)
+    docs = list(merged.values())
+    if not docs:
+        return []
+    vectors = np.stack([doc["vector"] for doc in docs]).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    similarities = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+    return [{**docs[i], "score": float((1 + similarities[i]) / 2)} for i in np.argsort(-similarities, kind="stable")]
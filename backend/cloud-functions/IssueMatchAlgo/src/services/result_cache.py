@@ -0,0 +1,137 @@
+import copy
+import os
+import threading
+import time
+import numpy as np
+
+# Cosine similarity of two query embeddings above which they get the same matches
+DEFAULT_THRESHOLD = 0.97
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 512
+
+
+class SemanticResultCache:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Per instance cache of match results by query embedding. Many profiles ("Python, ML,
+        open-source") summarize to nearly the same embedding, a query at least threshold cosine
+        similar to a recent one gets its results without a vector search.
+
+        The recent query vectors are the rows of one normalized matrix, so a lookup is a single
+        matrix-vector product, and the oldest row is overwritten when it is full. Entries expire
+        after ttl seconds and are all dropped when the issues version moves on, the TTL covers
+        writes that don't bump the version.
+
+        Args:
+        threshold (float): Min cosine similarity of a hit.
+        ttl (int): Max age of an entry in seconds.
+        max_entries (int): Query vectors kept, 0 turns the cache off.
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._vectors = None  # (max_entries, dimensions), allocated with the first entry
+        self._created = np.full(max_entries, -np.inf)
+        self._k = np.zeros(max_entries, dtype=int)
+        self._entries = [None] * max_entries  # row -> (result, seconds it took to build)
+        self._next = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, embedding, k, version):
+        """
+        Args:
+        embedding (list[float]): Query embedding.
+        k (int): Results asked for, only entries with the same k match.
+        version (int | None): Current issues version, None if it could not be read.
+
+        Returns:
+        dict: A copy of the cached response, None on a miss.
+        """
+        query = normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            row = self._nearest(query, k)
+            if row is None:
+                self.misses += 1
+                return None
+            result, seconds = self._entries[row]
+            self.hits += 1
+            self.seconds_saved += seconds
+        # The caller adds its own fields to the response
+        return copy.deepcopy(result)
+
+    def put(self, embedding, k, version, result, seconds):
+        """
+        Args:
+        result (dict): Response built for embedding.
+        seconds (float): How long it took to build, what a hit on it saves.
+        """
+        if not self.enabled:
+            return
+        query = normalize(embedding)
+        result = copy.deepcopy(result)
+        with self._lock:
+            # Built from issues that have changed since
+            if version is not None and self._version is not None and version < self._version:
+                return
+            self._check_version(version)
+            if self._vectors is None or self._vectors.shape[1] != len(query):
+                self._vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+                self._created[:] = -np.inf
+            row = self._next
+            self._vectors[row] = query
+            self._created[row] = time.monotonic()
+            self._k[row] = k
+            self._entries[row] = (result, seconds)
+            self._next = (row + 1) % self.max_entries
+
+    def _check_version(self, version):
+        if version is None:
+            return
+        if self._version is not None and version > self._version:
+            self._created[:] = -np.inf
+            self._entries = [None] * self.max_entries
+        if self._version is None or version > self._version:
+            self._version = version
+
+    def _nearest(self, query, k):
+        if self._vectors is None or self._vectors.shape[1] != len(query):
+            return None
+        similarities = self._vectors @ query
+        fresh = (time.monotonic() - self._created <= self.ttl) & (self._k == k)
+        similarities[~fresh] = -np.inf
+        row = int(np.argmax(similarities))
+        return row if similarities[row] >= self.threshold else None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(np.sum(time.monotonic() - self._created <= self.ttl)),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": self.seconds_saved,
+                "threshold": self.threshold,
+            }
+
+
+def normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def make_result_cache():
+    return SemanticResultCache(
+        threshold=float(os.environ.get("RESULT_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+        ttl=int(os.environ.get("RESULT_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+        max_entries=int(os.environ.get("RESULT_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    )
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+from .lazy import LazySingleton
+from .llm import EMBEDDING_MODEL
+from .query_builder import ALIASES, term_key
+
+
+class TagEmbeddings:
+    def __init__(self, path):
+        """
+        Precomputed embeddings of the interests and repo topics we know, written by
+        backend/scripts/buildTagEmbeddings.py. A profile made of known tags gets its query vector
+        from the table without an embeddings API call.
+
+        Args:
+        path (str): .npz file with tags, normalized float16 vectors, weights and the model name.
+        """
+        with np.load(path) as data:
+            self.model = str(data["model"])
+            tags = [str(tag) for tag in data["tags"]]
+            # Kept as float16, only the rows of a query are converted
+            self.vectors = data["vectors"]
+            self.weights = data["weights"].astype(np.float32)
+        if self.model != EMBEDDING_MODEL:
+            raise ValueError(f"Tag embeddings were made with {self.model}, queries use {EMBEDDING_MODEL}")
+        self.rows = {term_key(tag): row for row, tag in enumerate(tags)}
+        for alias, target in ALIASES.items():
+            if target in self.rows and alias not in self.rows:
+                self.rows[alias] = self.rows[target]
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def lookup(self, texts):
+        """
+        Returns:
+        tuple: (table rows of the known texts, the texts not in the table)
+        """
+        rows = []
+        unknown = []
+        for text in texts:
+            row = self.rows.get(term_key(text))
+            if row is None:
+                unknown.append(text)
+            else:
+                rows.append(row)
+        return rows, unknown
+
+    def compose(self, rows, extra_vectors=()):
+        """
+        Weighted mean of the table rows and of extra embeddings (weight 1), normalized.
+
+        Returns:
+        list[float]: The query vector, [] if there is nothing to average.
+        """
+        vectors = [self.vectors[rows].astype(np.float32)] if rows else []
+        weights = [self.weights[rows]] if rows else []
+        if len(extra_vectors):
+            extra = np.asarray(extra_vectors, dtype=np.float32)
+            vectors.append(extra / np.maximum(np.linalg.norm(extra, axis=1, keepdims=True), 1e-12))
+            weights.append(np.ones(len(extra), dtype=np.float32))
+        if not vectors:
+            return []
+        mean = np.concatenate(weights) @ np.concatenate(vectors)
+        return (mean / max(np.linalg.norm(mean), 1e-12)).tolist()
+
+
+def load_tag_embeddings():
+    path = os.environ.get("TAG_EMBEDDINGS_PATH")
+    if not path:
+        raise ValueError("TAG_EMBEDDINGS_PATH is not set")
+    return TagEmbeddings(path)
+
+
+TAG_EMBEDDINGS = LazySingleton(load_tag_embeddings)
@@ -0,0 +1,112 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, from a cached lookup up to a slow chat completion
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_request_timings = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Per instance stage duration histograms, rendered in the OpenMetrics text format so
+        p50/p95/p99 per stage can be computed with histogram_quantile.
+        """
+        self._histograms = {}
+        self._gauges = {}  # name -> callable returning {label value: number}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def register_gauge(self, name, collect):
+        """
+        Adds a gauge family read at render time, e.g. cache hit counters.
+
+        Args:
+        name (str): Metric name.
+        collect (callable): Returns {"stat": value}, exported with a stat label.
+        """
+        self._gauges[name] = collect
+
+    def render(self):
+        lines = [
+            "# TYPE issue_match_stage_seconds histogram",
+            "# UNIT issue_match_stage_seconds seconds",
+            "# HELP issue_match_stage_seconds Duration of each stage of the match pipeline.",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in histogram.buckets] + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'issue_match_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'issue_match_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+                lines.append(f'issue_match_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+        for name, collect in sorted(self._gauges.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Failed to collect {name}: {e}")
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            for stat, value in values.items():
+                lines.append(f'{name}{{stat="{stat}"}} {float(value)}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def span(stage):
+    """
+    Times the block, records it in the stage histogram and in the current request's timings.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe(stage, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def start_request():
+    """
+    Starts collecting the stage timings of the current request.
+
+    Returns:
+    dict: stage -> seconds, filled in as spans finish.
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
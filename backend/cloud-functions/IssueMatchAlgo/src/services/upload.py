@@ -0,0 +1,144 @@
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from .pdf_text import PDF_MAGIC
+
+CHUNK_SIZE = 64 * 1024
+# Everything but the resume: names, email, urls, interests and the part headers
+MAX_FIELDS_BYTES = 64 * 1024
+MAX_PARTS = 128
+RESUME_FIELD = "resume"
+LIST_FIELDS = ("urls", "interests")
+
+
+def is_multipart(content_type):
+    return parse_options_header(content_type or "")[0] == "multipart/form-data"
+
+
+class ProfileForm:
+    def __init__(self, content_type, max_resume_bytes, content_length=None):
+        """
+        Reads a multipart/form-data profile as the body arrives. The resume file is written into
+        one bytearray of at most max_resume_bytes and checked to be a PDF from its first bytes,
+        a wrong or oversized file is refused before the rest of the body is read. The other fields
+        are repeated for lists, like interests=python&interests=rust.
+
+        Args:
+        content_type (str): Content-Type header, with the boundary.
+        max_resume_bytes (int): Larger resumes are refused.
+        content_length (int): Content-Length header, a larger body is refused before reading it.
+
+        Raises:
+        ValueError: If the body is not multipart/form-data or is too large.
+        """
+        mimetype, options = parse_options_header(content_type or "")
+        boundary = options.get("boundary")
+        if mimetype != "multipart/form-data" or not boundary:
+            raise ValueError("Expected multipart/form-data with a boundary")
+        self.max_resume_bytes = max_resume_bytes
+        self.max_body_bytes = max_resume_bytes + MAX_FIELDS_BYTES
+        if content_length and content_length > self.max_body_bytes:
+            raise ValueError(f"Request is larger than {self.max_body_bytes} bytes")
+        self.fields = {}
+        self.resume = None
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"), max_parts=MAX_PARTS)
+        self._received = 0
+        self._fields_size = 0
+        self._part = None
+        self._value = None
+        self._complete = False
+
+    def feed(self, chunk):
+        """
+        Args:
+        chunk (bytes): Next piece of the body.
+        """
+        self._received += len(chunk)
+        if self._received > self.max_body_bytes:
+            raise ValueError(f"Request is larger than {self.max_body_bytes} bytes")
+        self._decoder.receive_data(chunk)
+        self._read_events()
+
+    def close(self):
+        """
+        Ends the body.
+
+        Returns:
+        tuple: (profile fields for UserProfile.from_upload, the resume bytearray or None)
+        """
+        self._decoder.receive_data(None)
+        self._read_events()
+        if not self._complete:
+            raise ValueError("Incomplete multipart/form-data body")
+        fields = {name: values if name in LIST_FIELDS else values[-1] for name, values in self.fields.items()}
+        return fields, self.resume
+
+    def _read_events(self):
+        event = self._decoder.next_event()
+        while not isinstance(event, NeedData):
+            if isinstance(event, Epilogue):
+                self._complete = True
+                break
+            if isinstance(event, File):
+                if event.name != RESUME_FIELD or self.resume is not None:
+                    raise ValueError(f"Unexpected file {event.name}")
+                self._part = event
+                self._value = self.resume = bytearray()
+            elif isinstance(event, Field):
+                self._part = event
+                self._value = bytearray()
+            elif isinstance(event, Data):
+                self._write(event.data)
+                if not event.more_data:
+                    self._end_part()
+            event = self._decoder.next_event()
+
+    def _write(self, data):
+        if self._value is self.resume:
+            if len(self.resume) + len(data) > self.max_resume_bytes:
+                raise ValueError(f"Resume is larger than {self.max_resume_bytes / 2**20:g}MB")
+            checked = len(self.resume) >= len(PDF_MAGIC)
+            self.resume += data
+            if not checked and len(self.resume) >= len(PDF_MAGIC) and not self.resume.startswith(PDF_MAGIC):
+                raise ValueError("Resume is not a PDF")
+        else:
+            self._fields_size += len(data)
+            if self._fields_size > MAX_FIELDS_BYTES:
+                raise ValueError(f"Form fields are larger than {MAX_FIELDS_BYTES} bytes")
+            self._value += data
+
+    def _end_part(self):
+        if isinstance(self._part, File):
+            # A form submitted without choosing a file sends an empty one
+            if not self.resume:
+                self.resume = None
+            elif not self.resume.startswith(PDF_MAGIC):
+                raise ValueError("Resume is not a PDF")
+        else:
+            self.fields.setdefault(self._part.name, []).append(self._value.decode("utf-8", "replace"))
+        self._part = None
+        self._value = None
+
+
+def read_profile_form(request, max_resume_bytes):
+    """
+    Reads the multipart profile of a Flask request from its stream, Flask's own form parsing is
+    not used.
+
+    Returns:
+    tuple: (profile fields, the resume bytearray or None)
+    """
+    form = ProfileForm(request.content_type, max_resume_bytes, request.content_length)
+    while chunk := request.stream.read(CHUNK_SIZE):
+        form.feed(chunk)
+    return form.close()
+
+
+async def read_profile_form_async(request, max_resume_bytes):
+    """
+    read_profile_form for a starlette request.
+    """
+    content_length = request.headers.get("content-length")
+    form = ProfileForm(request.headers.get("content-type"), max_resume_bytes, int(content_length) if content_length else None)
+    async for chunk in request.stream():
+        form.feed(chunk)
+    return form.close()
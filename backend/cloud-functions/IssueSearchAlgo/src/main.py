@@ -1,36 +1,195 @@
+import json
+import os
 import time
 import functions_framework
-from .services.db import DB
+from flask import Response
+from .services.db import DB, DEFAULT_PAGE_SIZE
+from .services.cache import SEARCH_CACHE
+from .services.lazy import warm_up_in_background
 
+RESPONSE_FORMATS = ("full", "compact", "ndjson")
+# NDJSON lines are flushed to the client in chunks of roughly this size
+NDJSON_CHUNK_BYTES = 64 * 1024
 
-def process_request():
+# An instance of the search builds its keyword index as it starts, set SEARCH_INDEX_ON_START=false
+# to leave it to the first keyword query. functions-framework sets FUNCTION_TARGET before it loads this file
+BUILD_SEARCH_INDEX = (
+    os.environ.get("FUNCTION_TARGET") == "get_issue_search"
+    and os.environ.get("SEARCH_INDEX_ON_START", "true").lower() == "true"
+)
+
+
+def warm_up():
+    DB.warm_up()
+    if BUILD_SEARCH_INDEX:
+        DB.warm_up_search_index()
+
+
+# Opt in, otherwise the Mongo pool is opened by the first search
+if BUILD_SEARCH_INDEX or os.environ.get("WARM_UP_ON_START", "").lower() == "true":
+    warm_up_in_background(warm_up)
+
+
+def _get_list_arg(args, name):
+    # Accept both ?label=a&label=b and ?label=a,b
+    values = []
+    for value in args.getlist(name):
+        values += [v.strip() for v in value.split(",") if v.strip()]
+    return values
+
+
+def parse_search_args(args):
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    response_format = args.get("format", "full")
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(RESPONSE_FORMATS)}")
+    return {
+        "labels": _get_list_arg(args, "label"),
+        "languages": _get_list_arg(args, "language"),
+        "repos": _get_list_arg(args, "repo"),
+        "topics": _get_list_arg(args, "topic"),
+        "limit": limit,
+        "cursor": args.get("cursor"),
+        "compact": response_format == "compact",
+        "query": args.get("q", "").strip(),
+    }
+
+
+def process_request(args):
     try:
-        result = DB.get_issues()
-        return result, 200
+        search_args = parse_search_args(args)
+        # Read once, the keyword index refreshes to the same version the response is cached under
+        version = DB.get_issues_version()
+        snapshot = SEARCH_CACHE.get_or_build(
+            key=json.dumps(search_args, sort_keys=True),
+            version=version,
+            build=lambda: DB.get_issues(**search_args, version=version),
+        )
+        return snapshot, 200
     except ValueError as e:
         return {"error": str(e)}, 200
     except Exception as e:
         return {"error": str(e)}, 200
 
-@functions_framework.http
-def get_issue_search(request):
-    # Set CORS headers
-    headers = {
+
+def process_export_request(args):
+    search_args = parse_search_args(args)
+    # Exports stream everything after the cursor, there are no pages
+    search_args.pop("limit")
+    search_args.pop("compact")
+    if search_args.pop("query"):
+        raise ValueError("q is not supported with format=ndjson")
+    return generate_ndjson(DB.iter_issues(**search_args))
+
+
+def generate_ndjson(issues):
+    chunk = []
+    chunk_size = 0
+    try:
+        for issue in issues:
+            line = json.dumps(issue, separators=(",", ":")) + "\n"
+            chunk.append(line)
+            chunk_size += len(line)
+            if chunk_size >= NDJSON_CHUNK_BYTES:
+                yield "".join(chunk)
+                chunk = []
+                chunk_size = 0
+    except Exception as e:
+        # The status line is already sent, so the error is reported as the last line
+        print(e)
+        chunk.append(json.dumps({"error": str(e)}) + "\n")
+    if chunk:
+        yield "".join(chunk)
+
+
+def process_facets_request():
+    try:
+        snapshot = SEARCH_CACHE.get_or_build(
+            key="facets",
+            version=DB.get_issues_version(),
+            build=DB.get_facets,
+        )
+        return snapshot, 200
+    except Exception as e:
+        return {"error": str(e)}, 200
+
+
+def make_response(request, result, status_code, headers, process_time):
+    if isinstance(result, dict):
+        result.update({'request_process_time': process_time})
+        return result, status_code, headers
+
+    encoding = result.choose_encoding(request.accept_encodings)
+    body, etag = result.encoded(encoding)
+
+    # The body is shared between requests, so the process time goes in a header instead
+    headers.update({
+        "ETag": f'"{etag}"',
+        "Cache-Control": "public, max-age=0, must-revalidate",
+        "Server-Timing": f"app;dur={process_time * 1000:.1f}",
+        "Vary": "Accept-Encoding",
+    })
+    if request.if_none_match.contains_weak(etag):
+        return "", 304, headers
+    headers["Content-Type"] = "application/json"
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return body, status_code, headers
+
+
+def _cors_headers():
+    return {
         "Access-Control-Allow-Origin": "*",
         "Access-Control-Allow-Methods": "GET, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type",
+        "Access-Control-Allow-Headers": "Content-Type, If-None-Match",
+        "Access-Control-Expose-Headers": "ETag, Server-Timing",
     }
 
-    # Handle preflight OPTIONS request
+@functions_framework.http
+def get_issue_search(request):
+    # Set CORS headers
+    headers = _cors_headers()
+
+    # Handle preflight OPTIONS request, the GET is likely to follow so start opening the pool
+    if request.method == "OPTIONS":
+        if not DB.initialized:
+            warm_up_in_background(warm_up)
+        return "", 204, headers
+
+    if request.args.get("format") == "ndjson":
+        try:
+            return Response(process_export_request(request.args), 200, headers, mimetype="application/x-ndjson")
+        except ValueError as e:
+            return {"error": str(e)}, 200, headers
+
+    try:
+        start_time = time.time()
+        result, status_code = process_request(request.args)
+        end_time = time.time()
+        return make_response(request, result, status_code, headers, end_time - start_time)
+    except Exception as e:
+        print(e)
+        return 'Something Wrong Happened', 400, headers
+
+@functions_framework.http
+def get_issue_facets(request):
+    # Set CORS headers
+    headers = _cors_headers()
+
+    # Handle preflight OPTIONS request, the GET is likely to follow so start opening the pool
     if request.method == "OPTIONS":
+        if not DB.initialized:
+            warm_up_in_background(warm_up)
         return "", 204, headers
-    
+
     try:
         start_time = time.time()
-        result, status_code = process_request()
+        result, status_code = process_facets_request()
         end_time = time.time()
-        result.update({'request_process_time': end_time - start_time})
-        return result, status_code, headers
+        return make_response(request, result, status_code, headers, end_time - start_time)
     except Exception as e:
         print(e)
-        return 'Something Wrong Happened', 400, headers
\ No newline at end of file
+        return 'Something Wrong Happened', 400, headers
@@ -0,0 +1,316 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from bson import ObjectId
+
+# Fields of an issue that are searchable, labels are lists and get joined
+INDEXED_FIELDS = ("issue_title", "summary", "labels")
+INDEX_PROJECTION = {field: 1 for field in INDEXED_FIELDS + ("updated_at",)}
+# Every sync reads the updates and tombstones of this long before its watermark again, so a write
+# that commits after a sync with an earlier timestamp, or one that raced a full build's scan, or a
+# clock slightly behind Mongo's doesn't drop below it. Re-indexing them again is harmless
+SYNC_LOOKBACK = timedelta(minutes=1)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[+#][a-z0-9+#]*)?")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have if in into is it its of on or so that the "
+    "their then there these this to was were will with when which while".split()
+)
+
+
+def tokenize(text):
+    """
+    Lower cases the text and splits it into terms. Keeps things like c++ and c# intact.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def issue_text(issue):
+    parts = []
+    for field in INDEXED_FIELDS:
+        value = issue.get(field)
+        if isinstance(value, list):
+            parts.append(" ".join(str(v) for v in value if v))
+        elif value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75):
+        """
+        In memory inverted index with Okapi BM25 ranking.
+
+        Postings are kept in dicts so documents can be added and removed one at a time, and are
+        compiled to NumPy arrays on first query so scoring a term is a handful of vector operations.
+
+        Args:
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {slot: term frequency}
+        self.doc_terms = {}  # doc_id -> distinct terms, needed to remove a document
+        self.slots = {}  # doc_id -> row in the arrays below
+        self.slot_ids = []  # row -> doc_id, None for free rows
+        self.free_slots = []
+        self.lengths = np.zeros(1024, dtype=np.float32)  # row -> number of terms
+        self.total_length = 0
+        self._compiled = {}  # term -> (rows, term frequencies) as arrays
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.slots
+
+    def doc_ids(self):
+        return list(self.slots)
+
+    def _allocate_slot(self, doc_id):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.slot_ids[slot] = doc_id
+        else:
+            slot = len(self.slot_ids)
+            self.slot_ids.append(doc_id)
+            if slot >= len(self.lengths):
+                self.lengths = np.concatenate([self.lengths, np.zeros(len(self.lengths), dtype=np.float32)])
+        self.slots[doc_id] = slot
+        return slot
+
+    def add(self, doc_id, text):
+        """
+        Adds a document, replacing it if the doc_id is already indexed.
+        """
+        if doc_id in self.slots:
+            self.remove(doc_id)
+        terms = tokenize(text)
+        slot = self._allocate_slot(doc_id)
+        self.lengths[slot] = len(terms)
+        self.total_length += len(terms)
+        frequencies = Counter(terms)
+        self.doc_terms[doc_id] = tuple(frequencies)
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[slot] = frequency
+            self._compiled.pop(term, None)
+
+    def remove(self, doc_id):
+        slot = self.slots.pop(doc_id, None)
+        if slot is None:
+            return
+        self.total_length -= int(self.lengths[slot])
+        self.lengths[slot] = 0
+        self.slot_ids[slot] = None
+        self.free_slots.append(slot)
+        for term in self.doc_terms.pop(doc_id):
+            docs = self.postings[term]
+            del docs[slot]
+            if not docs:
+                del self.postings[term]
+            self._compiled.pop(term, None)
+
+    def _compile(self, term):
+        compiled = self._compiled.get(term)
+        if compiled is None:
+            docs = self.postings[term]
+            compiled = (
+                np.fromiter(docs.keys(), dtype=np.int32, count=len(docs)),
+                np.fromiter(docs.values(), dtype=np.float32, count=len(docs)),
+            )
+            self._compiled[term] = compiled
+        return compiled
+
+    def to_state(self):
+        # Plain containers only, so a saved index doesn't depend on the module path
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "postings": self.postings,
+            "doc_terms": self.doc_terms,
+            "slots": self.slots,
+            "slot_ids": self.slot_ids,
+            "free_slots": self.free_slots,
+            "lengths": self.lengths,
+            "total_length": self.total_length,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls(k1=state["k1"], b=state["b"])
+        for key in ("postings", "doc_terms", "slots", "slot_ids", "free_slots", "lengths", "total_length"):
+            setattr(index, key, state[key])
+        return index
+
+    def search(self, query, limit=10):
+        """
+        Ranks the indexed documents against the query.
+
+        Args:
+        query (str): Free text query.
+        limit (int): Number of results.
+
+        Returns:
+        list: (doc_id, score) pairs, best first.
+        """
+        num_docs = len(self.slots)
+        if not num_docs:
+            return []
+        avg_length = self.total_length / num_docs or 1
+        norm = self.k1 * (1 - self.b)
+        length_weight = self.k1 * self.b / avg_length
+        scores = np.zeros(len(self.slot_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            rows, frequencies = self._compile(term)
+            idf = math.log(1 + (num_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            # rows are unique within a term, so fancy indexed += is safe
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norm + length_weight * self.lengths[rows])
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > limit:
+            matches = matches[np.argpartition(scores[matches], -limit)[-limit:]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(self.slot_ids[row], float(scores[row])) for row in matches]
+
+
+class IssueSearchIndex:
+    def __init__(self, path=None):
+        """
+        Keeps a BM25Index of the issues collection in sync with Mongo.
+
+        The index is built on first use, either from the file at path or from the collection.
+        Afterwards only the issues updated since the last sync are re-indexed, and the issues
+        githubApp deleted since then are read from its tombstones, so a sync costs as much as
+        the writes it catches up on. Mongo is read outside the lock searches take.
+
+        Args:
+        path (str): Optional file the index is loaded from and saved to after a full build.
+        """
+        self.path = path
+        self.index = None
+        self.version = None
+        self.synced_at = None  # Largest updated_at seen, changes after it get re-indexed
+        self.deleted_synced_at = None  # Largest deleted_at seen, tombstones after it get removed
+        self._lock = threading.RLock()
+        # One sync at a time, searches keep using the index while it reads Mongo
+        self._sync_lock = threading.Lock()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as file:
+                state = pickle.load(file)
+            self.index = BM25Index.from_state(state["index"])
+            self.synced_at = state["synced_at"]
+            self.deleted_synced_at = state.get("deleted_synced_at")
+            return True
+        except Exception as e:
+            print(f"Failed to load search index from {self.path}: {e}")
+            return False
+
+    def save(self, path=None):
+        path = path or self.path
+        with self._lock:
+            state = {"index": self.index.to_state(), "synced_at": self.synced_at, "deleted_synced_at": self.deleted_synced_at}
+            with open(path, "wb") as file:
+                pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _index_docs(self, docs):
+        for doc in docs:
+            self.index.add(str(doc["_id"]), issue_text(doc))
+            updated_at = doc.get("updated_at")
+            if updated_at and (self.synced_at is None or updated_at > self.synced_at):
+                self.synced_at = updated_at
+
+    def _remove_docs(self, tombstones):
+        for tombstone in tombstones:
+            self.index.remove(str(tombstone["_id"]))
+            deleted_at = tombstone.get("deleted_at")
+            if deleted_at and (self.deleted_synced_at is None or deleted_at > self.deleted_synced_at):
+                self.deleted_synced_at = deleted_at
+
+    def build(self, collection):
+        # Naive UTC like the datetimes pymongo reads back
+        started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        index = BM25Index()
+        docs = list(collection.find({}, INDEX_PROJECTION))
+        with self._lock:
+            self.index = index
+            self.synced_at = None
+            self.deleted_synced_at = started_at
+            self._index_docs(docs)
+
+    def reconcile(self, collection):
+        """
+        Compares the indexed ids with every id in the collection, for an index loaded from a
+        file: it may miss issues written before updated_at existed or deletions whose tombstones
+        have expired. O(issues), it only runs once per load.
+        """
+        live_ids = {str(doc["_id"]) for doc in collection.find({}, {"_id": 1})}
+        with self._lock:
+            for doc_id in [doc_id for doc_id in self.index.doc_ids() if doc_id not in live_ids]:
+                self.index.remove(doc_id)
+            missing = [doc_id for doc_id in live_ids if doc_id not in self.index]
+        if missing:
+            docs = list(collection.find({"_id": {"$in": [ObjectId(i) for i in missing]}}, INDEX_PROJECTION))
+            with self._lock:
+                self._index_docs(docs)
+
+    def sync(self, collection, tombstones=None):
+        """
+        Re-indexes issues updated since the last sync and drops issues deleted since then.
+
+        Args:
+        collection (Collection): The issues collection.
+        tombstones (Collection): {_id, deleted_at} of deleted issues, written by githubApp.
+        """
+        query = {"updated_at": {"$gte": self.synced_at - SYNC_LOOKBACK}} if self.synced_at else {"updated_at": {"$exists": True}}
+        changed = list(collection.find(query, INDEX_PROJECTION))
+        deleted = []
+        if tombstones is not None:
+            deleted_query = {"deleted_at": {"$gte": self.deleted_synced_at - SYNC_LOOKBACK}} if self.deleted_synced_at else {}
+            deleted = list(tombstones.find(deleted_query))
+        with self._lock:
+            self._index_docs(changed)
+            self._remove_docs(deleted)
+
+    def refresh(self, collection, version, tombstones=None):
+        """
+        Makes sure the index reflects the given issues version.
+
+        Args:
+        collection (Collection): The issues collection.
+        version (int | None): Current issues version, None forces a sync.
+        tombstones (Collection): Deleted issues, see sync.
+        """
+        if self.index is not None and version is not None and version == self.version:
+            return
+        with self._sync_lock:
+            if self.index is None:
+                if self._load():
+                    self.reconcile(collection)
+                    self.sync(collection, tombstones)
+                else:
+                    self.build(collection)
+                    if self.path:
+                        self.save()
+            elif version is None or version != self.version:
+                self.sync(collection, tombstones)
+            self.version = version
+
+    def search(self, query, limit):
+        with self._lock:
+            return self.index.search(query, limit) if self.index else []
+
+
+ISSUE_SEARCH_INDEX = IssueSearchIndex(path=os.environ.get("BM25_INDEX_PATH"))
@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it we only offer gzip
+    brotli = None
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 256
+# Bodies smaller than this don't shrink enough to be worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+
+class Snapshot:
+    def __init__(self, body, version):
+        """
+        A serialized response together with the issues version it was built from.
+
+        Args:
+        body (bytes): JSON encoded response body.
+        version (int | None): Issues version at build time, None if it was unknown.
+        """
+        self.body = body
+        self.version = version
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.created_at = time.monotonic()
+        self._encoded = {"identity": body}
+
+    def choose_encoding(self, accept_encodings):
+        """
+        Picks the best encoding the client accepts.
+
+        Args:
+        accept_encodings (werkzeug.datastructures.Accept): Parsed Accept-Encoding header.
+
+        Returns:
+        str: "br", "gzip" or "identity".
+        """
+        if len(self.body) < MIN_COMPRESS_BYTES:
+            return "identity"
+        offered = ["br", "gzip"] if brotli else ["gzip"]
+        return accept_encodings.best_match(offered) or "identity"
+
+    def encoded(self, encoding):
+        """
+        Returns the body in the given encoding, compressed at most once per snapshot.
+
+        Returns:
+        tuple: (body bytes, strong ETag of that representation)
+        """
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6, mtime=0)
+        etag = self.etag if encoding == "identity" else f"{self.etag}-{encoding}"
+        return self._encoded[encoding], etag
+
+
+class SnapshotCache:
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Per instance cache of serialized search responses.
+
+        An entry is served while the issues version it was built from is still current,
+        the TTL is a fallback for writes that don't bump the version.
+
+        Args:
+        ttl (int): Max age of an entry in seconds.
+        max_entries (int): Number of distinct queries kept, least recently used go first.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, snapshot, version):
+        if time.monotonic() - snapshot.created_at > self.ttl:
+            return False
+        return version is None or snapshot.version == version
+
+    def get_or_build(self, key, version, build):
+        """
+        Returns the cached snapshot for key, or builds and caches a new one.
+
+        Args:
+        key (str): Normalized query the response was built for.
+        version (int | None): Current issues version, None if it could not be read.
+        build (callable): Returns the response dict when the cache misses.
+
+        Returns:
+        Snapshot: The serialized response.
+        """
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot and self._is_fresh(snapshot, version):
+                self._entries.move_to_end(key)
+                return snapshot
+
+        # Build outside the lock so a slow query doesn't block other keys
+        body = json.dumps(build(), separators=(",", ":")).encode("utf-8")
+        snapshot = Snapshot(body, version)
+        with self._lock:
+            self._entries[key] = snapshot
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+SEARCH_CACHE = SnapshotCache(ttl=int(os.environ.get("SEARCH_CACHE_TTL", DEFAULT_TTL_SECONDS)))
@@ -1,6 +1,47 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from bson import ObjectId
+from bson.errors import InvalidId
+import base64
+import json
 import os
 from dotenv import load_dotenv
+from .lazy import LazySingleton
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+EXPORT_BATCH_SIZE = 500
+# Keyword search ranks at most this many issues, pages are cut from that list
+MAX_KEYWORD_RESULTS = 1000
+
+# Only the fields the search UI renders, everything else (summary, embedding) stays in Mongo
+SEARCH_PROJECTION = {
+    "repo_name": 1,
+    "repo_full_name": 1,
+    "repo_html_url": 1,
+    "repo_description": 1,
+    "repo_stars": 1,
+    "repo_watchers": 1,
+    "languages": 1,
+    "repo_topics": 1,
+    "issue_html_url": 1,
+    "issue_number": 1,
+    "issue_title": 1,
+    "labels": 1,
+}
+
+FACET_FIELDS = ("labels", "languages")
+
+# In the compact format these are sent once per repo instead of once per issue
+REPO_FIELDS = (
+    "repo_name",
+    "repo_full_name",
+    "repo_html_url",
+    "repo_description",
+    "repo_stars",
+    "repo_watchers",
+    "languages",
+    "repo_topics",
+)
 
 
 class DBService:
@@ -8,7 +49,11 @@ class DBService:
         self.client = MongoClient(os.environ.get("MONGODB_URI"))
         self.db =  self.client.open_match
         self.collection = self.db.issues_bot_gen
-    
+        self.versions_collection = self.db.collection_versions
+        self.facets_collection = self.db.issue_facets
+        # Ids of deleted issues, the keyword index drops them without scanning the collection
+        self.tombstones_collection = self.db.issue_tombstones
+
     def _format_db_respose(self, issue):
         try:
            return {
@@ -41,15 +86,204 @@ class DBService:
                 "labels": ["N/A"],
             }
 
-    def get_issues(self):
-        # Fetch all documents
-        results = self.collection.find({})
+    def format_compact(self, result):
+        """
+        Converts a search result to the compact format: every repo is sent once in "repos"
+        and the issue rows reference it by its index in that list.
+
+        Args:
+        result (dict): {"results": [...], ...} as returned by get_issues.
+
+        Returns:
+        dict: {"repos": [...], "results": [{"repo": int, ...}], ...}
+        """
+        repos = []
+        repo_ids = {}
+        rows = []
+        for issue in result["results"]:
+            repo_key = issue.get("repo_full_name")
+            if repo_key not in repo_ids:
+                repo_ids[repo_key] = len(repos)
+                repos.append({field: issue.get(field) for field in REPO_FIELDS})
+            row = {key: value for key, value in issue.items() if key not in REPO_FIELDS}
+            row["repo"] = repo_ids[repo_key]
+            rows.append(row)
+        return {**result, "repos": repos, "results": rows}
+
+    def _encode_cursor(self, last_id=None, offset=None):
+        # Filter pages continue after the last _id, keyword search pages at an offset in the ranking
+        payload = {"id": str(last_id)} if offset is None else {"offset": offset}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+    def _decode_cursor(self, cursor, key="id"):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            if key == "offset":
+                return max(0, int(payload["offset"]))
+            return ObjectId(payload["id"])
+        except (ValueError, KeyError, TypeError, InvalidId):
+            raise ValueError("Invalid cursor")
+
+    def _build_query(self, labels=None, languages=None, repos=None, topics=None):
+        """
+        Builds the Mongo filter for a search. Labels, languages and topics must all be
+        present on the issue (same as the old client side filters), repos is any-of.
+        """
+        query = {}
+        if labels:
+            query["labels"] = {"$all": labels}
+        if languages:
+            query["languages"] = {"$all": languages}
+        if topics:
+            query["repo_topics"] = {"$all": topics}
+        if repos:
+            query["repo_full_name"] = {"$in": repos}
+        return query
+
+    def get_issues_version(self):
+        """
+        Returns the version counter githubApp bumps on every write to issues_bot_gen.
+        This is a single _id lookup, so it is cheap enough to run on every request.
+
+        Returns:
+        int | None: The current version, None if it could not be read.
+        """
+        try:
+            doc = self.versions_collection.find_one({"_id": self.collection.name}, {"version": 1})
+            return doc.get("version", 0) if doc else 0
+        except Exception as e:
+            print(f"Failed to read issues version: {e}")
+            return None
+
+    def get_issues(self, labels=None, languages=None, repos=None, topics=None, limit=DEFAULT_PAGE_SIZE, cursor=None, compact=False, query="", version=None):
+        """
+        Returns one page of issues matching the filters, ordered by _id.
+        The filters are backed by the indexes in backend/scripts/createIndex.py.
+
+        Args:
+        labels, languages, repos, topics (list[str]): Optional filters.
+        limit (int): Page size, capped at MAX_PAGE_SIZE.
+        cursor (str): Opaque cursor returned as next_cursor by the previous page.
+        compact (bool): Return the compact format, see format_compact.
+        query (str): Optional keywords, ranks the results with BM25 instead of ordering by _id.
+        version (int): Issues version the caller already read, read again if None.
+
+        Returns:
+        dict: {"results": [...], "next_cursor": str | None}
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        mongo_filter = self._build_query(labels, languages, repos, topics)
+        if query:
+            result = self._search_issues(query, mongo_filter, limit, cursor, version)
+            return self.format_compact(result) if compact else result
+        if cursor:
+            mongo_filter["_id"] = {"$gt": self._decode_cursor(cursor)}
+
+        # Ask for one extra document so we know whether there is a next page
+        results = list(self.collection.find(mongo_filter, SEARCH_PROJECTION).sort("_id", ASCENDING).limit(limit + 1))
+        has_more = len(results) > limit
+        results = results[:limit]
+        next_cursor = self._encode_cursor(results[-1]["_id"]) if has_more else None
+
         docs = []
         for doc in results:
             doc.pop('_id', None)  # Remove '_id' if it exists
             docs.append(self._format_db_respose(doc))
-        return {"results": docs}
+        result = {"results": docs, "next_cursor": next_cursor}
+        return self.format_compact(result) if compact else result
+
+    def _search_issues(self, query, mongo_filter, limit, cursor, version=None):
+        """
+        Returns one page of issues ranked by BM25 over title, summary and labels.
+        The ranking comes from the in process index, Mongo only applies the filters
+        and loads the page.
+        """
+        # numpy is only loaded by keyword queries
+        from .bm25 import ISSUE_SEARCH_INDEX
+
+        offset = self._decode_cursor(cursor, key="offset") if cursor else 0
+        if version is None:
+            version = self.get_issues_version()
+        ISSUE_SEARCH_INDEX.refresh(self.collection, version, self.tombstones_collection)
+        ranked = ISSUE_SEARCH_INDEX.search(query, MAX_KEYWORD_RESULTS)
+        if mongo_filter and ranked:
+            candidate_ids = [ObjectId(doc_id) for doc_id, _ in ranked]
+            allowed = {str(doc["_id"]) for doc in self.collection.find({**mongo_filter, "_id": {"$in": candidate_ids}}, {"_id": 1})}
+            ranked = [(doc_id, score) for doc_id, score in ranked if doc_id in allowed]
+
+        page = ranked[offset:offset + limit]
+        docs_by_id = {
+            str(doc["_id"]): doc
+            for doc in self.collection.find({"_id": {"$in": [ObjectId(doc_id) for doc_id, _ in page]}}, SEARCH_PROJECTION)
+        }
+        docs = []
+        for doc_id, score in page:
+            doc = docs_by_id.get(doc_id)
+            if doc:  # Deleted since the index was refreshed
+                docs.append({**self._format_db_respose(doc), "score": round(score, 4)})
+
+        has_more = len(ranked) > offset + limit
+        next_cursor = self._encode_cursor(offset=offset + limit) if has_more else None
+        return {"results": docs, "next_cursor": next_cursor}
+
+    def iter_issues(self, labels=None, languages=None, repos=None, topics=None, cursor=None, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Returns an iterator over every issue matching the filters, ordered by _id.
+
+        Unlike get_issues nothing is collected in memory, the Mongo cursor hands over
+        batch_size documents at a time. Used for bulk exports.
+
+        Args:
+        labels, languages, repos, topics (list[str]): Optional filters.
+        cursor (str): Optional cursor from get_issues to start after.
+        batch_size (int): Documents fetched per round-trip.
+        """
+        query = self._build_query(labels, languages, repos, topics)
+        if cursor:
+            query["_id"] = {"$gt": self._decode_cursor(cursor)}
+
+        results = self.collection.find(query, SEARCH_PROJECTION).sort("_id", ASCENDING).batch_size(batch_size)
+        return self._iter_formatted(results)
+
+    def _iter_formatted(self, results):
+        try:
+            for doc in results:
+                doc.pop('_id', None)  # Remove '_id' if it exists
+                yield self._format_db_respose(doc)
+        finally:
+            results.close()
+
+    def get_facets(self):
+        """
+        Returns the label and language counts githubApp maintains in issue_facets.
+        This reads one small document per facet and never touches the issues themselves.
+
+        Returns:
+        dict: {"labels": [{"name": str, "count": int}], "languages": [...]}, most common first.
+        """
+        facets = {field: [] for field in FACET_FIELDS}
+        results = self.facets_collection.find({"count": {"$gt": 0}}, {"_id": 0, "field": 1, "value": 1, "count": 1})
+        for doc in results.sort([("count", DESCENDING), ("value", ASCENDING)]):
+            if doc.get("field") in facets:
+                facets[doc["field"]].append({"name": doc.get("value"), "count": doc.get("count")})
+        return facets
+
+    def warm_up(self):
+        """
+        Opens a pooled connection ahead of the first request.
+        """
+        self.client.admin.command("ping")
+
+    def warm_up_search_index(self):
+        """
+        Builds (or loads) the keyword index ahead of the first keyword query, which would
+        otherwise scan the whole collection on its request path.
+        """
+        from .bm25 import ISSUE_SEARCH_INDEX
+
+        ISSUE_SEARCH_INDEX.refresh(self.collection, self.get_issues_version(), self.tombstones_collection)
+
 
 # Load environment variables
 load_dotenv()
-DB = DBService()
+DB = LazySingleton(DBService)
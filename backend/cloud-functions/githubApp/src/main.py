@@ -10,7 +10,8 @@ import hmac
 import os
 import functions_framework
 from dotenv import load_dotenv
-from .logging.logger import central_logger
+from .logging.logger import central_logger, flush_logs
+from .services.lazy import warm_up_in_background
 from .services.mongodb import mongo_handler
 
 load_dotenv()
@@ -22,6 +23,10 @@ REMOVE_ACTIONS = ["closed", "locked"]
 UPDATE_ACTIONS = ["labeled", "unlabeled", "edited"]
 VALID_ACTIONS = CREATE_ACTIONS + REMOVE_ACTIONS + UPDATE_ACTIONS + UNINSTALL_ACTIONS + INSTALL_ACTIONS
 
+# Opt in, otherwise the Mongo pool is opened by the first webhook that needs it
+if os.environ.get("WARM_UP_ON_START", "").lower() == "true":
+    warm_up_in_background(lambda: mongo_handler.warm_up())
+
 def verify_github_signature(request):
     """Verify that the request is coming from GitHub by checking the signature."""
     signature_header = request.headers.get('X-Hub-Signature-256')
@@ -84,6 +89,7 @@ def process_request(payload):
         return False
 
 @functions_framework.http
+@flush_logs
 def github_webhook(request):
     """Handle GitHub webhook payload with signature verification."""
     # Verify the GitHub signature
@@ -99,8 +105,8 @@ def github_webhook(request):
         
         if payload.get("action") not in VALID_ACTIONS:
             print("Rejecting payload:", payload)
-            {"status": "success", "message": "Payload received, but not useful"}, 200
             central_logger.info("Payload received, but not useful")
+            return {"status": "success", "message": "Payload received, but not useful"}, 200
 
         process_request(payload=payload)
 
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+DEFAULT_MEMORY_ENTRIES = 2048
+
+
+def normalize_text(text):
+    """
+    Normalizes text before hashing so that whitespace and unicode form differences
+    don't cause a cache miss. The text sent to the API is not changed.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(text, model, dimensions=None):
+    payload = f"{model}\0{dimensions or ''}\0{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def pack(vector):
+    return array("f", vector).tobytes()
+
+
+def unpack(data):
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class MemoryTier:
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            for key, vector in items.items():
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SqliteTier:
+    def __init__(self, path):
+        """
+        Persistent tier in a local SQLite file, for scripts and single machine runs.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._connection.commit()
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", list(keys)).fetchall()
+        return {key: unpack(vector) for key, vector in rows}
+
+    def set_many(self, items):
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, pack(vector)) for key, vector in items.items()],
+            )
+            self._connection.commit()
+
+
+class MongoTier:
+    def __init__(self, collection):
+        """
+        Persistent tier in a Mongo collection, shared by every function instance.
+        """
+        self.collection = collection
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        return {doc["_id"]: unpack(doc["vector"]) for doc in self.collection.find({"_id": {"$in": list(keys)}})}
+
+    def set_many(self, items):
+        now = datetime.now(timezone.utc)
+        updates = [
+            UpdateOne({"_id": key}, {"$setOnInsert": {"vector": Binary(pack(vector)), "created_at": now}}, upsert=True)
+            for key, vector in items.items()
+        ]
+        if updates:
+            self.collection.bulk_write(updates, ordered=False)
+
+
+class EmbeddingCache:
+    def __init__(self, memory_entries=DEFAULT_MEMORY_ENTRIES, store=None):
+        """
+        Content addressed embedding cache, keyed by model + dimensions + normalized text.
+
+        Lookups go to an in memory LRU first and then to the optional persistent store.
+        A failing store is logged and skipped, it never fails the embedding call.
+
+        Args:
+        memory_entries (int): Size of the in memory LRU.
+        store (SqliteTier | MongoTier): Optional persistent tier.
+        """
+        self.memory = MemoryTier(memory_entries)
+        self.store = store
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def _count(self, memory_hits=0, store_hits=0, misses=0):
+        with self._stats_lock:
+            self.memory_hits += memory_hits
+            self.store_hits += store_hits
+            self.misses += misses
+
+    def get_or_create(self, texts, model, create, dimensions=None):
+        """
+        Returns one embedding per text, only the texts that are not cached are sent to create.
+
+        Args:
+        texts (list[str]): Texts to embed.
+        model (str): Embedding model, part of the key.
+        create (callable): Takes the list of missing texts and returns their embeddings in order.
+        dimensions (int): Requested dimensions, part of the key.
+
+        Returns:
+        list[list[float]]: Embeddings in the order of texts.
+        """
+        keys, found, to_create, hits = self._lookup(texts, model, dimensions)
+        if to_create:
+            found.update(self._save(dict(zip(to_create, create(list(to_create.values()))))))
+        self._count(misses=len(to_create), **hits)
+        return [found[key] for key in keys]
+
+    async def get_or_create_async(self, texts, model, create, dimensions=None):
+        """
+        get_or_create for a coroutine create, the store is read and written in a worker thread
+        so a slow store doesn't block the event loop.
+        """
+        keys, found, to_create, hits = await asyncio.to_thread(self._lookup, texts, model, dimensions)
+        if to_create:
+            created = dict(zip(to_create, await create(list(to_create.values()))))
+            found.update(await asyncio.to_thread(self._save, created))
+        self._count(misses=len(to_create), **hits)
+        return [found[key] for key in keys]
+
+    def _lookup(self, texts, model, dimensions):
+        keys = [cache_key(text, model, dimensions) for text in texts]
+        found = self.memory.get_many(set(keys))
+        memory_hits = len(found)
+
+        missing = {key for key in keys if key not in found}
+        store_found = {}
+        if missing and self.store is not None:
+            try:
+                store_found = self.store.get_many(missing)
+            except Exception as e:
+                print(f"Embedding cache store lookup failed: {e}")
+            self.memory.set_many(store_found)
+            found.update(store_found)
+
+        # Identical texts in one call are only embedded once
+        to_create = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in to_create:
+                to_create[key] = text
+        return keys, found, to_create, {"memory_hits": memory_hits, "store_hits": len(store_found)}
+
+    def _save(self, created):
+        self.memory.set_many(created)
+        if self.store is not None:
+            try:
+                self.store.set_many(created)
+            except Exception as e:
+                print(f"Embedding cache store write failed: {e}")
+        return created
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.memory_hits + self.store_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.store_hits) / lookups if lookups else 0.0,
+            }
+
+
+def make_embedding_cache(collection=None):
+    """
+    Builds the cache from the environment. EMBEDDING_CACHE_STORE picks the persistent tier:
+    "mongo" (default, the given collection, pass one of the caller's client so no second
+    connection pool is opened), "sqlite" (EMBEDDING_CACHE_PATH) or "memory".
+    """
+    store_type = os.environ.get("EMBEDDING_CACHE_STORE", "mongo")
+    memory_entries = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", DEFAULT_MEMORY_ENTRIES))
+    store = None
+    if store_type == "sqlite":
+        store = SqliteTier(os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3"))
+    elif store_type == "mongo" and collection is not None:
+        store = MongoTier(collection)
+    return EmbeddingCache(memory_entries=memory_entries, store=store)
@@ -0,0 +1,34 @@
+from langchain_core.embeddings import Embeddings
+from .embedding_cache import make_embedding_cache
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, cache):
+        """
+        Wraps a LangChain embeddings model with the content addressed embedding cache,
+        so re-indexing a repo only pays for files whose content changed.
+
+        Args:
+        embeddings (OpenAIEmbeddings): The model to call on a cache miss.
+        cache (EmbeddingCache): The cache to read and fill.
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def _get_or_create(self, texts):
+        return self.cache.get_or_create(
+            texts,
+            model=self.embeddings.model,
+            dimensions=getattr(self.embeddings, "dimensions", None),
+            create=self.embeddings.embed_documents,
+        )
+
+    def embed_documents(self, texts):
+        return self._get_or_create(list(texts))
+
+    def embed_query(self, text):
+        return self._get_or_create([text])[0]
+
+
+def make_cached_embeddings(embeddings, collection=None):
+    return CachedEmbeddings(embeddings, make_embedding_cache(collection=collection))
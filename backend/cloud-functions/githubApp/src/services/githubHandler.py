@@ -1,8 +1,7 @@
 import os
 import requests
 from ..logging.logger import central_logger
-from langchain_community.document_loaders import GithubFileLoader
-from langchain_core.documents import Document
+from .lazy import LazySingleton
 from dotenv import load_dotenv
 
 LANGUAGE_EXTENSTIONS = (
@@ -129,6 +128,10 @@ class GitHubHandler:
         Returns:
         documents: of repo files
         """
+        # langchain is only loaded when a repo is indexed
+        from langchain_community.document_loaders import GithubFileLoader
+        from langchain_core.documents import Document
+
         try:
             loader = GithubFileLoader(
                 repo=repo,  # the repo name
@@ -161,4 +164,4 @@ load_dotenv()
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 
 # Instantiate handlers
-github_handler = GitHubHandler(github_token=GITHUB_TOKEN)
\ No newline at end of file
+github_handler = LazySingleton(lambda: GitHubHandler(github_token=GITHUB_TOKEN))
\ No newline at end of file
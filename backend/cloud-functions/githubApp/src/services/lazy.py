@@ -0,0 +1,48 @@
+import threading
+
+
+class LazySingleton:
+    def __init__(self, factory):
+        """
+        Builds the wrapped object on first attribute access, once, even with concurrent requests.
+
+        Module level singletons are wrapped in it so importing a module doesn't open clients,
+        a preflight or a rejected request never pays for them.
+
+        Args:
+        factory (callable): Returns the object to wrap.
+        """
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def warm_up_in_background(warm_up):
+    """
+    Runs warm_up on a daemon thread, errors are printed and otherwise ignored.
+    """
+    def run():
+        try:
+            warm_up()
+        except Exception as e:
+            print(f"Warm up failed: {e}")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -1,5 +1,8 @@
-from langchain_openai import ChatOpenAI
+import os
 from dotenv import load_dotenv
+from .lazy import LazySingleton
+from .prompt_budget import PromptBuilder
+from ..logging.logger import central_logger
 
 SYSTEM_PROMPT = """
 You are an AI assistant tasked with providing a comprehensive summary of an issue. You will be given documents from vector store that has the code base, these documents might be of use.
@@ -7,12 +10,19 @@ Using the information provided to you come up with a summary on what the issue i
 If you have enough information to solve this for the user please reply with just the solution. Keep your summary less than 200 words.
 """
 MODEL = "gpt-4o-mini"
+# Input tokens of an issue summary prompt, the documents are cut to what is left after the issue
+ISSUE_SUMMARY_PROMPT_TOKENS = 6000
+# The issue text comes from GitHub, a huge body shouldn't leave no room for the code
+ISSUE_MAX_TOKENS = 1500
 
 
 class LLMService:
     def __init__(self):
+        from langchain_openai import ChatOpenAI
+
         load_dotenv()
         self.client = ChatOpenAI(model=MODEL)
+        self.summary_prompt_tokens = int(os.environ.get("ISSUE_SUMMARY_PROMPT_TOKENS", ISSUE_SUMMARY_PROMPT_TOKENS))
 
     def get_issue_summary(self, issues, relevant):
         """
@@ -26,10 +36,27 @@ class LLMService:
         Returns:
             str: A detailed summary including the nature of the issue and possible steps to fix it.
         """
+        relevant = relevant or []
+        builder = (
+            PromptBuilder("issue_summary", self.summary_prompt_tokens)
+            .add("system", SYSTEM_PROMPT, priority=0)
+            .add("issue", f"Issue Description:\n{issues}", priority=1, max_tokens=ISSUE_MAX_TOKENS)
+        )
+        # In the order of the vector search, the best matches are kept whole and the last ones cut or left out
+        for index, document in enumerate(relevant):
+            builder.add(f"document_{index}", document, priority=2)
+        prompt = builder.build()
+        documents = [prompt[f"document_{index}"] for index in range(len(relevant)) if prompt[f"document_{index}"]]
+        # Diagnostics, only a cut prompt is worth a Slack message
+        if builder.truncated:
+            central_logger.info(f"Issue summary prompt has {builder.tokens} tokens, truncated {builder.truncated}")
+        else:
+            central_logger.debug_print(f"Issue summary prompt has {builder.tokens} tokens")
+
         # Combine the inputs into a clear user prompt
-        user_input = f"Issue Description:\n{issues}\n\nRelevant Documents:\n{relevant}"
+        user_input = prompt["issue"] + "\n\nRelevant Documents:\n" + "\n\n".join(documents)
         messages = [
-            ("system", SYSTEM_PROMPT),
+            ("system", prompt["system"]),
             ("user", user_input)
         ]
 
@@ -37,4 +64,4 @@ class LLMService:
         return response.content
 
 
-llm_service = LLMService()
+llm_service = LazySingleton(LLMService)
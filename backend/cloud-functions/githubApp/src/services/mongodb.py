@@ -1,12 +1,18 @@
 import os
 import time
+from collections import Counter
+from bson import ObjectId
 from ..logging.logger import central_logger
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from .githubHandler import github_handler
+from .lazy import LazySingleton
 from .llm import llm_service
-from langchain_community.vectorstores import MongoDBAtlasVectorSearch
-from langchain_openai import OpenAIEmbeddings
+
+# Issue fields the search UI can filter on, their value counts are kept in issue_facets
+FACET_FIELDS = ("labels", "languages")
+# With the _id, a removed issue's tombstone needs it
+FACET_PROJECTION = {field: 1 for field in FACET_FIELDS}
+
 
 class MongoDBHandler:
     def __init__(self, db_uri, github_handler, llm_service):
@@ -17,15 +23,25 @@ class MongoDBHandler:
         db_uri (str): MongoDB connection URI.
         github_handler (GitHubHandler): Instance of GitHubHandler for API interactions.
         """
+        # pymongo, numpy and langchain are imported on first use so rejected webhooks stay cheap
+        from pymongo import MongoClient
+        from langchain_openai import OpenAIEmbeddings
+        from .embeddings import make_cached_embeddings
+        from .vectorstore import make_vector_store
+
         client = MongoClient(db_uri)
         self.db = client.open_match
         self.issues_collection = self.db.issues_bot_gen
         self.repo_collection = self.db.repo
+        self.versions_collection = self.db.collection_versions
+        self.facets_collection = self.db.issue_facets
+        self.tombstones_collection = self.db.issue_tombstones
         self.repo_source_code_collection = self.db.repo_source_code
         self.repo_source_code_index = "source_code_knn_search"
+        self.repo_source_code_store = make_vector_store(self.repo_source_code_collection, index=self.repo_source_code_index)
         self.github_handler = github_handler
         self.llm_service = llm_service
-        self.embedding_function =  OpenAIEmbeddings()
+        self.embedding_function = make_cached_embeddings(OpenAIEmbeddings(), collection=self.db.embedding_cache)
 
     def build_issue_object(self, repo, issue, summary):
         """
@@ -123,7 +139,12 @@ class MongoDBHandler:
         if repo_details:
             summary = self.generate_issue_summary(issue, repo_name)
             issue_obj = self.build_issue_object(repo_details, issue, summary)
-            self.issues_collection.insert_one(issue_obj)
+            # Stamped with Mongo's clock like update_issue, the keyword index of IssueSearchAlgo syncs by updated_at
+            self.issues_collection.update_one(
+                {"_id": ObjectId()}, {"$setOnInsert": issue_obj, "$currentDate": {"updated_at": True}}, upsert=True
+            )
+            self._apply_facet_deltas(self._facet_deltas(issue_obj, 1))
+            self._bump_issues_version()
             central_logger.info(f"Added issue #{issue['number']} from {repo_name} to the database.")
         else:
             central_logger.warning(f"Failed to add issue #{issue.get('number')} from {repo_name}.")
@@ -148,9 +169,12 @@ class MongoDBHandler:
                     "repo_full_name": repo_full_name,
                     "issue_number": issue_number
                 }
-                # Attempt to delete the document
-                result = self.issues_collection.delete_one(filter_query)
-                if result.deleted_count > 0:
+                # Attempt to delete the document, we need its labels and languages for the facet counts
+                removed = self.issues_collection.find_one_and_delete(filter_query, projection=FACET_PROJECTION)
+                if removed:
+                    self._record_deletions([removed["_id"]])
+                    self._apply_facet_deltas(self._facet_deltas(removed, -1))
+                    self._bump_issues_version()
                     central_logger.info(f"Removed issue #{issue_number} from {repo_full_name} from the database.")
                 else:
                     central_logger.warning(f"Issue #{issue_number} not found in {repo_full_name}. No action taken.")
@@ -158,12 +182,21 @@ class MongoDBHandler:
                 filter_query = {
                     "repo_full_name": repo_full_name,
                 }
-                result = self.issues_collection.delete_many(filter_query)
+                deltas = Counter()
+                removed_ids = []
+                for removed in self.issues_collection.find(filter_query, FACET_PROJECTION):
+                    deltas.update(self._facet_deltas(removed, -1))
+                    removed_ids.append(removed["_id"])
+                # Only the issues counted above, one added meanwhile stays with its facets and tombstone free
+                result = self.issues_collection.delete_many({"_id": {"$in": removed_ids}})
 
                 if result.deleted_count > 0:
+                    self._record_deletions(removed_ids)
+                    self._apply_facet_deltas(deltas)
+                    self._bump_issues_version()
                     central_logger.info(f"Removed {result.deleted_count} issues from {repo_full_name} from the database.")
                 else:
-                    central_logger.warning(f"Failed to remove issue #{issue.get('number', "0")} from {repo_name}: {e}")
+                    central_logger.warning(f"No issues found for {repo_full_name}. No action taken.")
         except Exception as e:
             central_logger.severe(f"Failed to remove issues from {repo_name}: {e}")
 
@@ -193,22 +226,111 @@ class MongoDBHandler:
             "labels": [label.get("name") for label in issue.get("labels", [])],
             }
 
-            # Define the update operation to replace the labels
+            # Define the update operation to replace the labels, updated_at lets readers sync incrementally
             update_operation = {
-                "$set": update
+                "$set": update,
+                "$currentDate": {"updated_at": True},
             }
 
-            # Attempt to update the document
-            result = self.issues_collection.update_one(filter_query, update_operation)
+            # Attempt to update the document, the previous version tells us how the labels changed
+            from pymongo import ReturnDocument
 
-            if result.matched_count > 0:
+            previous = self.issues_collection.find_one_and_update(
+                filter_query,
+                update_operation,
+                projection={"_id": 0, **{key: 1 for key in update}},
+                return_document=ReturnDocument.BEFORE,
+            )
+
+            if previous is not None:
+                if any(previous.get(key) != value for key, value in update.items()):
+                    deltas = Counter(self._facet_deltas({"labels": update["labels"]}, 1))
+                    deltas.update(self._facet_deltas({"labels": previous.get("labels")}, -1))
+                    self._apply_facet_deltas(deltas)
+                    self._bump_issues_version()
                 central_logger.info(f"Updated issue #{issue_number} in {repo_full_name} with {update}.")
             else:
                 central_logger.warning(f"Issue #{issue_number} not found in {repo_full_name}. No action taken.")
         except Exception as e:
             central_logger.warning(f"Failed to update issue #{issue.get('number')} in {repo_name}: {e}")
 
+    def _record_deletions(self, issue_ids):
+        """
+        Writes a tombstone per deleted issue, IssueSearchAlgo's keyword index drops the issues
+        deleted since its last sync without scanning the collection. A TTL index on deleted_at
+        (backend/scripts/createIndex.py) removes old ones.
+        """
+        from pymongo import UpdateOne
+
+        try:
+            self.tombstones_collection.bulk_write(
+                [UpdateOne({"_id": issue_id}, {"$currentDate": {"deleted_at": True}}, upsert=True) for issue_id in issue_ids],
+                ordered=False,
+            )
+        except Exception as e:
+            # The index reconciles all ids when it is next loaded from a file or rebuilt
+            central_logger.warning(f"Failed to record deleted issues: {e}")
+
+    def _bump_issues_version(self):
+        """
+        Bumps the version counter of the issues collection. IssueSearchAlgo compares it
+        against its cached responses, so every write to issues_bot_gen should call this, after
+        the facet counts are updated so a facets response cached under the new version has them.
+        """
+        try:
+            self.versions_collection.update_one(
+                {"_id": self.issues_collection.name},
+                {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+                upsert=True,
+            )
+        except Exception as e:
+            # Readers fall back to their cache TTL, so this is not worth failing the write for
+            central_logger.warning(f"Failed to bump the issues version: {e}")
+
+    def _facet_deltas(self, issue, delta):
+        """
+        Builds the facet count changes for adding (delta=1) or removing (delta=-1) an issue.
+
+        Args:
+        issue (dict): Issue document, only the FACET_FIELDS are read.
+        delta (int): +1 or -1.
+
+        Returns:
+        Counter: (field, value) -> change in count.
+        """
+        deltas = Counter()
+        for field in FACET_FIELDS:
+            for value in set(issue.get(field) or []):
+                deltas[(field, value)] += delta
+        return deltas
+
+    def _apply_facet_deltas(self, deltas):
+        """
+        Applies facet count changes with $inc and drops facets that reached zero.
+        The counts can drift if this fails, backend/scripts/rebuildFacets.py repairs them.
+        """
+        from pymongo import UpdateOne
+
+        updates = [
+            UpdateOne(
+                {"_id": f"{field}:{value}"},
+                {"$inc": {"count": delta}, "$setOnInsert": {"field": field, "value": value}},
+                upsert=True,
+            )
+            for (field, value), delta in deltas.items()
+            if delta != 0
+        ]
+        if not updates:
+            return
+        try:
+            self.facets_collection.bulk_write(updates, ordered=False)
+            self.facets_collection.delete_many({"count": {"$lte": 0}})
+        except Exception as e:
+            central_logger.warning(f"Failed to update issue facets: {e}")
+
     def make_vector_store_embedding(self, repo_name, repo_details, collection):
+        from langchain_community.vectorstores import MongoDBAtlasVectorSearch
+
         try:
             start = time.time()
             documents = github_handler.get_repo_files(repo=repo_name,repo_details=repo_details)
@@ -218,6 +340,7 @@ class MongoDBHandler:
             )
             stop = time.time()
             central_logger.info(f"Successfully loaded {len(documents)} documents to vector store for repo {repo_name} in {stop - start} seconds")
+            central_logger.debug_print(f"Embedding cache stats {self.embedding_function.cache.stats()}")
         except Exception as e:
             central_logger.severe(f"Unable to load documents to vector store for repo {repo_name}")
             print(e)
@@ -225,18 +348,12 @@ class MongoDBHandler:
     def perform_vector_search(self, query, repo_name, k=5):
         try:
             query_embedding = self.embedding_function.embed_query(query)
-            # Create the vector store
-            results = self.repo_source_code_collection.aggregate([
-                # Vector search stage
-                {"$vectorSearch": {
-                    "queryVector": query_embedding,
-                    "path": "embedding",
-                    "numCandidates": 100,
-                    "limit": k,
-                    "index": self.repo_source_code_index,
-                    "filter": {"repo_name": repo_name}  # Match stage to filter by repo_name
-                }}
-            ])
+            results = self.repo_source_code_store.search(
+                query_embedding,
+                k=k,
+                num_candidates=100,
+                filter={"repo_name": repo_name},  # Only search the files of this repo
+            )
             docs = []
             for doc in results:
                 docs.append(doc['text'])
@@ -251,6 +368,12 @@ class MongoDBHandler:
         central_logger.info(f"For the Issue {query}, here are our relevant document information {get_relevant_docs}")
         return self.llm_service.get_issue_summary(query, get_relevant_docs)
     
+    def warm_up(self):
+        """
+        Opens a pooled connection ahead of the first webhook.
+        """
+        self.db.client.admin.command("ping")
+
     def _issue_to_text(self, issue) -> str:
         #TODO: convert this issue into proper text
         return issue.get('title', 'Could not get issue') #FIXME
@@ -260,4 +383,4 @@ class MongoDBHandler:
 # Load environment variables
 load_dotenv()
 MONGO_DB_URI = os.getenv("MONGO_DB_URI")
-mongo_handler = MongoDBHandler(db_uri=MONGO_DB_URI, github_handler=github_handler, llm_service=llm_service)
+mongo_handler = LazySingleton(lambda: MongoDBHandler(db_uri=MONGO_DB_URI, github_handler=github_handler, llm_service=llm_service))
@@ -0,0 +1,418 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from bson.binary import Binary
+
+VECTORS_FILE = "vectors.f32"
+DOCS_FILE = "docs.jsonl"
+META_FILE = "meta.json"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ASSIGNMENTS_FILE = "ivf_assignments.npy"
+
+# How embeddings are stored in Mongo: "array" of doubles, or a BSON vector (binary subtype 9)
+# of packed float32 or int8 values. Stored and query vectors must use the same encoding.
+EMBEDDING_ENCODINGS = ("array", "float32", "int8")
+VECTOR_SUBTYPE = 9
+FLOAT32_DTYPE = 0x27
+INT8_DTYPE = 0x03
+# The ANN index is asked for this many times more candidates than documents it returns
+ANN_OVERSAMPLING = 10
+MAX_NUM_CANDIDATES = 10000
+# Queries scored per matrix product in LocalVectorStore.search_many, bounds the similarity matrix
+QUERY_CHUNK_SIZE = 256
+
+
+class VectorStore:
+    """
+    k-NN search over documents with an embedding. Every backend returns the matched
+    documents without their stored embedding, best first, with a "score" of (1 + cosine) / 2
+    like Atlas reports cosine scores.
+    """
+
+    def search(self, query_vector, k, num_candidates=100, filter=None, with_vectors=False):
+        """
+        Args:
+        query_vector (list[float]): Query embedding.
+        k (int): Number of documents to return.
+        num_candidates (int): Candidates considered by approximate backends.
+        filter (dict): Optional equality filter on document fields, e.g. {"repo_name": "a/b"}.
+        with_vectors (bool): Add the decoded embedding as "vector" (float32 array), for re-ranking.
+
+        Returns:
+        list[dict]: Matched documents.
+        """
+        raise NotImplementedError
+
+    def search_many(self, query_vectors, k, num_candidates=100, filter=None, with_vectors=False, max_workers=8):
+        """
+        Runs search for every query vector, at most max_workers at a time.
+
+        Returns:
+        list: Per query the matched documents, or the exception its search raised.
+        """
+        def search_one(query_vector):
+            try:
+                return self.search(query_vector, k, num_candidates=num_candidates, filter=filter, with_vectors=with_vectors)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(search_one, query_vectors))
+
+    async def search_async(self, query_vector, k, num_candidates=100, filter=None, with_vectors=False):
+        """
+        search for the asyncio request path. Backends without an async driver search in a worker
+        thread so the event loop keeps serving other requests.
+        """
+        return await asyncio.to_thread(
+            self.search, query_vector, k, num_candidates=num_candidates, filter=filter, with_vectors=with_vectors
+        )
+
+
+class AtlasVectorStore(VectorStore):
+    def __init__(self, collection, index, path="embedding", encoding="array", async_collection=None):
+        """
+        Runs $vectorSearch against a MongoDB Atlas vector index.
+
+        Args:
+        collection (Collection): Collection holding the documents.
+        index (str): Name of the Atlas vector search index.
+        path (str): Field holding the embedding.
+        encoding (str): How the embeddings are stored, one of EMBEDDING_ENCODINGS.
+        async_collection (AsyncCollection): The same collection through AsyncMongoClient, for search_async.
+        """
+        self.collection = collection
+        self.index = index
+        self.path = path
+        self.encoding = encoding
+        self.async_collection = async_collection
+
+    def search(self, query_vector, k, num_candidates=100, filter=None, with_vectors=False):
+        docs = list(self.collection.aggregate(self._pipeline(query_vector, k, num_candidates, filter, with_vectors)))
+        return self._decode(docs, with_vectors)
+
+    async def search_async(self, query_vector, k, num_candidates=100, filter=None, with_vectors=False):
+        if self.async_collection is None:
+            return await super().search_async(query_vector, k, num_candidates=num_candidates, filter=filter, with_vectors=with_vectors)
+        cursor = await self.async_collection.aggregate(self._pipeline(query_vector, k, num_candidates, filter, with_vectors))
+        return self._decode(await cursor.to_list(), with_vectors)
+
+    def _pipeline(self, query_vector, k, num_candidates, filter, with_vectors):
+        vector_search = {
+            "queryVector": encode_vector(query_vector, self.encoding)[0],
+            "path": self.path,
+            # Asking for many documents shouldn't starve the ANN search of candidates
+            "numCandidates": min(max(num_candidates, k * ANN_OVERSAMPLING), MAX_NUM_CANDIDATES),
+            "limit": k,
+            "index": self.index,
+        }
+        if filter:
+            vector_search["filter"] = filter
+        score = {"$set": {"score": {"$meta": "vectorSearchScore"}}}
+        # Drop the embedding on the server unless it is needed, it is most of the document
+        project = {"$project": {"_id": 0}} if with_vectors else {"$project": {"_id": 0, self.path: 0, scale_field(self.path): 0}}
+        return [{"$vectorSearch": vector_search}, score, project]
+
+    def _decode(self, docs, with_vectors):
+        if with_vectors:
+            for doc in docs:
+                doc["vector"] = decode_vector(doc.pop(self.path), doc.pop(scale_field(self.path), None))
+        return docs
+
+
+class TwoStageVectorStore(VectorStore):
+    def __init__(self, collection, index, dimensions, short_path="embedding_short", path="embedding", encoding="array", async_collection=None):
+        """
+        Finds candidates with $vectorSearch over a shortened copy of the embedding, then re-ranks
+        them in process against the full embedding.
+
+        text-embedding-3 embeddings keep most of their meaning in the leading dimensions, so the
+        ANN index only needs the first few hundred and is several times smaller and faster.
+        The full vectors of the candidates are fetched for the re-rank, see
+        backend/scripts/migrateEmbeddings.py --short-dimensions to add the short copy.
+
+        Args:
+        collection (Collection): Collection holding the documents.
+        index (str): Atlas vector index over short_path.
+        dimensions (int): Dimensions of the short copy.
+        short_path (str): Field holding the short copy.
+        path (str): Field holding the full embedding.
+        encoding (str): How both embeddings are stored, one of EMBEDDING_ENCODINGS.
+        async_collection (AsyncCollection): The same collection through AsyncMongoClient, for search_async.
+        """
+        self.collection = collection
+        self.index = index
+        self.dimensions = dimensions
+        self.short_path = short_path
+        self.path = path
+        self.encoding = encoding
+        self.async_collection = async_collection
+
+    def search(self, query_vector, k, num_candidates=100, filter=None, with_vectors=False):
+        query = normalize(np.asarray(query_vector, dtype=np.float32))
+        docs = list(self.collection.aggregate(self._pipeline(query, k, num_candidates, filter)))
+        return self._rerank(docs, query, k, with_vectors)
+
+    async def search_async(self, query_vector, k, num_candidates=100, filter=None, with_vectors=False):
+        if self.async_collection is None:
+            return await super().search_async(query_vector, k, num_candidates=num_candidates, filter=filter, with_vectors=with_vectors)
+        query = normalize(np.asarray(query_vector, dtype=np.float32))
+        cursor = await self.async_collection.aggregate(self._pipeline(query, k, num_candidates, filter))
+        return self._rerank(await cursor.to_list(), query, k, with_vectors)
+
+    def _pipeline(self, query, k, num_candidates, filter):
+        limit = max(num_candidates, k)
+        vector_search = {
+            "queryVector": encode_vector(shorten(query, self.dimensions), self.encoding)[0],
+            "path": self.short_path,
+            "numCandidates": min(limit * ANN_OVERSAMPLING, MAX_NUM_CANDIDATES),
+            "limit": limit,
+            "index": self.index,
+        }
+        if filter:
+            vector_search["filter"] = filter
+        project = {"$project": {"_id": 0, self.short_path: 0, scale_field(self.short_path): 0}}
+        return [{"$vectorSearch": vector_search}, project]
+
+    def _rerank(self, docs, query, k, with_vectors):
+        if not docs:
+            return []
+
+        vectors = normalize(np.stack([decode_vector(doc.pop(self.path), doc.pop(scale_field(self.path), None)) for doc in docs]))
+        similarities = vectors @ query
+        top = np.argsort(-similarities, kind="stable")[:k]
+        if with_vectors:
+            return [{**docs[i], "score": float((1 + similarities[i]) / 2), "vector": vectors[i]} for i in top]
+        return [{**docs[i], "score": float((1 + similarities[i]) / 2)} for i in top]
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, directory, nprobe=8):
+        """
+        Exact (or IVF approximate) k-NN over a memory-mapped float32 matrix, no Atlas needed.
+
+        The directory is written by LocalVectorStore.write, see backend/scripts/exportVectorStore.py.
+        Vectors are normalized on write so the dot product is the cosine similarity, scores are
+        reported the way Atlas reports cosine scores: (1 + cosine) / 2.
+
+        Args:
+        directory (str): Directory with the exported store.
+        nprobe (int): IVF lists searched per query, only used when the store has an IVF index.
+        """
+        self.directory = directory
+        self.nprobe = nprobe
+        with open(os.path.join(directory, META_FILE)) as file:
+            self.meta = json.load(file)
+        self.vectors = np.memmap(
+            os.path.join(directory, VECTORS_FILE),
+            dtype=np.float32,
+            mode="r",
+            shape=(self.meta["count"], self.meta["dimensions"]),
+        )
+        with open(os.path.join(directory, DOCS_FILE)) as file:
+            self.docs = [json.loads(line) for line in file]
+        self._field_rows = {}
+
+        self.centroids = None
+        self.lists = None
+        centroids_path = os.path.join(directory, IVF_CENTROIDS_FILE)
+        if os.path.exists(centroids_path):
+            self.centroids = np.load(centroids_path)
+            assignments = np.load(os.path.join(directory, IVF_ASSIGNMENTS_FILE))
+            order = np.argsort(assignments, kind="stable")
+            bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+            self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    @staticmethod
+    def write(directory, docs, embeddings, ivf_lists=0, seed=0):
+        """
+        Writes a store to disk.
+
+        Args:
+        directory (str): Output directory, created if needed.
+        docs (list[dict]): Documents without their embedding, must be JSON serializable.
+        embeddings (array-like): One embedding per document.
+        ivf_lists (int): Number of IVF lists to build, 0 for exact search only.
+        """
+        os.makedirs(directory, exist_ok=True)
+        matrix = normalize(np.asarray(embeddings, dtype=np.float32))
+        matrix.tofile(os.path.join(directory, VECTORS_FILE))
+        with open(os.path.join(directory, DOCS_FILE), "w") as file:
+            for doc in docs:
+                file.write(json.dumps(doc, default=str) + "\n")
+        with open(os.path.join(directory, META_FILE), "w") as file:
+            json.dump({"count": matrix.shape[0], "dimensions": matrix.shape[1]}, file)
+        if ivf_lists:
+            centroids, assignments = kmeans(matrix, ivf_lists, seed=seed)
+            np.save(os.path.join(directory, IVF_CENTROIDS_FILE), centroids)
+            np.save(os.path.join(directory, IVF_ASSIGNMENTS_FILE), assignments)
+
+    def _filter_rows(self, filter):
+        rows = None
+        for key, value in filter.items():
+            if key not in self._field_rows:
+                # Built once per field, so filtered searches don't walk every document
+                by_value = {}
+                for i, doc in enumerate(self.docs):
+                    by_value.setdefault(json.dumps(doc.get(key), default=str), []).append(i)
+                self._field_rows[key] = {v: np.array(r, dtype=np.int64) for v, r in by_value.items()}
+            matches = self._field_rows[key].get(json.dumps(value, default=str), np.array([], dtype=np.int64))
+            rows = matches if rows is None else np.intersect1d(rows, matches)
+        return rows
+
+    def _candidate_rows(self, query, filter, exact):
+        rows = None
+        if self.centroids is not None and not exact:
+            probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            rows = np.concatenate([self.lists[i] for i in probe])
+        if filter:
+            filtered = self._filter_rows(filter)
+            rows = filtered if rows is None else np.intersect1d(rows, filtered)
+        return rows
+
+    def search_rows(self, query_vector, k, filter=None, exact=False):
+        """
+        Returns (rows, cosine similarities) of the k nearest vectors, best first.
+        """
+        query = normalize(np.asarray(query_vector, dtype=np.float32))
+        rows = self._candidate_rows(query, filter, exact)
+        if rows is None:
+            similarities = self.vectors @ query
+            candidates = np.arange(len(similarities))
+        else:
+            similarities = self.vectors[rows] @ query
+            candidates = rows
+        if len(similarities) > k:
+            top = np.argpartition(-similarities, k)[:k]
+        else:
+            top = np.arange(len(similarities))
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return candidates[top], similarities[top]
+
+    def _results(self, rows, similarities, with_vectors):
+        docs = [{**self.docs[row], "score": float((1 + similarity) / 2)} for row, similarity in zip(rows, similarities)]
+        if with_vectors:
+            for doc, row in zip(docs, rows):
+                doc["vector"] = np.asarray(self.vectors[row])
+        return docs
+
+    def search(self, query_vector, k, num_candidates=100, filter=None, with_vectors=False):
+        rows, similarities = self.search_rows(query_vector, k, filter=filter)
+        return self._results(rows, similarities, with_vectors)
+
+    def search_many(self, query_vectors, k, num_candidates=100, filter=None, with_vectors=False, max_workers=8):
+        """
+        Exact search for many queries at once, a chunk of queries is scored with one matrix product.
+        """
+        queries = normalize(np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1))
+        candidates = self._filter_rows(filter) if filter else np.arange(len(self.vectors))
+        matrix = self.vectors if not filter else self.vectors[candidates]
+        k = min(k, len(candidates))
+        results = []
+        for start in range(0, len(queries), QUERY_CHUNK_SIZE):
+            similarities = queries[start:start + QUERY_CHUNK_SIZE] @ matrix.T
+            if k == 0:
+                results.extend([] for _ in similarities)
+                continue
+            tops = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            for query_similarities, top in zip(similarities, tops):
+                top = top[np.argsort(-query_similarities[top], kind="stable")]
+                results.append(self._results(candidates[top], query_similarities[top], with_vectors))
+        return results
+
+
+def scale_field(path):
+    return f"{path}_scale"
+
+
+def encode_vector(vector, encoding="array"):
+    """
+    Encodes an embedding for storage or as a $vectorSearch query vector.
+
+    int8 maps every vector onto [-127, 127] with its own scale, cosine similarity doesn't
+    change with the scale so Atlas can search the int8 values directly. The scale is returned
+    so the original values can be restored approximately.
+
+    Args:
+    vector (list[float]): The embedding.
+    encoding (str): One of EMBEDDING_ENCODINGS.
+
+    Returns:
+    tuple: (value to store, scale or None)
+    """
+    if encoding == "array":
+        return [float(value) for value in vector], None
+    values = np.asarray(vector, dtype=np.float32)
+    if encoding == "float32":
+        return Binary(bytes([FLOAT32_DTYPE, 0]) + values.astype("<f4").tobytes(), VECTOR_SUBTYPE), None
+    if encoding == "int8":
+        scale = float(np.abs(values).max()) / 127 or 1.0
+        quantized = np.clip(np.rint(values / scale), -127, 127).astype(np.int8)
+        return Binary(bytes([INT8_DTYPE, 0]) + quantized.tobytes(), VECTOR_SUBTYPE), scale
+    raise ValueError(f"Unknown embedding encoding {encoding}")
+
+
+def decode_vector(value, scale=None):
+    """
+    Reads an embedding in any of the EMBEDDING_ENCODINGS back into a float32 array.
+    """
+    if isinstance(value, bytes):
+        dtype, data = value[0], bytes(value[2:])
+        if dtype == FLOAT32_DTYPE:
+            return np.frombuffer(data, dtype="<f4").astype(np.float32)
+        if dtype == INT8_DTYPE:
+            return np.frombuffer(data, dtype=np.int8).astype(np.float32) * np.float32(scale or 1.0)
+        raise ValueError(f"Unsupported vector dtype {dtype:#x}")
+    return np.asarray(value, dtype=np.float32)
+
+
+def shorten(vector, dimensions):
+    """
+    Keeps the leading dimensions of a text-embedding-3 embedding and renormalizes them.
+    """
+    return normalize(np.asarray(vector, dtype=np.float32)[..., :dimensions])
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(matrix, num_lists, iterations=10, sample_size=50000, seed=0):
+    """
+    Spherical k-means for the IVF coarse quantizer, trained on a sample of the rows.
+
+    Returns:
+    tuple: (centroids, list assignment of every row)
+    """
+    rng = np.random.default_rng(seed)
+    sample = matrix[rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)]
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(num_lists):
+            members = sample[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = normalize(centroids)
+    assignments = np.concatenate([
+        np.argmax(matrix[start:start + 10000] @ centroids.T, axis=1)
+        for start in range(0, len(matrix), 10000)
+    ])
+    return centroids, assignments.astype(np.int32)
+
+
+def make_vector_store(collection, index, path="embedding", encoding="array", short_index=None, short_dimensions=0, async_collection=None):
+    """
+    Picks the backend from VECTOR_BACKEND: "atlas" (default) or "local", which reads the
+    store exported to LOCAL_VECTOR_STORE_PATH. With short_dimensions the Atlas backend
+    searches short_index first and re-ranks with the full embedding. async_collection lets
+    the Atlas backends serve search_async without a thread.
+    """
+    if os.environ.get("VECTOR_BACKEND", "atlas") == "local":
+        return LocalVectorStore(os.environ["LOCAL_VECTOR_STORE_PATH"])
+    if short_dimensions:
+        return TwoStageVectorStore(collection, short_index, short_dimensions, path=path, encoding=encoding, async_collection=async_collection)
+    return AtlasVectorStore(collection, index, path=path, encoding=encoding, async_collection=async_collection)
@@ -0,0 +1,93 @@
+"""
+Measures the cold start of each cloud function: a fresh interpreter imports the function's
+main module and serves one request that shouldn't need any client (a CORS preflight, or a
+signed webhook with an action we ignore).
+
+Needs each function's requirements installed in the current environment. With --importtime
+it also lists the slowest imports of a run.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cloud-functions")
+WEBHOOK_SECRET = "benchmark"
+
+# function -> (entry point, method, body)
+FUNCTIONS = {
+    "IssueMatchAlgo": ("get_issue_match", "OPTIONS", None),
+    "IssueSearchAlgo": ("get_issue_search", "OPTIONS", None),
+    "githubApp": ("github_webhook", "POST", {"action": "assigned"}),
+}
+
+CHILD = """
+import hashlib, hmac, json, sys, time
+start = time.perf_counter()
+import flask
+from src import main
+imported = time.perf_counter()
+entry_point, method, body = json.loads(sys.argv[1])
+data = json.dumps(body).encode() if body is not None else b""
+headers = {"Content-Type": "application/json"}
+if body is not None:
+    headers["X-Hub-Signature-256"] = "sha256=" + hmac.new(sys.argv[2].encode(), data, hashlib.sha256).hexdigest()
+app = flask.Flask("benchmark")
+with app.test_request_context("/", method=method, data=data, headers=headers):
+    app.make_response(getattr(main, entry_point)(flask.request))
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_response": done - imported}))
+"""
+
+
+def run_once(function, importtime=False):
+    entry_point, method, body = FUNCTIONS[function]
+    env = {**os.environ, "GITHUB_WEBHOOK_SECRET": WEBHOOK_SECRET, "WARM_UP_ON_START": "false"}
+    command = [sys.executable] + (["-X", "importtime"] if importtime else [])
+    command += ["-c", CHILD, json.dumps([entry_point, method, body]), WEBHOOK_SECRET]
+    start = time.perf_counter()
+    process = subprocess.run(
+        command, cwd=os.path.join(FUNCTIONS_DIR, function), env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{function} failed:\n{process.stderr[-2000:]}")
+    # The function may print its own logs, the timings are on the last line
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    timings["process"] = wall
+    return timings, process.stderr
+
+
+def slowest_imports(stderr, count=15):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        imports.append((int(cumulative), name))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures import-to-first-response time of each cloud function.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per function.")
+    parser.add_argument("--function", choices=list(FUNCTIONS), action="append", help="Only benchmark these functions.")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports.")
+    args = parser.parse_args()
+
+    print(f"{'function':<18}{'import':>10}{'first resp':>12}{'process':>10}   (median of {args.runs} runs, ms)")
+    for function in args.function or list(FUNCTIONS):
+        runs = []
+        stderr = ""
+        for _ in range(args.runs):
+            timings, stderr = run_once(function, importtime=args.importtime)
+            runs.append(timings)
+        median = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+        print(f"{function:<18}{median['import']:>10.0f}{median['first_response']:>12.1f}{median['process']:>10.0f}")
+        if args.importtime:
+            for cumulative, name in slowest_imports(stderr):
+                print(f"    {cumulative / 1000:>8.1f}ms  {name}")
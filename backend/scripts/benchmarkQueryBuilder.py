@@ -0,0 +1,97 @@
+"""
+Compares the local query builder of IssueMatchAlgo with the LLM summary: latency of building the
+query, and overlap@k of the issues each query finds. The raw interests are reported as a
+baseline, they are what the speculative search uses.
+
+Profiles come from --profiles, a JSONL file with "interests" and optionally "resume_text",
+or from a small built-in sample. The overlap needs OpenAI and the issues DB (or a local vector
+store, VECTOR_BACKEND=local), --no-llm only times the local query builder.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import types
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueMatchAlgo", "src"))
+from services.query_builder import Taxonomy, load_vocabulary  # noqa: E402
+
+load_dotenv()
+
+SAMPLE_PROFILES = [
+    {"interests": ["open-source", "web development", "TypeScript"]},
+    {"interests": ["machine learning", "python", "pytorch"]},
+    {"interests": ["golang", "kubernetes", "cloud native"]},
+    {"interests": ["rust", "systems programming", "webassembly"]},
+    {"interests": ["react", "ui/ux", "accessibility"]},
+    {"interests": ["data engineering", "spark", "sql"]},
+    {"interests": ["android", "kotlin", "mobile"]},
+    {"interests": ["security", "cryptography", "c++"]},
+    {"interests": ["devops", "terraform", "ci/cd"]},
+    {"interests": ["game development", "c#", "unity"]},
+]
+
+
+def percentiles(seconds):
+    seconds = sorted(seconds)
+    return statistics.median(seconds) * 1000, seconds[max(int(len(seconds) * 0.95) - 1, 0)] * 1000
+
+
+def overlap(a, b, k):
+    return len(set(a) & set(b)) / k
+
+
+def benchmark(profiles, taxonomy, k=10, with_llm=True):
+    local_seconds = []
+    local_queries = []
+    for profile in profiles:
+        start = time.perf_counter()
+        local_queries.append(taxonomy.build_query(profile["interests"], profile.get("resume_text", "")))
+        local_seconds.append(time.perf_counter() - start)
+    print(f"{len(profiles)} profiles, taxonomy of {len(taxonomy)} terms")
+    print(f"{'query':<8}{'p50 ms':>10}{'p95 ms':>10}{f'overlap@{k}':>12}")
+    print(f"{'local':<8}{percentiles(local_seconds)[0]:>10.3f}{percentiles(local_seconds)[1]:>10.3f}{'':>12}")
+    if not with_llm:
+        return
+
+    from services.db import DB
+    from services.llm import LLMSERVICE
+
+    def issues(query):
+        results = DB.get_k_nearest_issues(LLMSERVICE.create_an_embedding(query), k=k)["results"]
+        return [issue["issueLink"] for issue in results]
+
+    llm_seconds = []
+    local_overlap = []
+    raw_overlap = []
+    for profile, local_query in zip(profiles, local_queries):
+        user = types.SimpleNamespace(interests=profile["interests"], urls=[], resume="")
+        start = time.perf_counter()
+        summary = LLMSERVICE.get_user_summary(user, profile.get("resume_text", ""))
+        llm_seconds.append(time.perf_counter() - start)
+        expected = issues(summary)
+        local_overlap.append(overlap(expected, issues(local_query), k))
+        raw_overlap.append(overlap(expected, issues(f"Interests: {', '.join(profile['interests'])}"), k))
+    print(f"{'llm':<8}{percentiles(llm_seconds)[0]:>10.1f}{percentiles(llm_seconds)[1]:>10.1f}{1.0:>12.2f}")
+    print(f"{'local':<8}{'':>10}{'':>10}{statistics.mean(local_overlap):>12.2f}")
+    print(f"{'raw':<8}{'':>10}{'':>10}{statistics.mean(raw_overlap):>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and result overlap of the local query builder against the LLM.")
+    parser.add_argument("--profiles", type=str, help="JSONL file with interests and optional resume_text per line.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--no-llm", action="store_true", help="Only time the local query builder.")
+    args = parser.parse_args()
+
+    if args.profiles:
+        with open(args.profiles) as file:
+            profiles = [json.loads(line) for line in file if line.strip()]
+    else:
+        profiles = SAMPLE_PROFILES
+    # QUERY_TAXONOMY_PATH or the issues collection, like the function
+    benchmark(profiles, Taxonomy(load_vocabulary()), k=args.k, with_llm=not args.no_llm)
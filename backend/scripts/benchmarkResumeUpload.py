@@ -0,0 +1,95 @@
+"""
+Parse time and peak memory of a match request that carries a resume, from the body to the PDF
+bytes ready for extraction:
+
+- json + regex: the resume as a base64 data url in the JSON, matched with the regex the
+  UserProfile model used to have, then decoded (before).
+- json: the same body through UserProfile, which checks the size and the first bytes and decodes once.
+- multipart: the PDF uploaded as multipart/form-data, read from the stream into one buffer.
+
+The PDFs are random bytes with a PDF header, nothing is extracted. Peak memory is measured with
+tracemalloc on top of the request body, which the server holds in every case. Needs the function's
+requirements installed.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cloud-functions", "IssueMatchAlgo")
+OLD_RESUME_PATTERN = r"^data:application/pdf;base64,[A-Za-z0-9+/=]*$"
+PROFILE = {
+    "firstName": "John",
+    "lastName": "Doe",
+    "email": "john.doe@example.com",
+    "urls": ["https://github.com/johndoe"],
+    "interests": ["open-source", "web development", "TypeScript"],
+}
+
+
+def bodies(pdf):
+    from werkzeug.test import EnvironBuilder
+
+    json_body = json.dumps({**PROFILE, "resume": "data:application/pdf;base64," + base64.b64encode(pdf).decode()}).encode()
+    environ = EnvironBuilder(method="POST", data={**PROFILE, "resume": (io.BytesIO(pdf), "resume.pdf", "application/pdf")}).get_environ()
+    return {
+        "json + regex": (json_body, "application/json"),
+        "json": (json_body, "application/json"),
+        "multipart": (environ["wsgi.input"].read(), environ["CONTENT_TYPE"]),
+    }
+
+
+def run(path, body, content_type):
+    from flask import Flask, request
+    from werkzeug.test import EnvironBuilder
+    from src.models.userprofile import UserProfile
+    from src.services.pdf_text import PDF_TEXT
+    from src.services.upload import read_profile_form
+
+    environ = EnvironBuilder(method="POST", input_stream=io.BytesIO(body), content_type=content_type, content_length=len(body)).get_environ()
+    with Flask("benchmark").request_context(environ):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if path == "json + regex":
+            payload = request.get_json()
+            if not re.match(OLD_RESUME_PATTERN, payload["resume"]):
+                raise ValueError("Not a PDF data url")
+            pdf = base64.b64decode(payload["resume"].split(",", 1)[1])
+        elif path == "json":
+            pdf = UserProfile(**request.get_json()).resume_pdf
+        else:
+            fields, resume = read_profile_form(request, PDF_TEXT.max_bytes)
+            pdf = UserProfile.from_upload(fields, resume).resume_pdf
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - before
+    return seconds, peak, len(pdf)
+
+
+def benchmark(sizes_mb, repeat):
+    sys.path.insert(0, FUNCTION_DIR)
+    tracemalloc.start()
+    print(f"{'resume':>8}{'path':>14}{'p50 ms':>10}{'peak MB':>10}")
+    for size_mb in sizes_mb:
+        pdf = b"%PDF-1.4\n" + os.urandom(int(size_mb * 2**20))
+        for path, (body, content_type) in bodies(pdf).items():
+            runs = [run(path, body, content_type) for _ in range(repeat)]
+            assert all(size == len(pdf) for _, _, size in runs)
+            p50 = statistics.median(seconds for seconds, _, _ in runs) * 1000
+            peak = max(peak for _, peak, _ in runs) / 2**20
+            print(f"{f'{size_mb:g}MB':>8}{path:>14}{p50:>10.2f}{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse time and peak memory of resume carrying match requests.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.5, 2, 4.5], help="Resume sizes in MB, at most PDF_MAX_BYTES.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    benchmark(args.sizes, args.repeat)
@@ -0,0 +1,106 @@
+"""
+Compares the size of the full and compact issue search formats, raw and compressed.
+
+By default it uses synthetic issues shaped like issues_bot_gen, pass --from-db to measure
+real pages from the issues collection instead (needs MONGODB_URI).
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueSearchAlgo", "src"))
+from services.db import DB  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+LABELS = ["bug", "enhancement", "good first issue", "help wanted", "documentation", "question", "ui", "performance"]
+LANGUAGES = ["Python", "TypeScript", "JavaScript", "Go", "Rust", "Java", "Shell", "Dockerfile", "HTML", "CSS"]
+TOPICS = ["open-source", "web", "cli", "machine-learning", "api", "database", "devtools", "react", "kubernetes"]
+WORDS = "fix add support for the when with crash error page memory leak dark mode config docs test build".split()
+
+
+def synthetic_issues(num_issues, num_repos, seed=7):
+    rng = random.Random(seed)
+    repos = []
+    for i in range(num_repos):
+        name = f"project-{i}"
+        repos.append({
+            "repo_name": name,
+            "repo_full_name": f"org-{i % 17}/{name}",
+            "repo_html_url": f"https://github.com/org-{i % 17}/{name}",
+            "repo_description": " ".join(rng.choices(WORDS, k=rng.randint(10, 30))).capitalize() + ".",
+            "repo_stars": rng.randint(0, 50000),
+            "repo_watchers": rng.randint(0, 50000),
+            "languages": rng.sample(LANGUAGES, rng.randint(1, 5)),
+            "repo_topics": rng.sample(TOPICS, rng.randint(0, 6)),
+        })
+    # A few repos own most of the open issues, like in the real collection
+    weights = [1 / (rank + 1) for rank in range(num_repos)]
+    issues = []
+    for number in range(num_issues):
+        repo = rng.choices(repos, weights=weights)[0]
+        issues.append({
+            **repo,
+            "issue_html_url": f"{repo['repo_html_url']}/issues/{number}",
+            "issue_number": number,
+            "issue_title": " ".join(rng.choices(WORDS, k=rng.randint(3, 10))).capitalize(),
+            "labels": rng.sample(LABELS, rng.randint(0, 3)),
+        })
+    # Pages are read in _id order, which is roughly insertion order
+    issues.sort(key=lambda issue: (issue["repo_full_name"], issue["issue_number"]))
+    return issues
+
+
+def sizes(payload):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    result = {"identity": len(body), "gzip": len(gzip.compress(body, compresslevel=6, mtime=0))}
+    if brotli:
+        result["br"] = len(brotli.compress(body, quality=5))
+    return result
+
+
+def report(pages):
+    totals = {"full": {}, "compact": {}}
+    for page in pages:
+        for name, payload in (("full", page), ("compact", DB.format_compact(page))):
+            for encoding, size in sizes(payload).items():
+                totals[name][encoding] = totals[name].get(encoding, 0) + size
+
+    baseline = totals["full"]["identity"]
+    print(f"{'format':<10}{'encoding':<10}{'bytes':>12}{'vs full':>10}")
+    for name, by_encoding in totals.items():
+        for encoding, size in by_encoding.items():
+            print(f"{name:<10}{encoding:<10}{size:>12}{size / baseline:>10.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the issue search payload size per format and encoding.")
+    parser.add_argument("--issues", type=int, default=5000, help="Number of synthetic issues.")
+    parser.add_argument("--repos", type=int, default=100, help="Number of synthetic repos.")
+    parser.add_argument("--page-size", type=int, default=50, help="Issues per page.")
+    parser.add_argument("--from-db", action="store_true", help="Measure real pages from the issues collection.")
+    args = parser.parse_args()
+
+    pages = []
+    if args.from_db:
+        cursor = None
+        while True:
+            page = DB.get_issues(limit=args.page_size, cursor=cursor)
+            pages.append(page)
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+    else:
+        issues = synthetic_issues(args.issues, args.repos)
+        for start in range(0, len(issues), args.page_size):
+            pages.append({"results": issues[start:start + args.page_size], "next_cursor": None})
+
+    print(f"{sum(len(page['results']) for page in pages)} issues in {len(pages)} pages of {args.page_size}")
+    report(pages)
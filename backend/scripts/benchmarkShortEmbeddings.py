@@ -0,0 +1,81 @@
+"""
+Reports recall@k and latency of the two stage search (EMBEDDING_SHORT_DIMENSIONS) for a range
+of short dimensions: candidates by exact search over the leading dimensions, re-ranked with the
+full embedding, compared against exact search over the full embedding.
+
+Use --store with a directory written by exportVectorStore.py to measure real embeddings.
+--synthetic generates vectors whose variance decays over the dimensions, like text-embedding-3
+embeddings, but only real embeddings tell how much the short prefix keeps.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueMatchAlgo", "src"))
+from services.vectorstore import LocalVectorStore, normalize  # noqa: E402
+
+
+def synthetic_embeddings(num_vectors, dimensions=1536, num_clusters=256, seed=7):
+    rng = np.random.default_rng(seed)
+    decay = (1 + np.arange(dimensions) / 64) ** -0.75
+    centers = rng.normal(size=(num_clusters, dimensions)) * decay
+    noise = rng.normal(scale=0.5, size=(num_vectors, dimensions)) * decay
+    return normalize((centers[rng.integers(0, num_clusters, num_vectors)] + noise).astype(np.float32))
+
+
+def top_k(similarities, k):
+    top = np.argpartition(-similarities, k)[:k]
+    return top[np.argsort(-similarities[top])]
+
+
+def two_stage(short_matrix, full_matrix, query, k, num_candidates):
+    short_query = normalize(query[:short_matrix.shape[1]])
+    candidates = top_k(short_matrix @ short_query, num_candidates)
+    return candidates[top_k(full_matrix[candidates] @ query, k)]
+
+
+def benchmark(matrix, dimensions, k=10, num_candidates=100, num_queries=200, seed=0):
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.choice(len(matrix), num_queries, replace=False)]
+    queries = normalize(queries + rng.normal(scale=0.02, size=queries.shape).astype(np.float32))
+    expected = [set(top_k(matrix @ query, k)) for query in queries]
+
+    print(f"{len(matrix)} vectors, k={k}, {num_candidates} candidates re-ranked, {num_queries} queries")
+    print(f"{'dims':>6}{'index MB':>10}{'recall short':>14}{'recall rerank':>15}{'p50 ms':>9}{'p95 ms':>9}")
+    for dims in dimensions:
+        short_matrix = normalize(np.ascontiguousarray(matrix[:, :dims]))
+        short_hits = rerank_hits = 0
+        timings = []
+        for query, exact in zip(queries, expected):
+            short_hits += len(exact & set(top_k(short_matrix @ normalize(query[:dims]), k)))
+            start = time.perf_counter()
+            found = two_stage(short_matrix, matrix, query, k, num_candidates)
+            timings.append((time.perf_counter() - start) * 1000)
+            rerank_hits += len(exact & set(found))
+        timings.sort()
+        total = num_queries * k
+        print(
+            f"{dims:>6}{short_matrix.nbytes / 2**20:>10.1f}{short_hits / total:>14.4f}{rerank_hits / total:>15.4f}"
+            f"{statistics.median(timings):>9.2f}{timings[int(num_queries * 0.95) - 1]:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall and latency of two stage search per short dimension.")
+    parser.add_argument("--store", type=str, help="Local vector store directory from exportVectorStore.py.")
+    parser.add_argument("--synthetic", type=int, default=50000, help="Number of synthetic vectors when no store is given.")
+    parser.add_argument("--dims", type=str, default="64,128,256,512,768,1536", help="Comma separated short dimensions.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=100, help="Candidates re-ranked with the full embedding.")
+    args = parser.parse_args()
+
+    if args.store:
+        matrix = np.asarray(LocalVectorStore(args.store).vectors)
+    else:
+        matrix = synthetic_embeddings(args.synthetic)
+    dimensions = [int(dims) for dims in args.dims.split(",") if int(dims) <= matrix.shape[1]]
+    benchmark(matrix, dimensions, k=args.k, num_candidates=args.candidates)
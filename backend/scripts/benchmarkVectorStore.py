@@ -0,0 +1,67 @@
+"""
+Measures latency and recall@k of the local vector store, exact search against IVF.
+
+Uses a store exported with exportVectorStore.py (--store) or synthetic clustered vectors.
+Recall is measured against the exact result for queries drawn from the stored vectors.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueMatchAlgo", "src"))
+from services.vectorstore import LocalVectorStore  # noqa: E402
+
+
+def synthetic_store(directory, count, dimensions, ivf_lists, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(ivf_lists, 16), dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.6 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    LocalVectorStore.write(directory, [{"id": i} for i in range(count)], vectors, ivf_lists=ivf_lists)
+
+
+def measure(store, queries, k, exact_rows=None, exact=False):
+    timings = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = store.search_rows(query, k, exact=exact)
+        timings.append((time.perf_counter() - start) * 1000)
+        found.append(set(rows.tolist()))
+    recall = 1.0
+    if exact_rows is not None:
+        recall = np.mean([len(f & e) / k for f, e in zip(found, exact_rows)])
+    return np.percentile(timings, 50), np.percentile(timings, 95), recall, found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the local vector store.")
+    parser.add_argument("--store", type=str, help="Exported store directory, synthetic data when missing.")
+    parser.add_argument("--count", type=int, default=100000, help="Synthetic vectors.")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Synthetic dimensions.")
+    parser.add_argument("--ivf-lists", type=int, default=256, help="IVF lists of the synthetic store.")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    directory = args.store
+    if not directory:
+        directory = tempfile.mkdtemp()
+        print(f"Writing {args.count} synthetic vectors of {args.dimensions} dimensions to {directory}")
+        synthetic_store(directory, args.count, args.dimensions, args.ivf_lists)
+
+    store = LocalVectorStore(directory)
+    rng = np.random.default_rng(1)
+    queries = np.asarray(store.vectors[rng.choice(len(store.vectors), args.queries, replace=False)])
+    queries += 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    p50, p95, _, exact_rows = measure(store, queries, args.k, exact=True)
+    print(f"{'exact':<12} p50 {p50:7.2f}ms  p95 {p95:7.2f}ms  recall@{args.k} 1.000")
+    if store.centroids is not None:
+        for nprobe in (1, 4, 8, 16, 32):
+            store.nprobe = nprobe
+            p50, p95, recall, _ = measure(store, queries, args.k, exact_rows=exact_rows)
+            print(f"{f'ivf n={nprobe}':<12} p50 {p50:7.2f}ms  p95 {p95:7.2f}ms  recall@{args.k} {recall:.3f}")
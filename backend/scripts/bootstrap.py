@@ -10,23 +10,69 @@ from pymongo import MongoClient
 import os
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueMatchAlgo", "src"))
+from services.embedding_cache import make_embedding_cache  # noqa: E402
+from services.prompt_budget import PROMPT_STATS, PromptBuilder  # noqa: E402
+from services.vectorstore import encode_vector, scale_field, shorten  # noqa: E402
+
 load_dotenv()
 openai_client = OpenAI()
 mongodb_client = MongoClient(os.environ.get("MONGODB_URI"))
 db = mongodb_client.open_match
 collection = db.issues
 MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# array, float32 or int8, keep it in sync with EMBEDDING_ENCODING of IssueMatchAlgo
+EMBEDDING_ENCODING = os.environ.get("EMBEDDING_ENCODING", "array")
+# Also store a short copy for the two stage search, keep it in sync with IssueMatchAlgo
+EMBEDDING_SHORT_DIMENSIONS = int(os.environ.get("EMBEDDING_SHORT_DIMENSIONS", 0))
+# Input tokens of an issue summary prompt, fields of an issue are kept by ISSUE_FIELD_PRIORITY until it is full
+ISSUE_SUMMARY_PROMPT_TOKENS = int(os.environ.get("ISSUE_SUMMARY_PROMPT_TOKENS", 1000))
+# One long description or topic list shouldn't leave no room for the rest
+ISSUE_FIELD_MAX_TOKENS = 300
+# Lower is kept first, fields not listed (urls, numbers) come last
+ISSUE_FIELD_PRIORITY = {
+    "issue_title": 0,
+    "issue_labels": 1,
+    "repo_full_name": 1,
+    "repo_description": 2,
+    "repo_languages": 2,
+    "repo_topics": 2,
+}
+# Shares the embedding_cache collection with IssueMatchAlgo, set EMBEDDING_CACHE_STORE=sqlite for a local file
+embedding_cache = make_embedding_cache(collection=db.embedding_cache)
 
 
 def write_to_db(issue):
     collection.insert_one(issue)
 
 
+def bump_issues_version():
+    """
+    IssueMatchAlgo drops its cached results when the version of the issues collection changes.
+    """
+    db.collection_versions.update_one(
+        {"_id": collection.name},
+        {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+        upsert=True,
+    )
+
+
 def create_an_issue_summary(issue):
+    builder = PromptBuilder("bootstrap_issue_summary", ISSUE_SUMMARY_PROMPT_TOKENS).add(
+        "instructions",
+        "You are an AI Assistant that is reponsible in making a comprehensive summary of a given github issue. Use the information and make the best summary to summarize the issue possible, we have less data so you need to understand well here. Only return the comprehensive summary and keep it less than 100 words. Here are the details about that issue:",
+        priority=-1,
+    )
+    for field, value in issue.items():
+        builder.add(field, f"{field}: {value}", priority=ISSUE_FIELD_PRIORITY.get(field, 3), max_tokens=ISSUE_FIELD_MAX_TOKENS)
+    prompt = builder.build()
+    if builder.truncated:
+        print(f"Issue summary prompt has {builder.tokens} tokens, truncated {builder.truncated}")
     content = [
         {
             "type": "text",
-            "text": f"You are an AI Assistant that is reponsible in making a comprehensive summary of a given github issue. Use the information and make the best summary to summarize the issue possible, we have less data so you need to understand well here. Here are the details about that issue: {issue}. Only return the comprehensive summary and keep it less than 100 words",
+            "text": "\n".join(text for text in prompt.values() if text),
         },
     ]
     try:
@@ -42,13 +88,14 @@ def create_an_issue_summary(issue):
 def make_an_embedding(issue, summary):
     text_for_embedding = f"{issue}  Summary: {summary}"
     print("creating an embedding")
-    return (
-        openai_client.embeddings.create(
-            input=[text_for_embedding], model="text-embedding-3-small"
-        )
-        .data[0]
-        .embedding
-    )
+    return embedding_cache.get_or_create(
+        [text_for_embedding],
+        model=EMBEDDING_MODEL,
+        create=lambda texts: [
+            item.embedding
+            for item in openai_client.embeddings.create(input=texts, model=EMBEDDING_MODEL).data
+        ],
+    )[0]
 
 
 def parse_json_file(file_path):
@@ -62,11 +109,20 @@ def parse_json_file(file_path):
                 summary = create_an_issue_summary(issue)
                 embedding = make_an_embedding(issue, summary)
                 # add embedding
-                issue["embedding"] = embedding
+                issue["embedding"], scale = encode_vector(embedding, EMBEDDING_ENCODING)
+                if scale is not None:
+                    issue[scale_field("embedding")] = scale
+                if EMBEDDING_SHORT_DIMENSIONS:
+                    issue["embedding_short"], scale = encode_vector(shorten(embedding, EMBEDDING_SHORT_DIMENSIONS), EMBEDDING_ENCODING)
+                    if scale is not None:
+                        issue[scale_field("embedding_short")] = scale
                 issue["summary"] = summary
                 # write to mongo db atlas
                 write_to_db(issue)
 
+            bump_issues_version()
+            print("Embedding cache stats", embedding_cache.stats())
+            print("Prompt token stats", PROMPT_STATS.stats())
         else:
             print("The JSON file does not contain a list of objects.")
     except FileNotFoundError:
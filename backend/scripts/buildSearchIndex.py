@@ -0,0 +1,76 @@
+"""
+Builds the BM25 keyword index used by IssueSearchAlgo and saves it to a file.
+
+Point BM25_INDEX_PATH at the file in the function's environment and it is loaded at startup
+instead of being built from the issues collection, only issues changed since are re-indexed.
+With --synthetic it builds an index of fake issues and reports query latency instead.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueSearchAlgo", "src"))
+from services.bm25 import BM25Index, IssueSearchIndex  # noqa: E402
+
+WORDS = (
+    "memory leak crash dark mode parser config error page build test docs api cli cache thread "
+    "timeout login auth token upload download image video render layout button modal form input "
+    "search filter sort pagination database query index migration schema docker kubernetes deploy "
+    "python typescript javascript go rust java react vue angular flask django node npm pip webpack"
+).split()
+QUERIES = ["memory leak", "dark mode", "login timeout", "docker deploy error", "react modal button", "pagination"]
+
+
+def synthetic_index(num_issues, vocabulary_size=20000, seed=7):
+    rng = random.Random(seed)
+    # Zipf distributed vocabulary, the query words sit among the common terms so their
+    # postings lists are long, like "error" or "page" in the real collection
+    vocabulary = [f"filler{i}" for i in range(20)] + WORDS + [f"term{i}" for i in range(vocabulary_size)]
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    index = BM25Index()
+    for doc_id in range(num_issues):
+        title = " ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(4, 10)))
+        summary = " ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(30, 80)))
+        index.add(str(doc_id), f"{title} {summary}")
+    return index
+
+
+def benchmark(index, runs=50):
+    print(f"{len(index)} issues, {len(index.postings)} terms")
+    for query in QUERIES:
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            index.search(query, 1000)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f"{query!r:<24} p50 {statistics.median(timings):6.2f}ms  p95 {timings[int(runs * 0.95) - 1]:6.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the BM25 keyword index for issue search.")
+    parser.add_argument("--output", type=str, default="bm25_index.pkl", help="Where to save the index.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark an index of this many fake issues instead.")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        start = time.perf_counter()
+        index = synthetic_index(args.synthetic)
+        print(f"Built in {time.perf_counter() - start:.1f}s")
+        benchmark(index)
+    else:
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+
+        load_dotenv()
+        collection = MongoClient(os.environ.get("MONGODB_URI")).open_match.issues_bot_gen
+        search_index = IssueSearchIndex()
+        search_index.build(collection)
+        search_index.save(args.output)
+        print(f"Saved {len(search_index.index)} issues to {args.output}")
+        benchmark(search_index.index)
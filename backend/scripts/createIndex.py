@@ -1,10 +1,27 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
 
 load_dotenv()
 MONGO_DB_URI = os.getenv("MONGO_DB_URI")
 client = MongoClient(MONGO_DB_URI)
 db = client.open_match
 repo_source_code_collection = db.repo_source_code
-repo_source_code_collection.create_index("repo_name")
\ No newline at end of file
+repo_source_code_collection.create_index("repo_name")
+
+# Issue search filters, each ends in _id so IssueSearchAlgo can page through the index in order.
+# Mongo cannot compound two array fields, so these stay separate.
+issues_collection = db.issues_bot_gen
+issues_collection.create_index([("labels", ASCENDING), ("_id", ASCENDING)])
+issues_collection.create_index([("languages", ASCENDING), ("_id", ASCENDING)])
+issues_collection.create_index([("repo_topics", ASCENDING), ("_id", ASCENDING)])
+issues_collection.create_index([("repo_full_name", ASCENDING), ("_id", ASCENDING)])
+
+# "More results" query handles of IssueMatchAlgo, removed once they are older than QUERY_HANDLE_TTL_SECONDS
+db.query_handles.create_index("created_at", expireAfterSeconds=int(os.getenv("QUERY_HANDLE_TTL_SECONDS", 30 * 60)))
+
+# Deleted issue ids, read by the incremental sync of IssueSearchAlgo's keyword index
+db.issue_tombstones.create_index("deleted_at", expireAfterSeconds=7 * 24 * 60 * 60)
+
+# Cached embeddings of every function and script, re-embedded once they are older than EMBEDDING_CACHE_TTL_DAYS
+db.embedding_cache.create_index("created_at", expireAfterSeconds=int(os.getenv("EMBEDDING_CACHE_TTL_DAYS", 30)) * 24 * 60 * 60)
@@ -0,0 +1,28 @@
+"""
+Exports the languages and topics of the issues to a JSON file for the local query builder of
+IssueMatchAlgo. Point QUERY_TAXONOMY_PATH at it to skip counting them in Mongo at runtime, or
+to use the local query builder with VECTOR_BACKEND=local.
+"""
+
+import argparse
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueMatchAlgo", "src"))
+from services.db import DBService  # noqa: E402
+
+load_dotenv()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the vocabulary of the local query builder.")
+    parser.add_argument("--output", type=str, required=True, help="JSON file to write.")
+    parser.add_argument("--min-count", type=int, default=2, help="Drop values on fewer issues than this.")
+    args = parser.parse_args()
+
+    vocabulary = DBService().get_vocabulary(min_count=args.min_count)
+    with open(args.output, "w") as file:
+        json.dump(vocabulary, file, indent=1, sort_keys=True)
+    print(f"Exported {len(vocabulary['languages'])} languages and {len(vocabulary['topics'])} topics to {args.output}")
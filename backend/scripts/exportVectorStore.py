@@ -0,0 +1,51 @@
+"""
+Exports a collection with embeddings to a local vector store directory.
+
+The cloud functions read it instead of Atlas when VECTOR_BACKEND=local and
+LOCAL_VECTOR_STORE_PATH points at the directory. Useful to run and benchmark the match
+pipeline offline, or for small deployments that don't need an Atlas round-trip.
+"""
+
+import argparse
+import os
+import sys
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueMatchAlgo", "src"))
+from services.vectorstore import LocalVectorStore, decode_vector, scale_field  # noqa: E402
+
+load_dotenv()
+
+
+def export_collection(collection, output, path="embedding", ivf_lists=0, batch_size=1000):
+    docs = []
+    chunks = []
+    chunk = []
+    for doc in collection.find({path: {"$exists": True}}, {"_id": 0}).batch_size(batch_size):
+        # Embeddings can be arrays or BSON vectors, see migrateEmbeddings.py
+        chunk.append(decode_vector(doc.pop(path), doc.pop(scale_field(path), None)))
+        docs.append(doc)
+        if len(chunk) == batch_size:
+            chunks.append(np.asarray(chunk, dtype=np.float32))
+            chunk = []
+    if chunk:
+        chunks.append(np.asarray(chunk, dtype=np.float32))
+    if not docs:
+        print("No documents with embeddings found")
+        return
+    LocalVectorStore.write(output, docs, np.concatenate(chunks), ivf_lists=ivf_lists)
+    print(f"Exported {len(docs)} documents to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports a collection with embeddings to a local vector store.")
+    parser.add_argument("--collection", type=str, default="issues", help="Collection in the open_match DB, e.g. issues or repo_source_code.")
+    parser.add_argument("--output", type=str, required=True, help="Directory to write the store to.")
+    parser.add_argument("--path", type=str, default="embedding", help="Field holding the embedding.")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Build an IVF index with this many lists, 0 for exact search only.")
+    args = parser.parse_args()
+
+    mongodb_client = MongoClient(os.environ.get("MONGODB_URI") or os.environ.get("MONGO_DB_URI"))
+    export_collection(mongodb_client.open_match[args.collection], args.output, path=args.path, ivf_lists=args.ivf_lists)
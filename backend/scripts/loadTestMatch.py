@@ -0,0 +1,213 @@
+"""
+Load test for IssueMatchAlgo: throughput and latency of get_issue_match against
+get_issue_match_async.
+
+With --url it sends --requests match requests to a deployed function, --concurrency at a time,
+every request with different interests so the profile cache doesn't answer them.
+
+With --simulate it runs both request paths in process with OpenAI and the vector search
+replaced by fakes that only wait (--llm-ms, --embedding-ms, --search-ms), like they wait on the
+network. The sync path gets --threads workers, functions-framework starts 4 per vCPU, the async
+path serves --concurrency requests on one event loop. Latencies are from the start of a request's
+processing, time spent waiting for a free worker or slot only shows in req/s. Needs the
+function's requirements installed.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cloud-functions", "IssueMatchAlgo")
+
+
+def profile(i):
+    return {
+        "firstName": "Load",
+        "lastName": "Test",
+        "email": f"load.test+{i}@example.com",
+        "urls": ["https://github.com/johndoe"],
+        "interests": ["open-source", "python", f"topic-{i}"],
+    }
+
+
+def report(name, latencies, wall, errors=0):
+    latencies = sorted(latencies)
+    print(
+        f"{name:<8}{len(latencies):>9}{errors:>8}{len(latencies) / wall:>10.1f}"
+        f"{statistics.median(latencies) * 1000:>10.0f}{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.0f}"
+    )
+
+
+def header():
+    print(f"{'path':<8}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+
+
+def load_test_url(url, requests, concurrency):
+    def send(i):
+        body = json.dumps(profile(i)).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=120) as response:
+            result = json.loads(response.read())
+        return time.perf_counter() - start, "error" in result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(requests)))
+    header()
+    report("url", [latency for latency, _ in results], time.perf_counter() - start, sum(error for _, error in results))
+
+
+class SimulatedClients:
+    """
+    OpenAI clients that answer after a fixed wait, sync and async.
+    """
+
+    def __init__(self, llm_seconds, embedding_seconds, dimensions):
+        import numpy as np
+
+        def embedding(text):
+            return np.random.default_rng(abs(hash(text)) % 2**32).normal(size=dimensions).tolist()
+
+        def completion(messages):
+            message = types.SimpleNamespace(content="Keywords: " + messages[0]["content"][1]["text"])
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+        def embeddings(input):
+            return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=embedding(text)) for text in input])
+
+        def create_completion(model, messages):
+            time.sleep(llm_seconds)
+            return completion(messages)
+
+        def create_embeddings(input, model):
+            time.sleep(embedding_seconds)
+            return embeddings(input)
+
+        async def create_completion_async(model, messages):
+            await asyncio.sleep(llm_seconds)
+            return completion(messages)
+
+        async def create_embeddings_async(input, model):
+            await asyncio.sleep(embedding_seconds)
+            return embeddings(input)
+
+        self.client = types.SimpleNamespace(
+            chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create_completion)),
+            embeddings=types.SimpleNamespace(create=create_embeddings),
+        )
+        self.async_client = types.SimpleNamespace(
+            chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create_completion_async)),
+            embeddings=types.SimpleNamespace(create=create_embeddings_async),
+        )
+
+
+class SimulatedSearch:
+    """
+    Wraps a vector store, every search first waits like an Atlas round-trip.
+    """
+
+    def __init__(self, store, search_seconds):
+        self.store = store
+        self.search_seconds = search_seconds
+
+    def search(self, *args, **kwargs):
+        time.sleep(self.search_seconds)
+        return self.store.search(*args, **kwargs)
+
+    async def search_async(self, *args, **kwargs):
+        await asyncio.sleep(self.search_seconds)
+        return self.store.search(*args, **kwargs)
+
+
+def simulate(requests, threads, concurrency, llm_ms, embedding_ms, search_ms, dimensions=256):
+    import numpy as np
+
+    store_dir = tempfile.mkdtemp(prefix="match-load-test-")
+    os.environ.update(
+        VECTOR_BACKEND="local",
+        LOCAL_VECTOR_STORE_PATH=store_dir,
+        EMBEDDING_CACHE_STORE="memory",
+        WARM_UP_ON_START="false",
+    )
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+    sys.path.insert(0, FUNCTION_DIR)
+    from src.services.vectorstore import LocalVectorStore
+
+    rng = np.random.default_rng(0)
+    docs = [
+        {"issue_title": f"Issue {i}", "repo_name": f"org/repo-{i % 500}", "issue_number": i, "repo_topics": [], "repo_languages": ["Python"]}
+        for i in range(5000)
+    ]
+    LocalVectorStore.write(store_dir, docs, rng.normal(size=(len(docs), dimensions)))
+
+    from src import main
+    from src.services.db import DB
+    from src.services.llm import LLMSERVICE
+
+    clients = SimulatedClients(llm_ms / 1000, embedding_ms / 1000, dimensions)
+    LLMSERVICE.get().client = clients.client
+    LLMSERVICE.get().async_client = clients.async_client
+    DB.get().vector_store = SimulatedSearch(DB.vector_store, search_ms / 1000)
+
+    def timed_sync(i):
+        start = time.perf_counter()
+        result, _ = main.process_request(profile(i))
+        return time.perf_counter() - start, "error" in result
+
+    async def run_async(offset):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(i):
+            async with semaphore:
+                start = time.perf_counter()
+                result, _ = await main.process_request_async(profile(i))
+                return time.perf_counter() - start, "error" in result
+
+        return await asyncio.gather(*[timed(offset + i) for i in range(requests)])
+
+    print(f"Simulated chat {llm_ms}ms, embedding {embedding_ms}ms, search {search_ms}ms")
+    header()
+    # The function logs every request, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            sync_results = list(executor.map(timed_sync, range(requests)))
+        sync_wall = time.perf_counter() - start
+        start = time.perf_counter()
+        # Other profiles than the sync run, so neither is served from the profile cache
+        async_results = asyncio.run(run_async(requests))
+        async_wall = time.perf_counter() - start
+    report("sync", [latency for latency, _ in sync_results], sync_wall, sum(error for _, error in sync_results))
+    report("async", [latency for latency, _ in async_results], async_wall, sum(error for _, error in async_results))
+    print(f"async/sync throughput {(requests / async_wall) / (requests / sync_wall):.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the sync and async match request paths.")
+    parser.add_argument("--url", type=str, help="Deployed get_issue_match or get_issue_match_async to send requests to.")
+    parser.add_argument("--simulate", action="store_true", help="Compare both paths in process with simulated latencies.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200, help="Requests in flight.")
+    parser.add_argument("--threads", type=int, default=4, help="Worker threads of the simulated sync instance.")
+    parser.add_argument("--llm-ms", type=int, default=800, help="Simulated chat completion latency.")
+    parser.add_argument("--embedding-ms", type=int, default=100, help="Simulated embeddings latency.")
+    parser.add_argument("--search-ms", type=int, default=50, help="Simulated vector search latency.")
+    args = parser.parse_args()
+
+    if args.url:
+        load_test_url(args.url, args.requests, args.concurrency)
+    elif args.simulate:
+        simulate(args.requests, args.threads, args.concurrency, args.llm_ms, args.embedding_ms, args.search_ms)
+    else:
+        parser.error("Pass --url or --simulate")
@@ -0,0 +1,131 @@
+"""
+Re-encodes the embeddings of a collection as double arrays, packed float32 or int8 BSON vectors.
+
+With --short-dimensions it also writes the leading dimensions to embedding_short, for the
+two stage search of IssueMatchAlgo (EMBEDDING_SHORT_DIMENSIONS).
+
+With --dry-run nothing is written, it reports the stored size of each encoding and the
+recall@k of searching the re-encoded vectors against full precision on a sample. --synthetic
+runs the same report on random vectors without a DB.
+
+After migrating set EMBEDDING_ENCODING on IssueMatchAlgo to the same encoding, the query
+vector has to be encoded like the stored ones. The Atlas index definition doesn't change.
+"""
+
+import argparse
+import os
+import sys
+import bson
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "IssueMatchAlgo", "src"))
+from services.vectorstore import EMBEDDING_ENCODINGS, decode_vector, encode_vector, normalize, scale_field, shorten  # noqa: E402
+
+
+def encoded_size(vector, encoding, path="embedding"):
+    value, scale = encode_vector(vector, encoding)
+    doc = {path: value}
+    if scale is not None:
+        doc[scale_field(path)] = scale
+    return len(bson.encode(doc))
+
+
+def round_trip(vector, encoding):
+    return decode_vector(*encode_vector(vector, encoding))
+
+
+def recall_at_k(matrix, encoding, k=10, num_queries=100, seed=0):
+    """
+    Searches the re-encoded matrix with full precision queries and compares the top k
+    against exact search over the full precision matrix.
+    """
+    rng = np.random.default_rng(seed)
+    exact = normalize(matrix)
+    encoded = normalize(np.stack([round_trip(vector, encoding) for vector in matrix]))
+    # Queries near stored vectors, like a profile close to a few issues
+    queries = exact[rng.choice(len(exact), min(num_queries, len(exact)), replace=False)]
+    queries = normalize(queries + rng.normal(scale=0.02, size=queries.shape).astype(np.float32))
+    hits = 0
+    for query in queries:
+        expected = set(np.argsort(-(exact @ query))[:k])
+        found = set(np.argsort(-(encoded @ query))[:k])
+        hits += len(expected & found)
+    return hits / (len(queries) * k)
+
+
+def report(matrix, k=10):
+    baseline = encoded_size(matrix[0], "array")
+    print(f"{len(matrix)} vectors of {matrix.shape[1]} dimensions")
+    print(f"{'encoding':<10}{'bytes/doc':>11}{'vs array':>10}{f'recall@{k}':>12}")
+    for encoding in EMBEDDING_ENCODINGS:
+        size = encoded_size(matrix[0], encoding)
+        recall = 1.0 if encoding == "array" else recall_at_k(matrix, encoding, k=k)
+        print(f"{encoding:<10}{size:>11}{baseline / size:>9.1f}x{recall:>12.4f}")
+
+
+def encoded_fields(vector, encoding, path):
+    value, scale = encode_vector(vector, encoding)
+    return {path: value, scale_field(path): scale}
+
+
+def migrate(collection, encoding, path="embedding", short_dimensions=0, batch_size=500):
+    from pymongo import UpdateOne
+
+    short_path = f"{path}_short"
+    updates = []
+    migrated = 0
+    for doc in collection.find({path: {"$exists": True}}, {path: 1, scale_field(path): 1}).batch_size(batch_size):
+        vector = decode_vector(doc[path], doc.get(scale_field(path)))
+        fields = encoded_fields(vector, encoding, path)
+        if short_dimensions:
+            fields.update(encoded_fields(shorten(vector, short_dimensions), encoding, short_path))
+        update = {"$set": {key: value for key, value in fields.items() if value is not None}}
+        unset = {key: "" for key, value in fields.items() if value is None}
+        if unset:
+            update["$unset"] = unset
+        updates.append(UpdateOne({"_id": doc["_id"]}, update))
+        if len(updates) == batch_size:
+            collection.bulk_write(updates, ordered=False)
+            migrated += len(updates)
+            updates = []
+            print(f"Migrated {migrated} documents")
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+        migrated += len(updates)
+    print(f"Migrated {migrated} documents to {encoding}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-encodes stored embeddings and reports size and recall.")
+    parser.add_argument("--collection", type=str, default="issues", help="Collection in the open_match DB.")
+    parser.add_argument("--path", type=str, default="embedding", help="Field holding the embedding.")
+    parser.add_argument("--encoding", choices=EMBEDDING_ENCODINGS, default="float32", help="Encoding to migrate to.")
+    parser.add_argument("--short-dimensions", type=int, default=0, help="Also store this many leading dimensions in <path>_short.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report sizes and recall on a sample.")
+    parser.add_argument("--sample", type=int, default=5000, help="Documents used for the report.")
+    parser.add_argument("--k", type=int, default=10, help="k for recall@k.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Report on this many random 1536 dimension vectors instead.")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        # Clustered like real embeddings, uniform random vectors make every neighbour a near tie
+        rng = np.random.default_rng(7)
+        centers = rng.normal(size=(64, 1536)).astype(np.float32)
+        matrix = centers[rng.integers(0, 64, args.synthetic)] + rng.normal(scale=0.6, size=(args.synthetic, 1536)).astype(np.float32)
+        report(matrix, k=args.k)
+    else:
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+
+        load_dotenv()
+        collection = MongoClient(os.environ.get("MONGODB_URI")).open_match[args.collection]
+        sample = collection.aggregate([
+            {"$match": {args.path: {"$exists": True}}},
+            {"$sample": {"size": args.sample}},
+            {"$project": {args.path: 1, scale_field(args.path): 1}},
+        ])
+        vectors = [decode_vector(doc[args.path], doc.get(scale_field(args.path))) for doc in sample]
+        if vectors:
+            report(np.stack(vectors), k=args.k)
+        if not args.dry_run:
+            migrate(collection, args.encoding, path=args.path, short_dimensions=args.short_dimensions)
@@ -0,0 +1,99 @@
+"""
+Recounts the label and language facets of issues_bot_gen from scratch.
+
+githubApp keeps issue_facets up to date with $inc deltas on every webhook, if one of those
+writes fails the counts drift. Run this to repair them, it is safe to run at any time.
+"""
+
+import argparse
+import os
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+MONGO_DB_URI = os.getenv("MONGO_DB_URI")
+client = MongoClient(MONGO_DB_URI)
+db = client.open_match
+issues_collection = db.issues_bot_gen
+facets_collection = db.issue_facets
+versions_collection = db.collection_versions
+
+# Keep in sync with FACET_FIELDS in githubApp/src/services/mongodb.py
+FACET_FIELDS = ("labels", "languages")
+
+
+def count_facets():
+    """
+    Counts every facet value over the whole issues collection.
+
+    Returns:
+    dict: facet _id -> facet document.
+    """
+    facets = {}
+    for field in FACET_FIELDS:
+        pipeline = [
+            {"$project": {"value": {"$setUnion": [{"$ifNull": [f"${field}", []]}, []]}}},
+            {"$unwind": "$value"},
+            {"$group": {"_id": "$value", "count": {"$sum": 1}}},
+        ]
+        for doc in issues_collection.aggregate(pipeline):
+            facet_id = f"{field}:{doc['_id']}"
+            facets[facet_id] = {"_id": facet_id, "field": field, "value": doc["_id"], "count": doc["count"]}
+    return facets
+
+
+def diff_facets(expected):
+    """
+    Compares the expected counts against what is stored in issue_facets.
+
+    Returns:
+    list: (facet _id, stored count, expected count) for every facet that drifted.
+    """
+    stored = {doc["_id"]: doc.get("count", 0) for doc in facets_collection.find({}, {"count": 1})}
+    drift = []
+    for facet_id in sorted(set(stored) | set(expected)):
+        expected_count = expected.get(facet_id, {}).get("count", 0)
+        if stored.get(facet_id, 0) != expected_count:
+            drift.append((facet_id, stored.get(facet_id, 0), expected_count))
+    return drift
+
+
+def rebuild_facets(facets):
+    """
+    Swaps issue_facets for a freshly counted collection and bumps the issues version so
+    IssueSearchAlgo drops its cached facets.
+    """
+    staging_collection = db.issue_facets_rebuild
+    staging_collection.drop()
+    if facets:
+        staging_collection.insert_many(list(facets.values()))
+        staging_collection.rename(facets_collection.name, dropTarget=True)
+    else:
+        facets_collection.delete_many({})
+    versions_collection.update_one(
+        {"_id": issues_collection.name},
+        {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+        upsert=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recounts the label and language facets of the issues collection."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report the facets that drifted, don't write anything.",
+    )
+    args = parser.parse_args()
+
+    expected = count_facets()
+    drift = diff_facets(expected)
+    for facet_id, stored_count, expected_count in drift:
+        print(f"{facet_id}: stored {stored_count}, expected {expected_count}")
+    print(f"{len(drift)} of {len(expected)} facets drifted")
+
+    if drift and not args.dry_run:
+        rebuild_facets(expected)
+        print("Rebuilt issue_facets")
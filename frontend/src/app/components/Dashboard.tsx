@@ -1,18 +1,16 @@
 'use client';
 
-import React, { useState, useRef, useEffect } from 'react';
+import React, { useState, useRef } from 'react';
 import Form, { ProfileFormValues } from './Form';
 import { IssueCard } from '../models/IssueCard';
 import IssueMatcher from './IssueMatcher';
-import { getMatchingIssueCards, getSearchIssueCards } from '../services/db';
+import { getMatchingIssueCards } from '../services/db';
 import IssueBoard from './IssueSearch';
-import { Issue } from '../models/Issues';
 
 const Dashboard: React.FC = () => {
   const [isLoading, setIsLoading] = useState<boolean>(false);
   const [isError, setIsError] = useState<boolean>(false);
   const [issues, setIssues] = useState<IssueCard[]>([]);
-  const [searchIssues, setSearchIssues] = useState<Issue[]>([]);
   const resultRef = useRef<HTMLElement | null>(null);
   const handleFormSubmit = async (data: ProfileFormValues) => {
     setIsLoading(true);
@@ -31,23 +29,6 @@ const Dashboard: React.FC = () => {
     }
   };
 
-  useEffect(() => {
-    const loadScreen = async () => {
-    try {
-      setIsLoading(true);
-      setIsError(false); // Reset error state before new request
-      const result = await getSearchIssueCards();
-      setSearchIssues(result);
-    } catch (error) {
-      setIsError(true); // Handle error if API call fails
-      alert(error);
-    } finally {
-      setIsLoading(false); // Stop loading state once the request is done
-    }
-  }
-  loadScreen();
-  }, []);
-
   const [selectedView, setSelectedView] = useState<'IssueSearch' | 'IssueMatching'>('IssueSearch');
 
   return (
@@ -90,7 +71,7 @@ const Dashboard: React.FC = () => {
         (<div>
           <h1 className="text-5xl font-bold text-center mt-10">Issue Search</h1>
           <div className="row-start-2">
-            <IssueBoard issues={searchIssues} isLoading={isLoading} isError={isError}></IssueBoard>
+            <IssueBoard></IssueBoard>
           </div>
         </div>)}
     </div>
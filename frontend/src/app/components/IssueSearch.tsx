@@ -1,52 +1,69 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { Issue } from "../models/Issues";
+import { getIssueFacets, getSearchIssuePage, IssueFacets } from "../services/db";
 
-type Props = {
-    issues: Issue[]; // List of issues passed as a prop
-    isLoading: boolean;
-    isError: boolean;
-};
+// Issues per request, the filters run in the search API so every page is already filtered
+const PAGE_SIZE = 30;
 
-const IssueBoard: React.FC<Props> = ({ issues,  isLoading, isError }) => {
+const IssueBoard: React.FC = () => {
     // State for filters and pagination
     const [filterLabels, setFilterLabels] = useState<string[]>([]);
     const [filterLanguages, setFilterLanguages] = useState<string[]>([]);
-    const [filteredIssues, setFilteredIssues] = useState<Issue[]>(issues);
-    const [currentPage, setCurrentPage] = useState(1); // current page number
-    const [totalPages, setTotalPages] = useState(1); // total number of pages
+    const [issues, setIssues] = useState<Issue[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [facets, setFacets] = useState<IssueFacets | null>(null);
+    const [isLoading, setIsLoading] = useState<boolean>(true);
+    const [isLoadingMore, setIsLoadingMore] = useState<boolean>(false);
+    const [isError, setIsError] = useState<boolean>(false);
+    // A response for filters that have changed since it was requested is ignored
+    const requestId = useRef(0);
 
-    // Update filteredIssues whenever filters change
     useEffect(() => {
-        setFilteredIssues(
-            issues.filter((issue) => {
-                const matchesLabels =
-                    filterLabels.length === 0 ||
-                    filterLabels.every((label) => issue.labels.includes(label));
-                const matchesLanguages =
-                    filterLanguages.length === 0 ||
-                    filterLanguages.every((lang) => issue.languages.includes(lang));
+        getIssueFacets().then(setFacets).catch(() => setFacets(null));
+    }, []);
 
-                return matchesLabels && matchesLanguages;
+    // Fetch the first page whenever filters change
+    useEffect(() => {
+        const id = ++requestId.current;
+        setIsLoading(true);
+        setIsError(false);
+        getSearchIssuePage({ labels: filterLabels, languages: filterLanguages, limit: PAGE_SIZE })
+            .then((page) => {
+                if (id !== requestId.current) return;
+                setIssues(page.results);
+                setNextCursor(page.next_cursor);
             })
-        );
-    }, [issues, filterLabels, filterLanguages]);
+            .catch(() => {
+                if (id === requestId.current) setIsError(true);
+            })
+            .finally(() => {
+                if (id === requestId.current) setIsLoading(false);
+            });
+    }, [filterLabels, filterLanguages]);
 
-    // Handle page change
-    const handlePageChange = (page: number) => {
-        setCurrentPage(page);
-        // Fetch paginated data here (e.g., make an API call to fetch issues for the selected page)
-        fetchIssues(page);
+    const handleLoadMore = async () => {
+        if (!nextCursor) return;
+        const id = requestId.current;
+        setIsLoadingMore(true);
+        try {
+            const page = await getSearchIssuePage({ labels: filterLabels, languages: filterLanguages, limit: PAGE_SIZE, cursor: nextCursor });
+            if (id !== requestId.current) return;
+            setIssues((loaded) => [...loaded, ...page.results]);
+            setNextCursor(page.next_cursor);
+        } catch (error) {
+            alert(error);
+        } finally {
+            setIsLoadingMore(false);
+        }
     };
 
-    const fetchIssues = async (page: number) => {
-        const limit = 20; // You can adjust this value based on your needs
-        const response = await fetch(`/api/issues?limit=${limit}&page=${page}`);
-        const data = await response.json();
-
-        // Update filtered issues based on the fetched data
-        setFilteredIssues(data.issues);
-        setTotalPages(data.totalPages); // Assuming backend returns the total number of pages
-    };
+    // All labels and languages when the facets API is configured, otherwise the ones of the loaded issues
+    const labelOptions = facets
+        ? facets.labels.map((facet) => facet.name)
+        : [...new Set([...filterLabels, ...issues.flatMap((issue) => issue.labels)])];
+    const languageOptions = facets
+        ? facets.languages.map((facet) => facet.name)
+        : [...new Set([...filterLanguages, ...issues.flatMap((issue) => issue.languages)])];
 
     // Handlers for filter changes
     const handleLabelChange = (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -82,7 +99,7 @@ const IssueBoard: React.FC<Props> = ({ issues,  isLoading, isError }) => {
         )
       }
     
-      if (isLoading) {
+      if (isLoading && issues.length === 0) {
         return (
       <div className="flex justify-center items-center">
       <div className="border-2 border-white rounded-lg text-center bg-black min-h-[800px] w-[900px] flex flex-col justify-center items-center p-6">
@@ -105,7 +122,7 @@ const IssueBoard: React.FC<Props> = ({ issues,  isLoading, isError }) => {
                     <div className="bg-gray-800 p-6 rounded-lg shadow-lg">
                         <h3 className="text-lg font-semibold mb-4 text-white">Labels</h3>
                         <div className="space-y-2">
-                            {[...new Set(issues.flatMap((issue) => issue.labels))].map((label) => (
+                            {labelOptions.map((label) => (
                                 <label
                                     key={label}
                                     className="flex items-center gap-3 text-sm text-gray-400 cursor-pointer hover:text-white transition"
@@ -127,7 +144,7 @@ const IssueBoard: React.FC<Props> = ({ issues,  isLoading, isError }) => {
                     <div className="bg-gray-800 p-6 rounded-lg shadow-lg">
                         <h3 className="text-lg font-semibold mb-4 text-white">Languages</h3>
                         <div className="space-y-2">
-                            {[...new Set(issues.flatMap((issue) => issue.languages))].map((lang) => (
+                            {languageOptions.map((lang) => (
                                 <label
                                     key={lang}
                                     className="flex items-center gap-3 text-sm text-gray-400 cursor-pointer hover:text-white transition"
@@ -151,8 +168,8 @@ const IssueBoard: React.FC<Props> = ({ issues,  isLoading, isError }) => {
             <div className="flex-grow p-4">
                 {/* Issues Display */}
                 <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-6">
-                    {filteredIssues.length > 0 ? (
-                        filteredIssues.map((issue, index) => (
+                    {issues.length > 0 ? (
+                        issues.map((issue, index) => (
                             <div
                                 key={issue.issue_number}
                                 className="p-4 mb-4 border rounded-lg shadow-md"
@@ -227,26 +244,18 @@ const IssueBoard: React.FC<Props> = ({ issues,  isLoading, isError }) => {
                     )}
                 </div>
 
-                {/* Pagination Controls */}
-                <div className="flex justify-center gap-4 mt-6">
-                    <button
-                        onClick={() => handlePageChange(currentPage - 1)}
-                        disabled={currentPage === 1}
-                        className="px-4 py-2 bg-blue-600 rounded-lg hover:bg-blue-500 disabled:bg-gray-600 transition-all"
-                    >
-                        Previous
-                    </button>
-                    <span className="text-lg font-semibold">
-                        Page {currentPage} of {totalPages}
-                    </span>
-                    <button
-                        onClick={() => handlePageChange(currentPage + 1)}
-                        disabled={currentPage === totalPages}
-                        className="px-4 py-2 bg-blue-600 rounded-lg hover:bg-blue-500 disabled:bg-gray-600 transition-all"
-                    >
-                        Next
-                    </button>
-                </div>
+                {/* Load more, the next page comes from the search API's cursor */}
+                {nextCursor && (
+                    <div className="flex justify-center mt-6">
+                        <button
+                            onClick={handleLoadMore}
+                            disabled={isLoadingMore}
+                            className="px-4 py-2 bg-blue-600 rounded-lg hover:bg-blue-500 disabled:bg-gray-600 transition-all"
+                        >
+                            {isLoadingMore ? "Loading..." : "Load more"}
+                        </button>
+                    </div>
+                )}
             </div>
         </div>
     );
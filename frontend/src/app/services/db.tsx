@@ -70,9 +70,39 @@ function fileToBase64(file: File): Promise<string> {
   });
 }
 
-export const getSearchIssueCards = async (): Promise<Issue[]> => {
+export interface IssueSearchFilters {
+  labels?: string[];
+  languages?: string[];
+  topics?: string[];
+  repos?: string[];
+  limit?: number;
+  cursor?: string | null;
+}
+
+export interface IssueSearchPage {
+  results: Issue[];
+  next_cursor: string | null;
+}
+
+function buildSearchQuery(filters: IssueSearchFilters): string {
+  const params = new URLSearchParams();
+  filters.labels?.forEach((label) => params.append('label', label));
+  filters.languages?.forEach((lang) => params.append('language', lang));
+  filters.topics?.forEach((topic) => params.append('topic', topic));
+  filters.repos?.forEach((repo) => params.append('repo', repo));
+  if (filters.limit) {
+    params.set('limit', String(filters.limit));
+  }
+  if (filters.cursor) {
+    params.set('cursor', filters.cursor);
+  }
+  const query = params.toString();
+  return query ? `?${query}` : '';
+}
+
+export const getSearchIssuePage = async (filters: IssueSearchFilters = {}): Promise<IssueSearchPage> => {
   // change to http://localhost:8080/ to test locally
-  const response = await fetch(`${process.env.NEXT_PUBLIC_ISSUES_SEARCH_API_URL}`, {
+  const response = await fetch(`${process.env.NEXT_PUBLIC_ISSUES_SEARCH_API_URL}${buildSearchQuery(filters)}`, {
     method: 'GET',
     headers: {
       'Content-Type': 'application/json',
@@ -96,6 +126,39 @@ export const getSearchIssueCards = async (): Promise<Issue[]> => {
 
   }
 
-  const data: Issue[] = jsonResponse.results; // Access 'results' field
-  return data;
-}
\ No newline at end of file
+  return {
+    results: jsonResponse.results,
+    next_cursor: jsonResponse.next_cursor ?? null,
+  };
+}
+
+export const getSearchIssueCards = async (filters: IssueSearchFilters = {}): Promise<Issue[]> => {
+  const page = await getSearchIssuePage(filters);
+  return page.results;
+}
+
+export interface IssueFacet {
+  name: string;
+  count: number;
+}
+
+export interface IssueFacets {
+  labels: IssueFacet[];
+  languages: IssueFacet[];
+}
+
+// Label and language counts over all issues, null when NEXT_PUBLIC_ISSUES_FACETS_API_URL is not set
+export const getIssueFacets = async (): Promise<IssueFacets | null> => {
+  if (!process.env.NEXT_PUBLIC_ISSUES_FACETS_API_URL) {
+    return null;
+  }
+  const response = await fetch(`${process.env.NEXT_PUBLIC_ISSUES_FACETS_API_URL}`, { method: 'GET' });
+  if (!response.ok) {
+    throw new Error(`HTTP error! Status: ${response.status}`);
+  }
+  const jsonResponse = await response.json();
+  return {
+    labels: jsonResponse.labels ?? [],
+    languages: jsonResponse.languages ?? [],
+  };
+}